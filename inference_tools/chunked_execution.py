@@ -0,0 +1,100 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Execution of queries over long lists of ids, split into batches ran concurrently
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, TypeVar, Sequence, Optional
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Below elastic search's default max_terms_count (65536) and max_result_window (10000)
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_WORKERS = 4
+
+
+def chunk_list(elements: Sequence[T], chunk_size: int) -> List[List[T]]:
+    """
+    Splits a list into consecutive chunks of at most chunk_size elements
+    @param elements: the list to split
+    @type elements: Sequence[T]
+    @param chunk_size: the maximum number of elements per chunk
+    @type chunk_size: int
+    @return: the chunks, in the order of the original list
+    @rtype: List[List[T]]
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Invalid chunk size {chunk_size}")
+
+    return [list(elements[i:i + chunk_size]) for i in range(0, len(elements), chunk_size)]
+
+
+def execute_chunked(
+        elements: Sequence[T],
+        fc: Callable[[List[T]], List[R]],
+        chunk_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        sort_key: Optional[Callable[[R], Any]] = None
+) -> List[R]:
+    """
+    Splits a list of elements (usually ids put in a terms query) into chunks, calls fc on each
+    chunk concurrently, and merges the results. If the list fits in a single chunk, fc is called
+    directly in the current thread.
+    @param elements: the elements to split
+    @type elements: Sequence[T]
+    @param fc: the function to call on each chunk, returning a list of results
+    @type fc: Callable[[List[T]], List[R]]
+    @param chunk_size: the maximum number of elements per chunk, DEFAULT_CHUNK_SIZE if unspecified
+    @type chunk_size: Optional[int]
+    @param max_workers: the maximum number of chunks being processed at the same time,
+    DEFAULT_MAX_WORKERS if unspecified
+    @type max_workers: Optional[int]
+    @param sort_key: an optional key to sort the merged results with. If unspecified,
+    results are merged in the order of the chunks
+    @type sort_key: Optional[Callable[[R], Any]]
+    @return: the merged results of all chunks
+    @rtype: List[R]
+    """
+    chunks = chunk_list(elements, chunk_size or DEFAULT_CHUNK_SIZE)
+
+    if len(chunks) <= 1:
+        results = [fc(chunks[0] if len(chunks) == 1 else [])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers or DEFAULT_MAX_WORKERS,
+                                                len(chunks))) as executor:
+            results = list(executor.map(fc, chunks))
+
+    merged = [r for chunk_result in results for r in chunk_result]
+
+    if sort_key is not None:
+        merged.sort(key=sort_key)
+
+    return merged
+
+
+def order_by(elements: Sequence[T], key: Callable[[R], T]) -> Callable[[R], int]:
+    """
+    Builds a sort key ordering results by the position of their key in a list of elements
+    @param elements: the elements whose order should be followed
+    @type elements: Sequence[T]
+    @param key: retrieves from a result the element it corresponds to
+    @type key: Callable[[R], T]
+    @return: the sort key to use in execute_chunked
+    @rtype: Callable[[R], int]
+    """
+    positions = dict((e, i) for i, e in reversed(list(enumerate(elements))))
+    return lambda r: positions.get(key(r), len(positions))
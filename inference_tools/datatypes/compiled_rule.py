@@ -0,0 +1,81 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Optional, Tuple, Type, Union
+
+from inference_tools.datatypes.parameter_specification import ParameterSpecification
+from inference_tools.datatypes.query import Query
+from inference_tools.datatypes.rule import Rule
+from inference_tools.source.source import Source
+
+
+class CompiledQuery:
+    """
+    A query along with the source class executing it, resolved once. The body of the query is
+    prepared by the source when the query is compiled
+    """
+    query: Query
+    source: Optional[Type[Source]]
+
+    def __init__(self, query: Query, source: Optional[Type[Source]]):
+        self.query = query
+        self.source = source
+
+    def __repr__(self):
+        return f"Compiled {self.query}"
+
+
+class CompiledQueryPipe:
+    head: CompiledQuery
+    rest: Union[CompiledQuery, 'CompiledQueryPipe']
+
+    def __init__(self, head: CompiledQuery, rest: Union[CompiledQuery, 'CompiledQueryPipe']):
+        self.head = head
+        self.rest = rest
+
+    def __repr__(self):
+        return f"Compiled QueryPipe: \n\tHead: {self.head} \n\tRest: {self.rest}"
+
+
+class CompiledRule:
+    """
+    A rule compiled once, at load time, into a plan that can be applied any number of times
+    without being parsed again. It should not be modified
+    """
+    rule: Rule
+    search_query: Union[CompiledQuery, CompiledQueryPipe]
+    premises: Optional[Tuple[CompiledQuery, ...]]
+    flattened_input_parameters: Tuple[ParameterSpecification, ...]
+
+    def __init__(
+            self, rule: Rule, search_query: Union[CompiledQuery, CompiledQueryPipe],
+            premises: Optional[Tuple[CompiledQuery, ...]],
+            flattened_input_parameters: Tuple[ParameterSpecification, ...]
+    ):
+        self.rule = rule
+        self.search_query = search_query
+        self.premises = premises
+        self.flattened_input_parameters = flattened_input_parameters
+
+    @property
+    def id(self) -> str:
+        """
+        @return: the id of the compiled rule
+        @rtype: str
+        """
+        return self.rule.id
+
+    def __repr__(self):
+        return f"Compiled {self.rule}"
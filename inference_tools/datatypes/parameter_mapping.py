@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import List
+
+
 class ParameterMapping:
     """
     When obtaining results from the execution of a query, the query results will be consumed.
@@ -22,10 +25,12 @@ class ParameterMapping:
     """
     parameter_name: str
     path: str
+    path_list: List[str]
 
     def __init__(self, obj):
         self.parameter_name = obj.get("parameterName", None)
         self.path = obj.get("path", None)
+        self.path_list = self.path.split(".") if self.path is not None else []
 
     def __repr__(self):
         return f"Parameter Name: {self.parameter_name} ; Path: {self.path}"
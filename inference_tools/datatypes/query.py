@@ -14,9 +14,10 @@
 # limitations under the License.
 
 from abc import ABC
-from typing import List, Optional, Dict, NewType, Sequence
+from typing import Any, List, Optional, Dict, NewType, Sequence
 
 from inference_tools.helper_functions import _enforce_list, _get_type
+from inference_tools.similarity.target_aggregation import TargetAggregation
 from inference_tools.type import QueryType, ObjectTypeStr, PremiseType
 from inference_tools.datatypes.parameter_mapping import ParameterMapping
 from inference_tools.datatypes.parameter_specification import ParameterSpecification
@@ -52,6 +53,7 @@ class Query(ABC):
     result_parameter_mapping: Optional[List[ParameterMapping]]
     query_configurations: Sequence[QueryConfiguration]
     description: Optional[str]
+    prepared_body: Optional[Any] = None  # Built once by the source executing the query
 
     def __init__(self, obj):
 
@@ -170,12 +172,19 @@ class SimilaritySearchQuery(Query):
     search_target_parameter: str
     result_filter: str
     query_configurations: List[SimilaritySearchQueryConfiguration]
+    target_aggregation: TargetAggregation  # When several search targets are provided
 
     def __init__(self, obj):
         super().__init__(obj)
         self.search_target_parameter = obj.get("searchTargetParameter", None)
         self.result_filter = obj.get("resultFilter", "")
 
+        tmp_ta = obj.get("targetAggregation", TargetAggregation.CENTROID.value)
+        try:
+            self.target_aggregation = TargetAggregation(tmp_ta)
+        except ValueError as e:
+            raise InvalidValueException(attribute="target aggregation", value=tmp_ta) from e
+
         tmp_qc = obj.get("queryConfiguration", None)
         if tmp_qc is None:
             raise IncompleteObjectException(
@@ -191,7 +200,9 @@ class SimilaritySearchQuery(Query):
         qc_str = f"Query configurations: {self.query_configurations}"
         result_filter_str = f"Result filter: {self.result_filter}"
         search_target_parameter_str = f"Search Target Parameter: {self.search_target_parameter}"
-        return "\n".join([query_super_str, qc_str, result_filter_str, search_target_parameter_str])
+        target_aggregation_str = f"Target Aggregation: {self.target_aggregation.value}"
+        return "\n".join([query_super_str, qc_str, result_filter_str, search_target_parameter_str,
+                          target_aggregation_str])
 
 
 def premise_factory(obj: Dict) -> Query:
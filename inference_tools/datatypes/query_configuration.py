@@ -22,6 +22,7 @@ from inference_tools.datatypes.view import View
 from inference_tools.type import ObjectTypeStr
 
 from inference_tools.datatypes.embedding_model_data_catalog import EmbeddingModelDataCatalog
+from inference_tools.datatypes.similarity.candidate_generation import CandidateGeneration
 from inference_tools.exceptions.exceptions import IncompleteObjectException, \
     SimilaritySearchException
 
@@ -79,6 +80,14 @@ class QueryConfiguration(ABC):
         """
         return f"{self.org}/{self.project}"
 
+    def get_view_id(self) -> Optional[str]:
+        """
+        Get the id of the view queries tied to the query configuration run against, if any
+        @return: the view id, None if queries run against the default view of the bucket
+        @rtype: Optional[str]
+        """
+        return None
+
 
 class ForgeQueryConfiguration(QueryConfiguration):
     def use_factory(
@@ -100,6 +109,9 @@ class SparqlQueryConfiguration(QueryConfiguration):
     def __repr__(self):
         return f"Sparql Query Configuration: {self.sparql_view}"
 
+    def get_view_id(self) -> Optional[str]:
+        return self.sparql_view.id if self.sparql_view is not None else None
+
     def use_factory(
             self,
             forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
@@ -123,6 +135,9 @@ class ElasticSearchQueryConfiguration(QueryConfiguration):
     def __repr__(self):
         return f"ES Query Configuration: {self.elastic_search_view}"
 
+    def get_view_id(self) -> Optional[str]:
+        return self.elastic_search_view.id if self.elastic_search_view is not None else None
+
     def use_factory(
             self,
             forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
@@ -142,6 +157,7 @@ class SimilaritySearchQueryConfiguration(QueryConfiguration):
     boosting_view: View
     statistics_view: View
     boosted: bool
+    candidate_generation: Optional[CandidateGeneration]
 
     def __init__(self, obj):
         super().__init__(obj)
@@ -155,6 +171,8 @@ class SimilaritySearchQueryConfiguration(QueryConfiguration):
         self.embedding_model_data_catalog = EmbeddingModelDataCatalog(tmp_em) \
             if tmp_em is not None else None
         self.boosted = obj.get("boosted", False)
+        tmp_cg = obj.get("candidateGeneration", None)
+        self.candidate_generation = CandidateGeneration(tmp_cg) if tmp_cg is not None else None
 
     def __repr__(self):
         sim_view_str = f"Similarity View: {self.similarity_view}"
@@ -164,8 +182,10 @@ class SimilaritySearchQueryConfiguration(QueryConfiguration):
         embedding_model_data_catalog_str = \
             f"Embedding Model Data Catalog: {self.embedding_model_data_catalog}"
 
+        candidate_generation_str = f"Candidate Generation: {self.candidate_generation}"
+
         return "\n".join([sim_view_str, boosted_str, boosting_view_str, stat_view_str,
-                          embedding_model_data_catalog_str])
+                          embedding_model_data_catalog_str, candidate_generation_str])
 
     def use_factory(
             self,
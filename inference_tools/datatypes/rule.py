@@ -13,7 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List, Union, Optional
+import threading
+from typing import Any, Callable, Dict, List, Union, Optional
 
 from inference_tools.datatypes.parameter_specification import ParameterSpecification
 from inference_tools.type import ObjectTypeStr, RuleType
@@ -27,19 +28,31 @@ from inference_tools.datatypes.query import query_factory, premise_factory, Quer
 
 
 class Rule:
-
+    """
+    A rule. A lazy rule only parses its header fields (id, name, description, types, target
+    resource type...) when it is built: its search query and premises are parsed, and the
+    formatting registered with on_parsed is applied, when one of them, or the flattened input
+    parameters, is first accessed.
+    """
     name: str
     description: str
-    search_query: Union[Query, QueryPipe]
-    premises: Optional[List[Query]]
     id: str
     context: str
     type: List[RuleType]
     target_resource_type: str
     nexus_link: Optional[str]
-    flattened_input_parameters: Optional[List[ParameterSpecification]] = None
 
-    def __init__(self, obj):
+    _search_query: Union[Query, QueryPipe]
+    _premises: Optional[List[Query]] = None
+    _flattened_input_parameters: Optional[List[ParameterSpecification]] = None
+    _unparsed: Dict[str, Any]
+    _parsed: bool = False
+    _parsing_thread: Optional[int] = None
+    _on_parsed: Optional[Callable[["Rule"], None]] = None
+
+    _parse_lock = threading.RLock()
+
+    def __init__(self, obj, lazy: bool = False):
         self.id = get_id_attribute(obj)
         self.name = obj.get("name", None)
         self.description = obj.get("description", None)
@@ -50,19 +63,126 @@ class Rule:
         self.nexus_link = obj.get("nexus_link", None)
 
         tmp_premise = obj.get("premise", None)
-        self.premises = [premise_factory(obj_i) for obj_i in _enforce_list(tmp_premise)] \
+        tmp_sq = obj.get("searchQuery", None)
+
+        self._unparsed = {"premise": tmp_premise, "searchQuery": tmp_sq}
+
+        if not lazy:
+            self._parse()
+            self._unparsed = {}
+            self._parsed = True
+        elif tmp_sq is None:
+            raise IncompleteObjectException(
+                name=self.name, attribute="searchQuery", object_type=ObjectTypeStr.RULE
+            )
+
+    def _parse(self):
+        tmp_premise = self._unparsed["premise"]
+        self._premises = [premise_factory(obj_i) for obj_i in _enforce_list(tmp_premise)] \
             if tmp_premise is not None else None
 
-        tmp_sq = obj.get("searchQuery", None)
+        tmp_sq = self._unparsed["searchQuery"]
         if tmp_sq is None:
             raise IncompleteObjectException(
                 name=self.name, attribute="searchQuery", object_type=ObjectTypeStr.RULE
             )
 
-        self.search_query = query_factory(tmp_sq) \
+        self._search_query = query_factory(tmp_sq) \
             if get_type_attribute(tmp_sq) != "QueryPipe" else \
             QueryPipe(tmp_sq)
 
+    def is_parsed(self) -> bool:
+        """
+        @return: whether the search query and premises of the rule have been parsed, and the
+        formatting registered with on_parsed applied
+        @rtype: bool
+        """
+        return self._parsed
+
+    def materialize(self):
+        """
+        Parses the search query and premises of a lazy rule, if it has not been done yet, and
+        applies the formatting registered with on_parsed. Other threads accessing the rule
+        meanwhile wait for both to be done
+        """
+        # The flag is only set once the rule is formatted
+        if self._parsed:
+            return
+
+        with Rule._parse_lock:
+            # The formatting being applied by this thread accesses the parsed fields
+            if self._parsed or self._parsing_thread == threading.get_ident():
+                return
+
+            self._parsing_thread = threading.get_ident()
+            try:
+                self._parse()
+
+                if self._on_parsed is not None:
+                    self._on_parsed(self)
+                    self._on_parsed = None
+
+                self._unparsed = {}
+                self._parsed = True
+            finally:
+                self._parsing_thread = None
+
+    def on_parsed(self, callback: Callable[["Rule"], None]):
+        """
+        Applies a formatting to the rule once its search query and premises are parsed: right
+        away for a rule that is not lazy, or that has been parsed already, on first access of
+        its parsed fields otherwise
+        @param callback: the formatting to apply, modifying the rule
+        @type callback: Callable[[Rule], None]
+        """
+        with Rule._parse_lock:
+            if self._parsed:
+                callback(self)
+            else:
+                self._on_parsed = callback
+
+    @property
+    def search_query(self) -> Union[Query, QueryPipe]:
+        """
+        @return: the search query of the rule, parsed on first access for a lazy rule
+        @rtype: Union[Query, QueryPipe]
+        """
+        self.materialize()
+        return self._search_query
+
+    @search_query.setter
+    def search_query(self, value: Union[Query, QueryPipe]):
+        self.materialize()
+        self._search_query = value
+
+    @property
+    def premises(self) -> Optional[List[Query]]:
+        """
+        @return: the premises of the rule, parsed on first access for a lazy rule
+        @rtype: Optional[List[Query]]
+        """
+        self.materialize()
+        return self._premises
+
+    @premises.setter
+    def premises(self, value: Optional[List[Query]]):
+        self.materialize()
+        self._premises = value
+
+    @property
+    def flattened_input_parameters(self) -> Optional[List[ParameterSpecification]]:
+        """
+        @return: the input parameters of the search query of the rule, once formatted
+        @rtype: Optional[List[ParameterSpecification]]
+        """
+        self.materialize()
+        return self._flattened_input_parameters
+
+    @flattened_input_parameters.setter
+    def flattened_input_parameters(self, value: Optional[List[ParameterSpecification]]):
+        self.materialize()
+        self._flattened_input_parameters = value
+
     def __repr__(self):
         id_str = f"Id: {self.id}"
         name_str = f"Name: {self.name}"
@@ -78,3 +198,19 @@ class Rule:
             "Rule", id_str, name_str, desc_str, type_str, target_str, nexus_link, context_str,
             premises_str, search_query_str
         ]) + "\n"
+
+
+class PartialRule(Rule):
+    """
+    A view of a parsed rule with a different search query, usually restricted to some of the
+    rule's query configurations. All other attributes are shared with the parsed rule, and
+    should not be modified
+    """
+    rule: Rule
+
+    def __init__(self, rule: Rule, search_query: Union[Query, QueryPipe]):
+        # pylint: disable=super-init-not-called
+        rule.materialize()
+        self.__dict__.update(rule.__dict__)
+        self.rule = rule
+        self.search_query = search_query
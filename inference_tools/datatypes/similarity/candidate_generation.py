@@ -0,0 +1,51 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict
+
+from inference_tools.exceptions.malformed_rule import MalformedSimilaritySearchQueryException
+from inference_tools.similarity.formula import Formula
+
+
+class CandidateGeneration:
+    """
+    Configuration of the first stage of a two-stage neighbor search: a cheap formula is used to
+    retrieve factor * k candidates within the whole population, which are then rescored with the
+    exact formula of the embedding model in order to keep the top k.
+    The cheap formula is computed on the same embedding field as the exact formula, therefore
+    this requires the embeddings to be indexed as dense vectors.
+    """
+    formula: Formula
+    factor: int
+
+    DEFAULT_FACTOR = 10
+
+    def __init__(self, obj: Dict):
+        try:
+            self.formula = Formula(obj.get("formula", Formula.COSINE.value))
+        except ValueError as e:
+            raise MalformedSimilaritySearchQueryException(
+                f"Invalid candidate generation formula {obj.get('formula')}"
+            ) from e
+
+        self.factor = obj.get("factor", CandidateGeneration.DEFAULT_FACTOR)
+
+        if not isinstance(self.factor, int) or self.factor < 1:
+            raise MalformedSimilaritySearchQueryException(
+                f"Invalid candidate generation factor {self.factor}"
+            )
+
+    def __repr__(self):
+        return f"Formula: {self.formula.value} ; Factor: {self.factor}"
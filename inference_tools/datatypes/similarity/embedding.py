@@ -13,9 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+from typing import List, Optional, Union
 
 from inference_tools.helper_functions import get_id_attribute
+from inference_tools.similarity.target_aggregation import (
+    TargetAggregation,
+    Vector,
+    compute_centroid
+)
 
 
 class Embedding:
@@ -27,3 +32,51 @@ class Embedding:
         self.id = get_id_attribute(obj)
         self.vector = obj["embedding"]
         self.derivation_id = obj["derivation"]
+
+
+class EmbeddingSet:
+    """
+    The embeddings of several search targets, whose neighbors are searched for together
+    """
+    embeddings: List[Embedding]
+    aggregation: TargetAggregation
+
+    def __init__(self, embeddings: List[Embedding], aggregation: TargetAggregation):
+        self.embeddings = embeddings
+        self.aggregation = aggregation
+
+    @property
+    def id(self) -> List[str]:
+        """
+        @return: the ids of the embeddings, excluded from the neighbors
+        @rtype: List[str]
+        """
+        return [e.id for e in self.embeddings]
+
+    @property
+    def derivation_id(self) -> List[str]:
+        """
+        @return: the ids of the search targets
+        @rtype: List[str]
+        """
+        return [e.derivation_id for e in self.embeddings]
+
+    @property
+    def vector(self) -> Union[Vector, List]:
+        """
+        @return: the centroid of the embeddings if the aggregation is centroid, else the vectors
+        of all embeddings
+        @rtype: Union[Vector, List]
+        """
+        if self.aggregation == TargetAggregation.CENTROID:
+            return compute_centroid([e.vector for e in self.embeddings])
+        return [e.vector for e in self.embeddings]
+
+    @property
+    def score_aggregation(self) -> Optional[TargetAggregation]:
+        """
+        @return: how scores with each embedding should be aggregated in the neighbor search, None
+        if the search is ran with a single vector
+        @rtype: Optional[TargetAggregation]
+        """
+        return None if self.aggregation == TargetAggregation.CENTROID else self.aggregation
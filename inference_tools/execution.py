@@ -13,10 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Dict, Callable, Optional, Union, List, Type
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Callable, Optional, Union, List, Type, Tuple
 
 from kgforge.core import KnowledgeGraphForge, Resource
 
+from inference_tools.datatypes.compiled_rule import CompiledQuery, CompiledQueryPipe, CompiledRule
 from inference_tools.datatypes.parameter_mapping import ParameterMapping
 from inference_tools.datatypes.query import Query, SimilaritySearchQuery
 from inference_tools.datatypes.query_configuration import QueryConfiguration
@@ -35,12 +38,16 @@ from inference_tools.exceptions.malformed_rule import InvalidParameterSpecificat
 from inference_tools.exceptions.premise import IrrelevantPremiseParametersException
 from inference_tools.exceptions.premise import UnsupportedPremiseCaseException, \
     FailedPremiseException, MalformedPremiseException
-from inference_tools.helper_functions import _follow_path, _enforce_list
+from inference_tools.helper_functions import _follow_split_path, _enforce_list
+from inference_tools.nexus_utils.forge_session_pool import pooled
+from inference_tools.premise_cache import PremiseCache
 from inference_tools.premise_execution import PremiseExecution
+from inference_tools.premise_scheduler import PremiseScheduler
 from inference_tools.similarity.main import execute_similarity_query
 from inference_tools.source.source import DEFAULT_LIMIT, Source
 from inference_tools.type import QueryType, PremiseType
-from inference_tools.utils import _build_parameter_map, format_parameters
+from inference_tools.utils import _build_parameter_map, format_parameters, \
+    get_search_query_parameters
 
 
 sources: Dict[Union[QueryType, PremiseType], Type[Source]] = {
@@ -53,6 +60,59 @@ sources: Dict[Union[QueryType, PremiseType], Type[Source]] = {
 }
 
 
+def compile_query(query: Union[Query, QueryPipe]) -> Union[CompiledQuery, CompiledQueryPipe]:
+    """
+    Resolves the source executing a query, or each query of a query pipe, and has it prepare the
+    body of the query
+    @param query: the query or query pipe to compile
+    @type query: Union[Query, QueryPipe]
+    @return: the compiled query or query pipe
+    @rtype: Union[CompiledQuery, CompiledQueryPipe]
+    """
+    def _compile(query_object: Query) -> CompiledQuery:
+        source: Optional[Type[Source]] = sources.get(query_object.type, None)
+        if source:
+            source.prepare(query_object)
+        return CompiledQuery(query=query_object, source=source)
+
+    if isinstance(query, QueryPipe):
+        return CompiledQueryPipe(head=_compile(query.head), rest=compile_query(query.rest))
+
+    return _compile(query)
+
+
+def compile_rule(rule: Union[Dict, Rule]) -> CompiledRule:
+    """
+    Compiles a rule once, at load time, into a plan that apply_rule can use any number of times:
+    the rule is parsed, the source of each of its queries resolved, and their bodies prepared.
+    @param rule: JSON-representation of a rule, or a parsed rule
+    @type rule: Union[Dict, Rule]
+    @return: the compiled rule
+    @rtype: CompiledRule
+    """
+    rule_object = rule if isinstance(rule, Rule) else Rule(rule)
+
+    premises = tuple(compile_query(premise) for premise in rule_object.premises) \
+        if rule_object.premises is not None else None
+
+    flattened_input_parameters = rule_object.flattened_input_parameters \
+        if rule_object.flattened_input_parameters is not None \
+        else list(get_search_query_parameters(rule_object).values())
+
+    return CompiledRule(
+        rule=rule_object,
+        search_query=compile_query(rule_object.search_query),
+        premises=premises,  # type: ignore
+        flattened_input_parameters=tuple(flattened_input_parameters)
+    )
+
+
+def _resolve(query: Union[Query, CompiledQuery]) -> Tuple[Query, Optional[Type[Source]]]:
+    if isinstance(query, CompiledQuery):
+        return query.query, query.source
+    return query, sources.get(query.type, None)
+
+
 def get_limit(parameter_values: Optional[Dict]):
     """
     Look into optionally user-provided parameter values for max number of results
@@ -71,7 +131,7 @@ def get_limit(parameter_values: Optional[Dict]):
 
 def execute_query_object(
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
-        query: Query,
+        query: Union[Query, CompiledQuery],
         parameter_values: Optional[Dict],
         last_query=False,
         debug=False,
@@ -83,8 +143,8 @@ def execute_query_object(
     @param forge_factory:  A function that takes as an input the name of the organization and
     the project, and returns a forge session.
     @type forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge]
-    @param query: JSON-representation of a query
-    @type query: Query
+    @param query: JSON-representation of a query, or the query compiled
+    @type query: Union[Query, CompiledQuery]
     @param parameter_values:
     @type parameter_values: Optional[Dict]
     @param last_query:
@@ -97,9 +157,11 @@ def execute_query_object(
     @rtype: List[Dict]
     """
 
+    forge_factory = pooled(forge_factory)
+
     limit = get_limit(parameter_values)
 
-    source: Optional[Type[Source]] = sources.get(query.type, None)
+    query, source = _resolve(query)
 
     if source:
 
@@ -162,9 +224,12 @@ def execute_query_object(
 
 def apply_rule(
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
-        rule: Dict,
+        rule: Union[Dict, CompiledRule],
         parameter_values: Dict,
-        premise_check: bool = True, debug: bool = False, use_resources: bool = True
+        premise_check: bool = True, debug: bool = False, use_resources: bool = True,
+        premise_workers: Optional[int] = None,
+        premise_scheduler: Optional[PremiseScheduler] = None,
+        premise_cache: Optional[PremiseCache] = None
 ) -> List[Dict]:
     """
     Apply a rule given the input parameters.
@@ -174,8 +239,8 @@ def apply_rule(
     @param forge_factory: A function that takes as an input the name of the organization and
     the project, and returns a forge session.
     @type forge_factory:  Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge]
-    @param rule: JSON-representation of a rule
-    @type rule: Dict
+    @param rule: JSON-representation of a rule, or the rule compiled with compile_rule
+    @type rule: Union[Dict, CompiledRule]
     @param parameter_values: Parameter dictionary to use in premises and search queries.
     @type parameter_values: Dict
     @param premise_check:
@@ -184,16 +249,28 @@ def apply_rule(
     @type debug: bool
     @param use_resources:
     @type use_resources: bool
+    @param premise_workers: if specified, the premises are checked concurrently by at most this
+    many threads, see check_premises
+    @type premise_workers: Optional[int]
+    @param premise_scheduler: if specified, records the premise executions and orders the
+    premises, see check_premises
+    @type premise_scheduler: Optional[PremiseScheduler]
+    @param premise_cache: if specified, the outcomes of the premises are taken from, and stored
+    in, this cache
+    @type premise_cache: Optional[PremiseCache]
     @return: The list of inference resources' ids, if any
     @rtype: List[Dict]
     """
 
-    rule_object = Rule(rule)
+    forge_factory = pooled(forge_factory)
+
+    rule_object = rule if isinstance(rule, CompiledRule) else Rule(rule)
 
     if premise_check:
         check_premises(
             forge_factory=forge_factory, rule=rule_object,
-            parameter_values=parameter_values, debug=debug
+            parameter_values=parameter_values, debug=debug, max_workers=premise_workers,
+            scheduler=premise_scheduler, cache=premise_cache
         )
 
     return execute_query_pipe(
@@ -217,7 +294,7 @@ def process_result_parameter_mapping(
     @rtype: Dict[str, List]
     """
     return dict(
-        (mapping.parameter_name, [_follow_path(el, mapping.path) for el in result])
+        (mapping.parameter_name, [_follow_split_path(el, mapping.path_list) for el in result])
         for mapping in result_parameter_mapping
     )
 
@@ -258,8 +335,10 @@ def combine_parameters(
 
 def execute_query_pipe(
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
-        head: Union[Query, QueryPipe], parameter_values: Optional[Dict],
-        rest: Optional[Union[Query, QueryPipe]], debug: bool = False, use_resources: bool = False
+        head: Union[Query, QueryPipe, CompiledQuery, CompiledQueryPipe],
+        parameter_values: Optional[Dict],
+        rest: Optional[Union[Query, QueryPipe, CompiledQuery, CompiledQueryPipe]],
+        debug: bool = False, use_resources: bool = False
 ):
     """
     Execute a query pipe given the input parameters.
@@ -270,12 +349,12 @@ def execute_query_pipe(
     @param forge_factory: A function that takes as an input the name of the organization and
         the project, and returns a forge session.
     @type forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge]
-    @param head: JSON-representation of a head query
-    @type head: Dict
+    @param head: JSON-representation of a head query, or the head query compiled
+    @type head: Union[Query, QueryPipe, CompiledQuery, CompiledQueryPipe]
     @param parameter_values: Input parameter dictionary to use in the queries.
     @type parameter_values: Optional[Dict]
-    @param rest:JSON-representation of the remaining query or query pipe
-    @type rest: Optional[Dict]
+    @param rest:JSON-representation of the remaining query or query pipe, or them compiled
+    @type rest: Optional[Union[Query, QueryPipe, CompiledQuery, CompiledQueryPipe]]
     @param debug:   Whether to run queries in debug mode
     @type debug: bool
     @param use_resources:
@@ -284,9 +363,11 @@ def execute_query_pipe(
     @rtype:
     """
 
+    forge_factory = pooled(forge_factory)
+
     def _check(el, params, last_q):
 
-        if isinstance(el, QueryPipe):
+        if isinstance(el, (QueryPipe, CompiledQueryPipe)):
             return execute_query_pipe(
                 forge_factory=forge_factory, parameter_values=params, debug=debug,
                 head=el.head, rest=el.rest, use_resources=use_resources
@@ -303,6 +384,9 @@ def execute_query_pipe(
     if last_query:
         return result
 
+    if isinstance(head, CompiledQuery):
+        head = head.query
+
     if not isinstance(head, Query):
         raise InferenceToolsException("Unexpected case: combine parameters called on QueryPipe")
 
@@ -316,54 +400,111 @@ def execute_query_pipe(
 
 def check_premises(
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
-        rule: Rule,
-        parameter_values: Optional[Dict], debug: bool = False
+        rule: Union[Rule, CompiledRule],
+        parameter_values: Optional[Dict], debug: bool = False,
+        max_workers: Optional[int] = None,
+        scheduler: Optional[PremiseScheduler] = None,
+        cache: Optional[PremiseCache] = None
 ):
     """
 
     @param forge_factory: A function that takes as an input the name of the organization and
         the project, and returns a forge session.
     @type forge_factory:
-    @param rule: JSON-representation of a rule
-    @type rule: Dict
+    @param rule: the rule, or the rule compiled
+    @type rule: Union[Rule, CompiledRule]
     @param parameter_values: Input parameters the premises will check
     @type parameter_values: Optional[Dict]
     @param debug: Whether running the premise queries is in debug mode
     @type debug: bool
+    @param max_workers: if specified, the premises are all submitted at once, running in at most
+    this many threads. As soon as one of them fails or raises, the premises that have not started
+    are cancelled and the outcome is returned, while the ones already running complete in the
+    background. Else they run one after the other
+    @type max_workers: Optional[int]
+    @param scheduler: if specified, the latency and outcome of the premises that are run, and not
+    taken from the cache, are recorded by the scheduler, which orders them so that premises that
+    are cheap and often fail run first
+    @type scheduler: Optional[PremiseScheduler]
+    @param cache: if specified, premises whose formatted query has been run against the same
+    view within the time to live of the cache are not run again, their outcome is taken from it
+    @type cache: Optional[PremiseCache]
     @return:
     @raise PremiseException
     @rtype: bool
     """
 
+    forge_factory = pooled(forge_factory)
+
     if rule.premises is None:
         return True
 
-    flags = []
+    def _evaluate(premise_or_compiled: Union[Query, CompiledQuery]) -> PremiseExecution:
+        flag = _evaluate_premise(
+            forge_factory, premise_or_compiled, parameter_values, debug, cache, scheduler
+        )
+        if flag == PremiseExecution.FAIL:
+            raise FailedPremiseException(description=_resolve(premise_or_compiled)[0].description)
+        return flag
 
-    for premise in rule.premises:
+    premises = scheduler.order(rule.premises) if scheduler is not None else rule.premises
 
-        config: QueryConfiguration = premise.query_configurations[0]
-        forge = config.use_factory(forge_factory)
+    if max_workers is None or len(premises) < 2:
+        flags = [_evaluate(premise) for premise in premises]
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures: List[Future] = []
+        try:
+            futures = [executor.submit(_evaluate, premise) for premise in premises]
+            # Raises as soon as a premise fails
+            for future in as_completed(futures):
+                future.result()
+            flags = [future.result() for future in futures]
+        finally:
+            # shutdown's cancel_futures is only available from python 3.9
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    return _aggregate_premise_flags(flags, parameter_values)
+
+
+def _evaluate_premise(
+        forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
+        premise_or_compiled: Union[Query, CompiledQuery],
+        parameter_values: Optional[Dict], debug: bool, cache: Optional[PremiseCache] = None,
+        scheduler: Optional[PremiseScheduler] = None
+) -> PremiseExecution:
+    """
+    Runs a premise against input parameters. Only the runs of the premise are recorded by the
+    scheduler, not the outcomes taken from the cache
+    @return: the outcome of the premise, MISSING_PARAMETER if the input parameters lack
+    some of the premise's parameters
+    @rtype: PremiseExecution
+    """
+    premise, source = _resolve(premise_or_compiled)
 
-        if len(premise.parameter_specifications) > 0 and parameter_values is not None:
-            try:
-                current_parameters = _build_parameter_map(
-                    forge, premise.parameter_specifications, parameter_values, premise.type
-                )
-            except MissingPremiseParameterValue:
-                flags.append(PremiseExecution.MISSING_PARAMETER)
-                continue
-            except InvalidParameterSpecificationException as e2:
-                raise MalformedPremiseException(e2.message) from e2
-                # TODO invalid premise, independently from input params
-        else:
-            current_parameters = {}
+    config: QueryConfiguration = premise.query_configurations[0]
+    forge = config.use_factory(forge_factory)
 
-        source: Optional[Type[Source]] = sources.get(premise.type, None)
+    if len(premise.parameter_specifications) > 0 and parameter_values is not None:
+        try:
+            current_parameters = _build_parameter_map(
+                forge, premise.parameter_specifications, parameter_values, premise.type
+            )
+        except MissingPremiseParameterValue:
+            return PremiseExecution.MISSING_PARAMETER
+        except InvalidParameterSpecificationException as e2:
+            raise MalformedPremiseException(e2.message) from e2
+            # TODO invalid premise, independently from input params
+    else:
+        current_parameters = {}
 
-        if not source:
-            raise UnsupportedTypeException(premise.type.value, "premise type")
+    if not source:
+        raise UnsupportedTypeException(premise.type.value, "premise type")
 
+    def _check() -> PremiseExecution:
+        start = time.perf_counter()
         flag = source.check_premise(
             forge=forge,
             premise=premise,
@@ -371,12 +512,30 @@ def check_premises(
             config=config,
             debug=debug
         )
+        if scheduler is not None:
+            scheduler.record(premise_or_compiled, flag, time.perf_counter() - start)
+        return flag
 
-        flags.append(flag)
+    if cache is None:
+        return _check()
+
+    key = (
+        premise.type.value, config.get_bucket(), config.get_view_id(),
+        source.premise_key(premise, current_parameters)
+    )
+
+    return cache.get_or_evaluate(key, _check)
 
-        if flag == PremiseExecution.FAIL:
-            raise FailedPremiseException(description=premise.description)
 
+def _aggregate_premise_flags(
+        flags: List[PremiseExecution], parameter_values: Optional[Dict]
+) -> bool:
+    """
+    Aggregates the outcomes of the premises of a rule, none of which has failed
+    @return: True if the rule's premises are satisfied
+    @raise PremiseException
+    @rtype: bool
+    """
     if all(flag == PremiseExecution.SUCCESS for flag in flags):
         # All premises are successful
         return True
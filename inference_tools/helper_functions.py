@@ -16,7 +16,7 @@
 """
 Helper functions
 """
-from typing import Dict, Type
+from typing import Dict, List, Type
 
 from inference_tools.type import ObjectTypeStr, ObjectType
 
@@ -61,8 +61,12 @@ def get_id_attribute(obj) -> str:
 
 def _follow_path(json_resource: Dict, path: str):
     """Follow a path in a JSON-resource."""
+    return _follow_split_path(json_resource, path.split("."))
+
+
+def _follow_split_path(json_resource: Dict, path_list: List[str]):
+    """Follow a path in a JSON-resource, already split into its elements."""
     value = json_resource
-    path_list = path.split(".")
 
     for el in path_list:
         if el not in value:
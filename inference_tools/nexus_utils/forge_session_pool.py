@@ -0,0 +1,163 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pool of forge sessions, reused across the steps of rule execution
+"""
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.nexus_utils.forge_utils import ForgeUtils
+
+ForgeFactory = Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge]
+
+SessionKey = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def _token_expiry(forge: KnowledgeGraphForge) -> Optional[float]:
+    """
+    @return: the expiration time of the token of a forge session, read from the exp claim of the
+    JWT, None if it cannot be read
+    @rtype: Optional[float]
+    """
+    try:
+        payload = ForgeUtils.get_token(forge).split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ForgeSessionPool:
+    """
+    A forge factory lending the forge sessions built by another forge factory, keyed by
+    (org, project, elastic search view, sparql view). The least recently used sessions are
+    evicted when the pool is full, and sessions whose token expires within expiry_margin seconds
+    are built again. A session can be lent to several threads at once, as forge sessions are not
+    modified by the execution of rules.
+    """
+    forge_factory: ForgeFactory
+    max_size: int
+    expiry_margin: float
+    sessions: OrderedDict
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    def __init__(self, forge_factory: ForgeFactory, max_size: int = 32, expiry_margin: float = 60):
+        self.forge_factory = forge_factory
+        self.max_size = max_size
+        self.expiry_margin = expiry_margin
+        self.sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def __call__(
+            self, org: str, project: str, es_view: Optional[str] = None,
+            sparql_view: Optional[str] = None
+    ) -> KnowledgeGraphForge:
+        key: SessionKey = (org, project, es_view, sparql_view)
+
+        with self._lock:
+            entry = self.sessions.get(key, None)
+            if entry is not None:
+                forge, expiry = entry
+                if expiry is None or expiry - self.expiry_margin > time.time():
+                    self.sessions.move_to_end(key)
+                    self.hits += 1
+                    return forge
+
+                del self.sessions[key]
+                self.expirations += 1
+
+            self.misses += 1
+
+        # Built outside the lock, not to hold back the sessions of other keys
+        forge = self.forge_factory(org, project, es_view, sparql_view)
+        expiry = _token_expiry(forge)
+
+        with self._lock:
+            self.sessions[key] = (forge, expiry)
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_size:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+
+        return forge
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        @return: the number of hits, misses, evictions and expirations of the pool, and its size
+        @rtype: Dict[str, int]
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self.sessions)
+            }
+
+    def clear(self):
+        """
+        Removes all the sessions of the pool
+        """
+        with self._lock:
+            self.sessions.clear()
+
+
+# Pools of the most recently used forge factories
+MAX_POOLED_FACTORIES = 16
+
+_pools: OrderedDict = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def pooled(forge_factory: Union[ForgeFactory, ForgeSessionPool]) -> ForgeSessionPool:
+    """
+    Gets the session pool of a forge factory, which is created on first use. The pools of the
+    MAX_POOLED_FACTORIES most recently used forge factories are kept. A session pool is returned
+    as is.
+    @param forge_factory: the forge factory
+    @type forge_factory: Union[ForgeFactory, ForgeSessionPool]
+    @return: the session pool of the forge factory
+    @rtype: ForgeSessionPool
+    """
+    if isinstance(forge_factory, ForgeSessionPool):
+        return forge_factory
+
+    with _pools_lock:
+        pool = _pools.get(forge_factory, None)
+
+        if pool is None:
+            pool = ForgeSessionPool(forge_factory)
+            _pools[forge_factory] = pool
+            while len(_pools) > MAX_POOLED_FACTORIES:
+                _pools.popitem(last=False)
+        else:
+            _pools.move_to_end(forge_factory)
+
+        return pool
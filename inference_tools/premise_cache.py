@@ -0,0 +1,144 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cache of the outcomes of premises, shared across rules and calls
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from inference_tools.premise_execution import PremiseExecution
+
+# (source type, bucket, view, formatted query text)
+PremiseCacheKey = Tuple[str, str, Optional[str], str]
+
+
+class PremiseCache:
+    """
+    Outcomes of premise executions, keyed by the source type, bucket and view the premise runs
+    against, and the text of the premise query, formatted with the parameter values. Outcomes
+    expire after a time to live, and the least recently used ones are evicted when the cache is
+    full. A premise being evaluated is not evaluated again by concurrent callers, who wait for
+    its outcome instead.
+    """
+    ttl: float
+    max_size: int
+    entries: OrderedDict
+    hits: int
+    misses: int
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[PremiseCacheKey, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: PremiseCacheKey) -> Optional[PremiseExecution]:
+        """
+        @param key: the key of the premise
+        @type key: PremiseCacheKey
+        @return: the outcome of the premise, None if it is not cached or has expired
+        @rtype: Optional[PremiseExecution]
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: PremiseCacheKey) -> Optional[PremiseExecution]:
+        entry = self.entries.get(key, None)
+        if entry is None:
+            return None
+
+        outcome, expires_at = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return outcome
+
+    def put(self, key: PremiseCacheKey, outcome: PremiseExecution):
+        """
+        Caches the outcome of a premise
+        @param key: the key of the premise
+        @type key: PremiseCacheKey
+        @param outcome: the outcome of the premise
+        @type outcome: PremiseExecution
+        """
+        with self._lock:
+            self._put(key, outcome)
+
+    def _put(self, key: PremiseCacheKey, outcome: PremiseExecution):
+        self.entries[key] = (outcome, time.time() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_or_evaluate(
+            self, key: PremiseCacheKey, evaluate: Callable[[], PremiseExecution]
+    ) -> PremiseExecution:
+        """
+        Gets the outcome of a premise from the cache, evaluating and caching it if it is not
+        cached. Errors raised by the evaluation are not cached
+        @param key: the key of the premise
+        @type key: PremiseCacheKey
+        @param evaluate: runs the premise
+        @type evaluate: Callable[[], PremiseExecution]
+        @return: the outcome of the premise
+        @rtype: PremiseExecution
+        """
+        with self._lock:
+            outcome = self._get(key)
+            if outcome is not None:
+                self.hits += 1
+                return outcome
+
+            pending = self._pending.get(key, None)
+            if pending is None:
+                self.misses += 1
+                future: Future = Future()
+                self._pending[key] = future
+            else:
+                self.hits += 1
+
+        if pending is not None:
+            return pending.result()
+
+        try:
+            outcome = evaluate()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._put(key, outcome)
+            del self._pending[key]
+
+        future.set_result(outcome)
+        return outcome
+
+    def clear(self):
+        """
+        Removes all the outcomes of the cache
+        """
+        with self._lock:
+            self.entries.clear()
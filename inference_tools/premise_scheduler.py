@@ -0,0 +1,125 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Ordering of the premises of rules by their observed cost and failure rate
+"""
+import json
+import threading
+from typing import Dict, List, Sequence, Tuple, TypeVar, Union
+
+from inference_tools.datatypes.compiled_rule import CompiledQuery
+from inference_tools.datatypes.query import Query, SparqlQueryBody
+from inference_tools.premise_execution import PremiseExecution
+
+PremiseKey = Tuple[str, str, str]
+
+T = TypeVar("T", bound=Union[Query, CompiledQuery])
+
+
+def premise_key(premise: Union[Query, CompiledQuery]) -> PremiseKey:
+    """
+    @return: what identifies a premise across rule loads: its type, the bucket it targets and
+    its body
+    @rtype: PremiseKey
+    """
+    if isinstance(premise, CompiledQuery):
+        premise = premise.query
+
+    body = premise.body  # type: ignore
+    body_str = body.query_string if isinstance(body, SparqlQueryBody) else \
+        json.dumps(body, sort_keys=True, default=str)
+
+    return premise.type.value, premise.query_configurations[0].get_bucket(), body_str
+
+
+class PremiseStats:
+    """
+    Running statistics of the executions of a premise
+    """
+    count: int
+    failures: int
+    latency: float
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.latency = 0
+
+    def failure_rate(self) -> float:
+        """
+        @return: the failure rate of the premise, smoothed towards 1/2 while it has run few times
+        @rtype: float
+        """
+        return (self.failures + 1) / (self.count + 2)
+
+
+class PremiseScheduler:
+    """
+    Records the latency and outcome of premise executions, and orders premises so that the ones
+    with the lowest expected cost before a failure, latency / failure rate, run first.
+    Latencies are exponentially weighted moving averages, giving a weight of latency_decay to
+    the latest execution. Premises that have never run are given the average latency of the
+    others.
+    """
+    latency_decay: float
+    stats: Dict[PremiseKey, PremiseStats]
+
+    def __init__(self, latency_decay: float = 0.2):
+        self.latency_decay = latency_decay
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, premise: Union[Query, CompiledQuery], outcome: PremiseExecution,
+               elapsed: float):
+        """
+        Records the execution of a premise
+        @param premise: the premise that was run
+        @type premise: Union[Query, CompiledQuery]
+        @param outcome: the outcome of the premise
+        @type outcome: PremiseExecution
+        @param elapsed: the number of seconds the premise took to run
+        @type elapsed: float
+        """
+        key = premise_key(premise)
+
+        with self._lock:
+            stats = self.stats.setdefault(key, PremiseStats())
+            stats.latency = elapsed if stats.count == 0 else \
+                self.latency_decay * elapsed + (1 - self.latency_decay) * stats.latency
+            stats.count += 1
+            if outcome == PremiseExecution.FAIL:
+                stats.failures += 1
+
+    def order(self, premises: Sequence[T]) -> List[T]:
+        """
+        @param premises: the premises of a rule
+        @type premises: Sequence[Union[Query, CompiledQuery]]
+        @return: the premises, in the order they should run in. Premises with the same expected
+        cost keep their relative order
+        @rtype: List[Union[Query, CompiledQuery]]
+        """
+        with self._lock:
+            known = [s.latency for s in self.stats.values() if s.count > 0]
+            default_latency = sum(known) / len(known) if known else 0
+
+            def _cost(premise: T) -> float:
+                stats = self.stats.get(premise_key(premise), None)
+                if stats is None:
+                    stats = PremiseStats()
+                    stats.latency = default_latency
+                return stats.latency / stats.failure_rate()
+
+            return sorted(premises, key=_cost)
@@ -0,0 +1,426 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+In-memory catalog of the parsed rules of a rule bucket, refreshed incrementally
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Iterable
+
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.datatypes.rule import Rule
+from inference_tools.exceptions.exceptions import InferenceToolsException
+from inference_tools.helper_functions import get_id_attribute
+from inference_tools.rules import ignore_list, rule_format_basic, get_resource_type_descendants
+from inference_tools.source.elastic_search import ElasticSearch
+from inference_tools.type_hierarchy import TypeHierarchyIndex
+
+
+# To increase when the layout of the snapshots, or of the classes they hold, changes
+SNAPSHOT_FORMAT = 1
+
+
+class RuleApplicabilityIndex:
+    """
+    Inverted index of rule ids by target resource type, rule type and required input parameter
+    names, so that the rules applicable to a case are found by intersecting sets of ids.
+    Optional input parameters do not restrict where a rule applies, and are not indexed
+    """
+    by_target_type: Dict[str, Set[str]]
+    by_rule_type: Dict[str, Set[str]]
+    by_required_parameter: Dict[str, Set[str]]
+    required_parameters: Dict[str, Set[str]]
+    without_required_parameters: Set[str]
+    keys: Dict[str, Dict[str, List[str]]]
+
+    def __init__(self):
+        self.by_target_type = {}
+        self.by_rule_type = {}
+        self.by_required_parameter = {}
+        self.required_parameters = {}
+        self.without_required_parameters = set()
+        self.keys = {}
+
+    def add(self, rule: Rule):
+        """
+        Indexes a rule, replacing its previous entries if it was already indexed
+        @param rule: the rule to index, with its flattened input parameters set
+        @type rule: Rule
+        """
+        self.remove(rule.id)
+
+        required = set(
+            p.name for p in (rule.flattened_input_parameters or []) if not p.optional
+        )
+
+        keys = {
+            "target_type": [rule.target_resource_type] if rule.target_resource_type else [],
+            "rule_type": [t.value for t in rule.type],
+            "required_parameter": list(required)
+        }
+
+        for key in keys["target_type"]:
+            self.by_target_type.setdefault(key, set()).add(rule.id)
+        for key in keys["rule_type"]:
+            self.by_rule_type.setdefault(key, set()).add(rule.id)
+        for key in keys["required_parameter"]:
+            self.by_required_parameter.setdefault(key, set()).add(rule.id)
+
+        self.required_parameters[rule.id] = required
+        if len(required) == 0:
+            self.without_required_parameters.add(rule.id)
+
+        self.keys[rule.id] = keys
+
+    def remove(self, rule_id: str):
+        """
+        Removes a rule from the index, if it is indexed
+        @param rule_id: the id of the rule to remove
+        @type rule_id: str
+        """
+        keys = self.keys.pop(rule_id, None)
+        if keys is None:
+            return
+
+        for index, key_name in [
+            (self.by_target_type, "target_type"),
+            (self.by_rule_type, "rule_type"),
+            (self.by_required_parameter, "required_parameter")
+        ]:
+            for key in keys[key_name]:
+                ids = index[key]
+                ids.discard(rule_id)
+                if len(ids) == 0:
+                    del index[key]
+
+        self.required_parameters.pop(rule_id, None)
+        self.without_required_parameters.discard(rule_id)
+
+    @staticmethod
+    def _union(index: Dict[str, Set[str]], keys: Iterable[str]) -> Set[str]:
+        return set().union(*(index.get(key, set()) for key in keys))
+
+    def lookup(
+            self, target_types: Optional[Iterable[str]] = None,
+            rule_types: Optional[Iterable[str]] = None,
+            parameter_names: Optional[Iterable[str]] = None
+    ) -> Set[str]:
+        """
+        @param target_types: if specified, only rules targeting one of these types are returned
+        @type target_types: Optional[Iterable[str]]
+        @param rule_types: if specified, only rules of one of these types are returned
+        @type rule_types: Optional[Iterable[str]]
+        @param parameter_names: if specified, only rules whose required input parameters are all
+        amongst these are returned
+        @type parameter_names: Optional[Iterable[str]]
+        @return: the ids of the matching rules
+        @rtype: Set[str]
+        """
+        candidates: Optional[Set[str]] = None
+
+        for index, keys in [(self.by_target_type, target_types), (self.by_rule_type, rule_types)]:
+            if keys is None:
+                continue
+            ids = self._union(index, keys)
+            candidates = ids if candidates is None else candidates & ids
+
+        if parameter_names is not None:
+            # A rule matches if it is hit once for each of its required parameters
+            hits = Counter(
+                rule_id for name in set(parameter_names)
+                for rule_id in self.by_required_parameter.get(name, set())
+            )
+            ids = set(
+                rule_id for rule_id, count in hits.items()
+                if count == len(self.required_parameters[rule_id])
+            ) | self.without_required_parameters
+
+            candidates = ids if candidates is None else candidates & ids
+
+        return candidates if candidates is not None else set(self.keys.keys())
+
+
+class RuleCatalog:
+    """
+    All the rules of a rule bucket, parsed into Rule instances with basic formatting applied
+    (see rule_format_basic), indexed by id.
+    Once loaded, the catalog is refreshed when it is older than refresh_interval seconds, by
+    fetching only the rules updated since the last sync, and re-parsing only the ones whose
+    revision changed. The Rule instances are shared by all callers and should not be modified.
+    The rules are indexed by where they apply in an applicability index, kept in sync with them.
+    The rules that could not be parsed are reported in parse_errors, by id, until a later
+    revision of them is parsed or they are deprecated.
+    A catalog can be saved to a snapshot file, from which a catalog is loaded without fetching
+    and parsing the rules, before being revalidated against the rule bucket.
+    """
+    forge_rules: KnowledgeGraphForge
+    refresh_interval: float
+    rules: Dict[str, Rule]
+    revisions: Dict[str, Optional[int]]
+    last_update: Optional[str]
+    synced_at: Optional[float]
+    applicability_index: RuleApplicabilityIndex
+    parse_errors: Dict[str, str]
+    revalidation_error: Optional[InferenceToolsException]
+
+    def __init__(self, forge_rules: KnowledgeGraphForge, refresh_interval: float = 300):
+        self.forge_rules = forge_rules
+        self.refresh_interval = refresh_interval
+        self.rules = {}
+        self.revisions = {}
+        self.last_update = None
+        self.synced_at = None
+        self.applicability_index = RuleApplicabilityIndex()
+        self.parse_errors = {}
+        self.revalidation_error = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        """
+        @return: whether the catalog has never been loaded, or was synced more than
+        refresh_interval seconds ago
+        @rtype: bool
+        """
+        return self.synced_at is None or time.time() - self.synced_at > self.refresh_interval
+
+    def refresh(self, debug: bool = False):
+        """
+        Loads all rules if the catalog has never been loaded, else fetches the rules updated
+        since the last sync, re-parsing the rules whose revision changed and removing the
+        deprecated ones. The rules that could not be parsed are recorded in parse_errors
+        @param debug: Whether to print the queries being executed, and the rules that could not
+        be parsed, or not
+        @type debug: bool
+        """
+        with self._refresh_lock:
+            must: List[Dict[str, Any]] = [{"match": {"_deprecated": False}}] \
+                if self.last_update is None else \
+                [{"range": {"_updatedAt": {"gte": self.last_update}}}]
+
+            query = {
+                "size": ElasticSearch.NO_LIMIT,
+                "sort": [{"_updatedAt": "asc"}, {"@id": "asc"}],
+                "query": {"bool": {"must": must}}
+            }
+
+            hits = self.forge_rules.elastic(json.dumps(query), debug=debug, as_resource=False)
+
+            if hits is None:
+                raise InferenceToolsException("Could not retrieve the rules")
+
+            # Rules are read under this lock, so that they are never seen half updated
+            with self._lock:
+                for hit in hits:
+                    self._update(hit["_source"], debug=debug)
+
+                if len(hits) > 0:
+                    self.last_update = hits[-1]["sort"][0]
+
+                self.synced_at = time.time()
+
+    def revalidate_in_background(self, debug: bool = False) -> threading.Thread:
+        """
+        Refreshes the catalog in a daemon thread, while the rules it holds keep being served.
+        The error that made the last revalidation fail, if any, is kept in revalidation_error
+        @param debug: Whether to print the queries being executed, and the revalidation errors,
+        or not
+        @type debug: bool
+        @return: the thread refreshing the catalog
+        @rtype: threading.Thread
+        """
+        def _revalidate():
+            try:
+                self.refresh(debug=debug)
+                self.revalidation_error = None
+            except InferenceToolsException as e:
+                self.revalidation_error = e
+                if debug:
+                    print(f"Rule catalog could not be revalidated: {e.message}")
+
+        thread = threading.Thread(target=_revalidate, daemon=True)
+        thread.start()
+        return thread
+
+    def save(self, path: str):
+        """
+        Saves the catalog to a snapshot file. The file is replaced atomically, so that a catalog
+        being loaded from it concurrently never reads it half written
+        @param path: the path of the snapshot file
+        @type path: str
+        """
+        with self._lock:
+            data = pickle.dumps({
+                "format": SNAPSHOT_FORMAT,
+                "rules": self.rules,
+                "revisions": self.revisions,
+                "parse_errors": self.parse_errors,
+                "last_update": self.last_update,
+                "applicability_index": self.applicability_index
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+            cls, path: str, forge_rules: KnowledgeGraphForge, refresh_interval: float = 300,
+            revalidate: bool = True, debug: bool = False
+    ) -> "RuleCatalog":
+        """
+        Loads a catalog from a snapshot file. The rules of the snapshot are served right away.
+        They are versioned by their revision, so revalidating the catalog only fetches the
+        rules updated since the snapshot was saved, and only re-parses the ones whose revision
+        changed. As snapshots are pickled, they should only be loaded from trusted locations
+        @param path: the path of the snapshot file
+        @type path: str
+        @param forge_rules: a forge instance tied to the rule bucket the snapshot was taken from
+        @type forge_rules: KnowledgeGraphForge
+        @param refresh_interval: the number of seconds after which the catalog becomes stale
+        @type refresh_interval: float
+        @param revalidate: whether to revalidate the loaded catalog in the background
+        @type revalidate: bool
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        @return: the loaded catalog
+        @rtype: RuleCatalog
+        """
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+
+        if not isinstance(data, dict) or data.get("format") != SNAPSHOT_FORMAT:
+            raise InferenceToolsException(
+                f"Unsupported rule catalog snapshot format in {path}, expected {SNAPSHOT_FORMAT}"
+            )
+
+        catalog = cls(forge_rules, refresh_interval=refresh_interval)
+        catalog.rules = data["rules"]
+        catalog.revisions = data["revisions"]
+        catalog.parse_errors = data.get("parse_errors", {})
+        catalog.last_update = data["last_update"]
+        catalog.applicability_index = data["applicability_index"]
+        catalog.synced_at = time.time()
+
+        if revalidate:
+            catalog.revalidate_in_background(debug=debug)
+
+        return catalog
+
+    def _update(self, source: Dict, debug: bool = False):
+        rule_id = get_id_attribute(source)
+        rev = source.get("_rev")
+
+        if source.get("_deprecated", False) or rule_id in ignore_list:
+            self.rules.pop(rule_id, None)
+            self.revisions.pop(rule_id, None)
+            self.parse_errors.pop(rule_id, None)
+            self.applicability_index.remove(rule_id)
+            return
+
+        if rule_id in self.rules and rev is not None and self.revisions.get(rule_id) == rev:
+            return
+
+        try:
+            rule = rule_format_basic(Rule({**source, "nexus_link": source.get("_self")}))
+            self.rules[rule_id] = rule
+            self.revisions[rule_id] = rev
+            self.applicability_index.add(rule)
+            self.parse_errors.pop(rule_id, None)
+        except InferenceToolsException as e:
+            self.parse_errors[rule_id] = e.message
+            if debug:
+                print(f"Rule {rule_id} could not be parsed: {e.message}")
+
+    def get_rules(
+            self, rule_types: Optional[List[str]] = None,
+            resource_types: Optional[List[str]] = None,
+            debug: bool = False
+    ) -> List[Rule]:
+        """
+        Filters the rules of the catalog, refreshing it first if it is stale
+        @param rule_types: if specified, only rules of one of these types are returned
+        @type rule_types: Optional[List[str]]
+        @param resource_types: if specified, only rules whose target resource type is one of these
+        types are returned
+        @type resource_types: Optional[List[str]]
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        @return: the matching rules
+        @rtype: List[Rule]
+        """
+        return self._get_indexed_rules(
+            target_types=resource_types, rule_types=rule_types, parameter_names=None, debug=debug
+        )
+
+    def get_applicable_rules(
+            self, resource_types: Optional[List[str]] = None,
+            rule_types: Optional[List[str]] = None,
+            parameter_names: Optional[List[str]] = None,
+            resource_types_descendants: bool = True,
+            type_hierarchy: Optional[TypeHierarchyIndex] = None,
+            debug: bool = False
+    ) -> List[Rule]:
+        """
+        Gets the rules applicable to resources of some types, given the names of the input
+        parameters available, refreshing the catalog first if it is stale
+        @param resource_types: if specified, only rules targeting one of these types, or one of
+        their parent types if resource_types_descendants is enabled, are returned
+        @type resource_types: Optional[List[str]]
+        @param rule_types: if specified, only rules of one of these types are returned
+        @type rule_types: Optional[List[str]]
+        @param parameter_names: if specified, only rules whose required input parameters are all
+        amongst these are returned
+        @type parameter_names: Optional[List[str]]
+        @param resource_types_descendants: whether rules targeting parent types of the resource
+        types are also applicable
+        @type resource_types_descendants: bool
+        @param type_hierarchy: optional in-memory index of the type hierarchy, used to get the
+        parent types
+        @type type_hierarchy: Optional[TypeHierarchyIndex]
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        @return: the applicable rules
+        @rtype: List[Rule]
+        """
+        if resource_types is not None and resource_types_descendants:
+            resource_types = get_resource_type_descendants(
+                self.forge_rules, resource_types, debug=debug, type_hierarchy=type_hierarchy
+            )
+
+        return self._get_indexed_rules(
+            target_types=resource_types, rule_types=rule_types, parameter_names=parameter_names,
+            debug=debug
+        )
+
+    def _get_indexed_rules(
+            self, target_types: Optional[List[str]], rule_types: Optional[List[str]],
+            parameter_names: Optional[List[str]], debug: bool
+    ) -> List[Rule]:
+        if self.is_stale():
+            self.refresh(debug=debug)
+
+        with self._lock:
+            ids = self.applicability_index.lookup(
+                target_types=target_types, rule_types=rule_types, parameter_names=parameter_names
+            )
+
+            return [self.rules[rule_id] for rule_id in sorted(ids)]
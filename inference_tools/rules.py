@@ -16,29 +16,41 @@
 """
 Rule fetching
 """
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from copy import copy
 from string import Template
-from typing import List, Optional, Dict, Union, Callable, Any
+from typing import List, Optional, Dict, Union, Callable, Any, Sequence, Tuple, TYPE_CHECKING
 import json
 from kgforge.core import KnowledgeGraphForge
 
+from inference_tools.datatypes.embedding_model_data_catalog import EmbeddingModelDataCatalog
 from inference_tools.datatypes.parameter_specification import ParameterSpecification
 from inference_tools.datatypes.query import SparqlQueryBody, SimilaritySearchQuery
 from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
-from inference_tools.datatypes.rule import Rule
-from inference_tools.datatypes.similarity.embedding import Embedding
+from inference_tools.datatypes.rule import Rule, PartialRule
 from inference_tools.exceptions.exceptions import SimilaritySearchException, InferenceToolsException
 from inference_tools.exceptions.malformed_rule import InvalidParameterSpecificationException
+from inference_tools.exceptions.premise import PremiseException
 from inference_tools.execution import check_premises
 from inference_tools.helper_functions import _enforce_list
+from inference_tools.nexus_utils.forge_session_pool import pooled
 from inference_tools.nexus_utils.forge_utils import ForgeUtils
 from inference_tools.parameter_formatter import ParameterFormatter
+from inference_tools.premise_cache import PremiseCache
+from inference_tools.premise_scheduler import PremiseScheduler
+from inference_tools.similarity.embedding_membership import (
+    EmbeddingMembershipRegistry,
+    MembershipKey
+)
 from inference_tools.similarity.main import SIMILARITY_MODEL_SELECT_PARAMETER_NAME
-from inference_tools.similarity.queries.get_embeddings_vectors import get_embedding_vectors
+from inference_tools.similarity.queries.get_embedded_entity_ids import get_embedded_entity_ids
 from inference_tools.source.elastic_search import ElasticSearch
 from inference_tools.type import QueryType, ParameterType, RuleType
+from inference_tools.type_hierarchy import TypeHierarchyIndex
 from inference_tools.utils import get_search_query_parameters
 
+if TYPE_CHECKING:
+    from inference_tools.rule_catalog import RuleCatalog
 
 ignore_list = [
     "https://bbp.epfl.ch/neurosciencegraph/data/b5542787-b127-46ee-baa5-798d5d9a33bc",  # multiple sp
@@ -50,7 +62,10 @@ ignore_list = [
 ]
 
 
-def get_resource_type_descendants(forge, types, to_symbol=True, debug: bool = False) -> List[str]:
+def get_resource_type_descendants(
+        forge, types, to_symbol=True, debug: bool = False,
+        type_hierarchy: Optional[TypeHierarchyIndex] = None
+) -> List[str]:
     """
     Gets the descendant types of a list of data types
 
@@ -62,12 +77,20 @@ def get_resource_type_descendants(forge, types, to_symbol=True, debug: bool = Fa
     @type types: List[str]
     @param debug: Whether to print the queries being executed or not
     @type debug: bool
+    @param type_hierarchy: optional in-memory index of the type hierarchy, answering without
+    querying the sparql view when all types are part of it
+    @type type_hierarchy: Optional[TypeHierarchyIndex]
     @return: a list of Resource labels that are descendants of the
     @rtype: List[str]
     """
 
     types = list(map(lambda x: ForgeUtils.expand_uri(forge, x), types))
 
+    if type_hierarchy is not None:
+        indexed = type_hierarchy.ancestors(types, to_symbol=to_symbol, debug=debug)
+        if indexed is not None:
+            return indexed
+
     query = SparqlQueryBody({"query_string": """
             SELECT ?id ?label
             WHERE {
@@ -102,12 +125,19 @@ def rule_format_basic(rule_obj: Rule) -> Rule:
     adding them to the parameter specification
     - The input parameters are flattened in the case of query pipes and set to the rule's
     flattened_input_parameters field
+    For a lazy rule whose search query has not been parsed yet, the formatting is applied when
+    it is parsed
 
     @param rule_obj: the rule to format
     @type rule_obj: Rule
     @return: the formatted rule
     @rtype: Rule
     """
+    rule_obj.on_parsed(_format_parsed_rule)
+    return rule_obj
+
+
+def _format_parsed_rule(rule_obj: Rule):
     if isinstance(rule_obj.search_query, SimilaritySearchQuery):
         rule_obj.search_query.parameter_specifications = _update_parameter_specifications(
             rule_obj.search_query.parameter_specifications,
@@ -116,8 +146,6 @@ def rule_format_basic(rule_obj: Rule) -> Rule:
 
     rule_obj.flattened_input_parameters = list(get_search_query_parameters(rule_obj).values())
 
-    return rule_obj
-
 
 def fetch_rules(
         forge_rules: KnowledgeGraphForge,
@@ -130,8 +158,14 @@ def fetch_rules(
         forge_factory: Optional[Callable[
             [str, str, Optional[str], Optional[str]], KnowledgeGraphForge
         ]] = None,
-        debug: bool = False
-
+        debug: bool = False,
+        membership_registry: Optional[EmbeddingMembershipRegistry] = None,
+        rule_catalog: Optional["RuleCatalog"] = None,
+        type_hierarchy: Optional[TypeHierarchyIndex] = None,
+        premise_check_workers: Optional[int] = None,
+        lazy: bool = False,
+        premise_scheduler: Optional[PremiseScheduler] = None,
+        premise_cache: Optional[PremiseCache] = None
 ) -> Union[List[Rule], Dict[str, List[Rule]]]:
     """
     Get rules. Rules can be filtered by
@@ -165,6 +199,29 @@ def fetch_rules(
     @type debug: bool
     @param input_filters: filters to run against rule premises
     @type input_filters: Optional[Dict]
+    @param membership_registry: optional in-memory indices of the entities embedded by each
+    model, used to check whether resource ids have embeddings without querying elastic search
+    @type membership_registry: Optional[EmbeddingMembershipRegistry]
+    @param rule_catalog: optional catalog of the parsed rules of the bucket of forge_rules. If
+    provided, rules are filtered in memory instead of being queried and parsed again
+    @type rule_catalog: Optional[RuleCatalog]
+    @param type_hierarchy: optional in-memory index of the type hierarchy of the bucket of
+    forge_rules, used to get the resource type descendants
+    @type type_hierarchy: Optional[TypeHierarchyIndex]
+    @param premise_check_workers: if specified, the premises of the rules are checked against
+    the input filters concurrently by at most this many threads. Else they are checked one rule
+    after the other. Either way, the rules whose premise check raises a PremiseException, such
+    as a FailedPremiseException, are filtered out, see filter_rules_by_premises
+    @type premise_check_workers: Optional[int]
+    @param lazy: Whether to build lazy rules, whose search query and premises are only parsed and
+    formatted when first accessed. Ignored when rules come from a rule catalog
+    @type lazy: bool
+    @param premise_scheduler: optional scheduler recording the executions of premises, and
+    ordering the premises of each rule so that the failing ones are reached sooner
+    @type premise_scheduler: Optional[PremiseScheduler]
+    @param premise_cache: optional cache of premise outcomes, so that premises shared by rules,
+    or by successive calls, run once per time to live of the cache
+    @type premise_cache: Optional[PremiseCache]
     @return: a list of rules if no resource ids were specified, a dictionary of list of rules if
     resource ids were specified. This dictionary's index are the resource ids.
     @rtype: Union[List[Rule], Dict[str, List[Rule]]]
@@ -174,42 +231,19 @@ def fetch_rules(
         if rule_types is None or len(rule_types) == 0 \
         else [e.value for e in rule_types]
 
-    # Query by rule type
-    q: Dict[str, Any] = {
-        "size": ElasticSearch.NO_LIMIT,
-        'query': {
-            'bool': {
-                'filter': [
-                    {'terms': {'@type': rule_types_str}}
-                ],
-                'must': [
-                    {'match': {'_deprecated': False}}
-                ]
-            }
-        }
-    }
-
-    # Add target resource type to query
-    if resource_types is not None:
-
-        # add the target resource type and its descendant types
-        if resource_types_descendants:
-            resource_types = get_resource_type_descendants(forge_rules, resource_types, debug=debug)
-
-        q["query"]["bool"]["must"].append(
-            {"terms": {"targetResourceType": resource_types}}
+    # add the target resource type and its descendant types
+    if resource_types is not None and resource_types_descendants:
+        resource_types = get_resource_type_descendants(
+            forge_rules, resource_types, debug=debug, type_hierarchy=type_hierarchy
         )
 
-    rules = forge_rules.elastic(json.dumps(q), debug=debug)
-
-    # Turn rules to Rule instances
-    rules = [
-        Rule({**forge_rules.as_json(r), "nexus_link": r._store_metadata._self})
-        for r in rules
-    ]
-
-    # Ignore some hardcoded rules
-    rules = [r for r in rules if r.id not in ignore_list]
+    if rule_catalog is not None:
+        # Rules are parsed and formatted once by the catalog
+        rules = rule_catalog.get_rules(
+            rule_types=rule_types_str, resource_types=resource_types, debug=debug
+        )
+    else:
+        rules = _query_rules(forge_rules, rule_types_str, resource_types, debug, lazy=lazy)
 
     # Check premises of rules if some input filters were provided
     if input_filters is not None:
@@ -217,23 +251,24 @@ def fetch_rules(
         if forge_factory is None:
             raise InferenceToolsException("Cannot check premises without a forge factory specified")
 
-        rules = [
-            r for r in rules if check_premises(
-                forge_factory=forge_factory,
-                rule=r,
-                parameter_values=input_filters
-            )
-        ]
+        rules = filter_rules_by_premises(
+            rules, forge_factory=forge_factory, parameter_values=input_filters,
+            max_workers=premise_check_workers, debug=debug, scheduler=premise_scheduler,
+            cache=premise_cache
+        )
+
+    def _format(rule: Rule) -> Rule:
+        return rule if rule_catalog is not None else rule_format_basic(rule)
 
     # If no resource id is provided, apply basic formatting on rules
     if resource_ids is None:
-        return [rule_format_basic(r) for r in rules]
+        return [_format(r) for r in rules]
 
     resource_id_list: List[str] = _enforce_list(resource_ids)
 
     # Non similarity search rules have basic formatting applied
     non_sim_formatted = [
-        rule_format_basic(r) for r in rules
+        _format(r) for r in rules
         if not isinstance(r.search_query, SimilaritySearchQuery)
     ]
 
@@ -242,13 +277,25 @@ def fetch_rules(
             "Cannot check resource id has embeddings without a forge factory specified"
         )
 
+    sim_rules = [r for r in rules if isinstance(r.search_query, SimilaritySearchQuery)]
+
+    # Embedding checks are ran once per distinct model across all rules
+    embedding_checks = get_embedding_checks(
+        query_configurations=[
+            qc for r in sim_rules  # type: ignore
+            for qc in r.search_query.query_configurations  # type: ignore
+        ],
+        resource_ids=resource_id_list, forge_factory=forge_factory,
+        use_resources=use_resources, debug=debug, membership_registry=membership_registry
+    )
+
     # list -> per rule, dict: value is rule (or partial) if relevant else None
     rule_check_per_res_id: List[Dict[str, Optional[Rule]]] = [
         rule_has_resource_ids_embeddings(
             rule, resource_id_list, forge_factory=forge_factory, use_resources=use_resources,
-            debug=debug
+            debug=debug, embedding_checks=embedding_checks
         )
-        for rule in rules if isinstance(rule.search_query, SimilaritySearchQuery)
+        for rule in sim_rules
     ] + [
         dict((res_id, rule) for res_id in resource_ids)
         for rule in non_sim_formatted
@@ -267,10 +314,117 @@ def fetch_rules(
     return final_dict
 
 
+def filter_rules_by_premises(
+        rules: List[Rule],
+        forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
+        parameter_values: Dict, max_workers: Optional[int] = None, debug: bool = False,
+        scheduler: Optional[PremiseScheduler] = None,
+        cache: Optional[PremiseCache] = None
+) -> List[Rule]:
+    """
+    Checks the premises of rules, keeping the rules whose premises are satisfied by the
+    parameter values, in their original order. A rule whose premise check raises a
+    PremiseException, such as a FailedPremiseException, is filtered out, whether the rules are
+    checked one after the other or concurrently. Other exceptions are raised.
+    @param rules: the rules to filter
+    @type rules: List[Rule]
+    @param forge_factory: a method to instanciate the forge instances the premises run against
+    @type forge_factory: Callable
+    @param parameter_values: the input filters to check the premises with
+    @type parameter_values: Dict
+    @param max_workers: if specified, the maximum number of rules whose premises are checked at
+    the same time. As soon as a check raises an exception other than a PremiseException, the
+    checks that have not started are cancelled and the exception is raised, while the ones
+    already running complete in the background. Else the rules are checked one after the other
+    @type max_workers: Optional[int]
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @param scheduler: optional scheduler ordering the premises of each rule, see check_premises
+    @type scheduler: Optional[PremiseScheduler]
+    @param cache: optional cache of premise outcomes, see check_premises
+    @type cache: Optional[PremiseCache]
+    @return: the rules whose premises are satisfied
+    @rtype: List[Rule]
+    """
+
+    forge_factory = pooled(forge_factory)
+
+    if len(rules) == 0:
+        return []
+
+    def _check(rule: Rule) -> bool:
+        try:
+            return check_premises(
+                forge_factory=forge_factory, rule=rule, parameter_values=parameter_values,
+                debug=debug, scheduler=scheduler, cache=cache
+            )
+        except PremiseException as e:
+            if debug:
+                print(f"Rule {rule.id} is filtered out: {e.message}")
+            return False
+
+    if max_workers is None:
+        return [rule for rule in rules if _check(rule)]
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rules))))
+    futures: List[Future] = []
+    try:
+        futures = [executor.submit(_check, rule) for rule in rules]
+        # Raises as soon as a check raises
+        for future in as_completed(futures):
+            future.result()
+        checks = [future.result() for future in futures]
+    finally:
+        # shutdown's cancel_futures is only available from python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    return [rule for rule, check in zip(rules, checks) if check]
+
+
+def _query_rules(
+        forge_rules: KnowledgeGraphForge, rule_types_str: List[str],
+        resource_types: Optional[List[str]], debug: bool, lazy: bool = False
+) -> List[Rule]:
+    # Query by rule type
+    q: Dict[str, Any] = {
+        "size": ElasticSearch.NO_LIMIT,
+        'query': {
+            'bool': {
+                'filter': [
+                    {'terms': {'@type': rule_types_str}}
+                ],
+                'must': [
+                    {'match': {'_deprecated': False}}
+                ]
+            }
+        }
+    }
+
+    # Add target resource type to query
+    if resource_types is not None:
+        q["query"]["bool"]["must"].append(
+            {"terms": {"targetResourceType": resource_types}}
+        )
+
+    rules = forge_rules.elastic(json.dumps(q), debug=debug)
+
+    # Turn rules to Rule instances
+    rules = [
+        Rule({**forge_rules.as_json(r), "nexus_link": r._store_metadata._self}, lazy=lazy)
+        for r in rules
+    ]
+
+    # Ignore some hardcoded rules
+    return [r for r in rules if r.id not in ignore_list]
+
+
 def rule_has_resource_ids_embeddings(
         rule: Rule, resource_ids: List[str],
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
-        use_resources: bool, debug: bool
+        use_resources: bool, debug: bool,
+        embedding_checks: Optional[Dict[MembershipKey, Dict[str, bool]]] = None
 ) -> Dict[str, Optional[Rule]]:
     """
     Checks whether a rule is relevant for a list of resource ids.
@@ -286,6 +440,10 @@ def rule_has_resource_ids_embeddings(
     @type use_resources: bool
     @param debug: Whether to print the queries being executed or not
     @type debug: bool
+    @param embedding_checks: optional results of get_embedding_checks, computed beforehand for
+    query configurations that include the ones of this rule. If not provided, the checks are
+    ran for this rule only
+    @type embedding_checks: Optional[Dict[MembershipKey, Dict[str, bool]]]
     @return: If a rule's search query is not a SimilaritySearchQuery, the rule is relevant for
     all resource ids.
     If the rule's search query is a SimilaritySearchQuery, for each resource id,
@@ -298,57 +456,132 @@ def rule_has_resource_ids_embeddings(
     @rtype: Dict[str, Optional[Rule]]
     """
 
+    forge_factory = pooled(forge_factory)
+
     if not isinstance(rule.search_query, SimilaritySearchQuery):
         raise SimilaritySearchException(
             "Cannot check if rule has resource id embeddings for a rule "
             "that does not hold a similarity search query"
         )
 
-    buckets = {(c.org, c.project) for c in rule.search_query.query_configurations}
-
-    forge_instances = dict(
-        (f"{org}/{project}", forge_factory(org, project, None, None)) for org, project in buckets
-    )
-
-    has_embedding_dict_list: List[Dict[str, bool]] = [
-        has_embedding_dict(
-            qc, resource_ids, forge=forge_instances[qc.get_bucket()],
+    if embedding_checks is None:
+        embedding_checks = get_embedding_checks(
+            query_configurations=rule.search_query.query_configurations,
+            resource_ids=resource_ids, forge_factory=forge_factory,
             use_resources=use_resources, debug=debug
         )
+
+    has_embedding_dict_list: List[Dict[str, bool]] = [
+        embedding_checks[EmbeddingMembershipRegistry.get_key(qc)]
         for qc in rule.search_query.query_configurations
     ]
 
+    # Resources with the same subset of embedded models share the same partial rule
+    partial_rules: Dict[Tuple[int, ...], Optional[Rule]] = {}
+
     def _handle_resource_id(res_id) -> Optional[Rule]:
-        if not isinstance(rule.search_query, SimilaritySearchQuery):
-            raise SimilaritySearchException(
-                "Cannot check if rule has resource id embeddings for a rule "
-                "that does not hold a similarity search query"
-            )
+        subset = tuple(i for i, per_qc in enumerate(has_embedding_dict_list) if per_qc[res_id])
 
-        query_confs: List[SimilaritySearchQueryConfiguration] = list(
-            rule.search_query.query_configurations[i]
-            for i, per_qc in enumerate(has_embedding_dict_list) if per_qc[res_id]
-        )
+        if subset not in partial_rules:
+            partial_rules[subset] = make_partial_rule(rule, subset) if len(subset) > 0 else None
 
-        if len(query_confs) == 0:
-            return None
+        return partial_rules[subset]
 
-        rule_i = deepcopy(rule)
+    return dict((res_id, _handle_resource_id(res_id)) for res_id in resource_ids)
 
-        if not isinstance(rule_i.search_query, SimilaritySearchQuery):
-            raise SimilaritySearchException(
-                "Cannot check if rule has resource id embeddings for a rule "
-                "that does not hold a similarity search query"
-            )
 
-        rule_i.search_query.query_configurations = query_confs
-        rule_i.search_query.parameter_specifications = _update_parameter_specifications(
-            rule_i.search_query.parameter_specifications, query_confs
+def make_partial_rule(rule: Rule, query_configuration_indices: Sequence[int]) -> PartialRule:
+    """
+    Builds a view of a similarity search rule keeping only some of its query configurations.
+    The search query is shallow copied, with its own query configurations and a copy of the
+    parameter specification selecting the models. Everything else is shared with the rule.
+    @param rule: the rule, holding a similarity search query
+    @type rule: Rule
+    @param query_configuration_indices: the indices of the query configurations to keep
+    @type query_configuration_indices: Sequence[int]
+    @return: the partial rule
+    @rtype: PartialRule
+    """
+    if not isinstance(rule.search_query, SimilaritySearchQuery):
+        raise SimilaritySearchException(
+            "Cannot check if rule has resource id embeddings for a rule "
+            "that does not hold a similarity search query"
         )
-        rule_i.flattened_input_parameters = list(get_search_query_parameters(rule_i).values())
-        return rule_i
 
-    return dict((res_id, _handle_resource_id(res_id)) for res_id in resource_ids)
+    search_query = copy(rule.search_query)
+    search_query.query_configurations = [
+        rule.search_query.query_configurations[i] for i in query_configuration_indices
+    ]
+    search_query.parameter_specifications = _update_parameter_specifications(
+        [
+            copy(p) if p.name == SIMILARITY_MODEL_SELECT_PARAMETER_NAME else p
+            for p in rule.search_query.parameter_specifications
+        ],
+        search_query.query_configurations
+    )
+
+    partial_rule = PartialRule(rule, search_query)
+    partial_rule.flattened_input_parameters = list(
+        get_search_query_parameters(partial_rule).values()
+    )
+    return partial_rule
+
+
+def get_embedding_checks(
+        query_configurations: List[SimilaritySearchQueryConfiguration],
+        resource_ids: List[str],
+        forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
+        use_resources: bool, debug: bool,
+        membership_registry: Optional[EmbeddingMembershipRegistry] = None
+) -> Dict[MembershipKey, Dict[str, bool]]:
+    """
+    Checks whether resources have been embedded, for a list of query configurations that can
+    belong to different rules. Query configurations are grouped by bucket, similarity view and
+    derivation type, so that query configurations sharing the same embeddings are only checked
+    once.
+    @param query_configurations: the query configurations holding the embedding models to check
+    @type query_configurations: List[SimilaritySearchQueryConfiguration]
+    @param resource_ids: the list of resource ids
+    @type resource_ids: List[str]
+    @param forge_factory: a method to instanciate a forge instance to query for the
+    embeddings
+    @type forge_factory: Callable
+    @param use_resources: Whether to manipulate Resource objects when getting back ElasticSearch
+    results or not
+    @type use_resources: bool
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @param membership_registry: optional in-memory indices of the embedded entities of each
+    model, see has_embedding_dict
+    @type membership_registry: Optional[EmbeddingMembershipRegistry]
+    @return: a dictionary indexed by (bucket, similarity view id, derivation type), whose values
+    are the results of has_embedding_dict for the group
+    @rtype: Dict[MembershipKey, Dict[str, bool]]
+    """
+
+    forge_factory = pooled(forge_factory)
+
+    groups: Dict[MembershipKey, SimilaritySearchQueryConfiguration] = {}
+    for qc in query_configurations:
+        groups.setdefault(EmbeddingMembershipRegistry.get_key(qc), qc)
+
+    buckets = {(qc.org, qc.project) for qc in groups.values()}
+
+    forge_instances = dict(
+        (f"{org}/{project}", forge_factory(org, project, None, None)) for org, project in buckets
+    )
+
+    return dict(
+        (
+            key,
+            has_embedding_dict(
+                qc, resource_ids, forge=forge_instances[qc.get_bucket()],
+                use_resources=use_resources, debug=debug,
+                membership_registry=membership_registry
+            )
+        )
+        for key, qc in groups.items()
+    )
 
 
 def _update_parameter_specifications(
@@ -372,10 +605,16 @@ def _update_parameter_specifications(
             f"{SIMILARITY_MODEL_SELECT_PARAMETER_NAME} should have a predefined list of values"
         )
 
-    parameter_specifications[pos_select].values = dict(
-        (key, valid_select_values[value].embedding_model_data_catalog)
+    # Values are model ids, or embedding model data catalogs if already updated
+    value_ids = dict(
+        (key, value.id if isinstance(value, EmbeddingModelDataCatalog) else value)
         for key, value in f.items()
-        if value in valid_select_values.keys()
+    )
+
+    parameter_specifications[pos_select].values = dict(
+        (key, valid_select_values[value_id].embedding_model_data_catalog)
+        for key, value_id in value_ids.items()
+        if value_id in valid_select_values.keys()
     )
 
     return parameter_specifications
@@ -386,7 +625,8 @@ def has_embedding_dict(
         resource_ids: List[str],
         forge: KnowledgeGraphForge,
         use_resources: bool,
-        debug: bool
+        debug: bool,
+        membership_registry: Optional[EmbeddingMembershipRegistry] = None
 ) -> Dict[str, bool]:
     """
     For each resource id, checks whether it has been embedded by the model associated with the
@@ -404,21 +644,39 @@ def has_embedding_dict(
     @type use_resources: bool
     @param debug: Whether to print the queries being executed or not
     @type debug: bool
+    @param membership_registry: optional in-memory indices of the embedded entities of each
+    model. If provided, answers are obtained from the index of the model, and elastic search is
+    only queried for the resources whose answer is uncertain
+    @type membership_registry: Optional[EmbeddingMembershipRegistry]
     @return: a dictionary indexed by the
     @rtype: Dict[str, bool]
     """
 
+    known: Dict[str, bool] = {}
+    uncertain = resource_ids
+
+    if membership_registry is not None:
+        known, uncertain = membership_registry.lookup(
+            query_conf, forge=forge, resource_ids=resource_ids, debug=debug
+        )
+        if len(uncertain) == 0:
+            return known
+
     try:
-        embs: List[Embedding] = get_embedding_vectors(
-            forge=forge, search_targets=resource_ids,
+        embedded_ids = get_embedded_entity_ids(
+            forge=forge, search_targets=uncertain,
             use_resources=use_resources, debug=debug,
             view=query_conf.similarity_view.id,
             derivation_type=query_conf.embedding_model_data_catalog.about
         )
 
-        emb_dict: Dict[str, Optional[Embedding]] = dict((e.derivation_id, e) for e in embs)
+        if membership_registry is not None:
+            membership_registry.add(query_conf, embedded_ids)
 
-        return dict((res_id, res_id in emb_dict) for res_id in resource_ids)
+        return dict(
+            (res_id, known[res_id] if res_id in known else res_id in embedded_ids)
+            for res_id in resource_ids
+        )
 
     except SimilaritySearchException:
-        return dict((res_id, False) for res_id in resource_ids)
+        return dict((res_id, known.get(res_id, False)) for res_id in resource_ids)
@@ -0,0 +1,389 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-memory membership structures of the entities embedded by an embedding model, used to check
+rule applicability without querying the similarity view each time
+"""
+import bisect
+import hashlib
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Any
+
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
+from inference_tools.exceptions.exceptions import SimilaritySearchException
+from inference_tools.helper_functions import _enforce_list
+from inference_tools.similarity.queries.common import _find_derivation_id, _page_hits
+
+# (bucket, similarity view id, derivation type)
+MembershipKey = Tuple[str, str, str]
+
+
+class BloomFilter:
+    """
+    A fixed size Bloom filter over strings, using double hashing of a blake2b digest
+    """
+    capacity: int
+    error_rate: float
+    size: int
+    hash_count: int
+    count: int
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        """
+        Adds an item to the filter
+        @param item: the item to add
+        @type item: str
+        """
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class EmbeddingMembershipIndex:
+    """
+    The ids of the entities embedded by a model, as a Bloom filter for fast negative answers,
+    and a sorted array of ids to confirm positive answers of the Bloom filter.
+    last_update is the most recent _updatedAt sort value seen, in epoch milliseconds.
+    Refreshes of the index are serialized by refresh_lock
+    """
+    ids: List[str]
+    last_update: Optional[int]
+    synced_at: float
+    refresh_lock: threading.Lock
+
+    def __init__(self, ids: Iterable[str], last_update: Optional[int] = None,
+                 error_rate: float = 0.01):
+        self.ids = sorted(set(ids))
+        self.last_update = last_update
+        self.synced_at = time.time()
+        self.refresh_lock = threading.Lock()
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = self._build_bloom(self.ids)
+
+    def _build_bloom(self, ids: List[str]) -> BloomFilter:
+        bloom = BloomFilter(capacity=max(2 * len(ids), 1024), error_rate=self._error_rate)
+        for id_ in ids:
+            bloom.add(id_)
+        return bloom
+
+    def __contains__(self, entity_id: str) -> bool:
+        if entity_id not in self._bloom:
+            return False
+        ids = self.ids
+        i = bisect.bisect_left(ids, entity_id)
+        return i < len(ids) and ids[i] == entity_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, added: Iterable[str], removed: Iterable[str],
+               last_update: Optional[int] = None, synced: bool = True):
+        """
+        Updates the index with entities that were embedded or whose embedding was deprecated
+        since the last synchronisation
+        @param added: the ids of the newly embedded entities
+        @type added: Iterable[str]
+        @param removed: the ids of the entities whose embedding has been deprecated
+        @type removed: Iterable[str]
+        @param last_update: the most recent update time of the embeddings seen, in epoch
+        milliseconds
+        @type last_update: Optional[int]
+        @param synced: whether the update results from a synchronisation with the similarity view
+        @type synced: bool
+        """
+        with self._lock:
+            removed_set = set(removed)
+            new_ids = set(added).difference(self.ids)
+            ids = sorted(set(self.ids).union(new_ids).difference(removed_set))
+
+            if len(removed_set) > 0 or len(ids) > self._bloom.capacity:
+                self._bloom = self._build_bloom(ids)
+            else:
+                for id_ in new_ids:
+                    self._bloom.add(id_)
+
+            self.ids = ids
+            if last_update is not None:
+                self.last_update = last_update if self.last_update is None \
+                    else max(last_update, self.last_update)
+            if synced:
+                self.synced_at = time.time()
+
+    def is_stale(self, max_age: float) -> bool:
+        """
+        @param max_age: the number of seconds after which the index should be refreshed
+        @type max_age: float
+        @return: whether the index was last synchronised more than max_age seconds ago
+        @rtype: bool
+        """
+        return time.time() - self.synced_at > max_age
+
+
+class EmbeddingMembershipRegistry:
+    """
+    Holds one EmbeddingMembershipIndex per embedding model, identified by the bucket and
+    similarity view of its embeddings, as well as the type of the entities it embeds.
+    Indices are built from the similarity view the first time they are needed, and are
+    refreshed incrementally once they are older than refresh_interval seconds.
+    """
+    refresh_interval: float
+    error_rate: float
+
+    def __init__(self, refresh_interval: float = 600, error_rate: float = 0.01):
+        self.refresh_interval = refresh_interval
+        self.error_rate = error_rate
+        self._indices: Dict[MembershipKey, EmbeddingMembershipIndex] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(query_conf: SimilaritySearchQueryConfiguration) -> MembershipKey:
+        """
+        @param query_conf: the query configuration holding an embedding model
+        @type query_conf: SimilaritySearchQueryConfiguration
+        @return: the key of the index of the embedding model
+        @rtype: MembershipKey
+        """
+        return (
+            query_conf.get_bucket(),
+            query_conf.similarity_view.id,
+            query_conf.embedding_model_data_catalog.about
+        )
+
+    def get_index(
+            self, query_conf: SimilaritySearchQueryConfiguration, forge: KnowledgeGraphForge,
+            debug: bool = False
+    ) -> EmbeddingMembershipIndex:
+        """
+        Gets the index of the embedding model of a query configuration, building it if it doesn't
+        exist yet, or refreshing it if it is stale
+        @param query_conf: the query configuration holding an embedding model
+        @type query_conf: SimilaritySearchQueryConfiguration
+        @param forge: a forge instance tied to the bucket of the query configuration
+        @type forge: KnowledgeGraphForge
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        @return: the membership index
+        @rtype: EmbeddingMembershipIndex
+        """
+        key = EmbeddingMembershipRegistry.get_key(query_conf)
+        index: Optional[EmbeddingMembershipIndex] = self._indices.get(key, None)
+
+        if index is None:
+            index = build_membership_index(
+                forge=forge, view=query_conf.similarity_view.id,
+                derivation_type=query_conf.embedding_model_data_catalog.about,
+                error_rate=self.error_rate, debug=debug
+            )
+            with self._lock:
+                return self._indices.setdefault(key, index)
+
+        elif index.is_stale(self.refresh_interval):
+            with index.refresh_lock:
+                # Another caller may have refreshed the index meanwhile
+                if index.is_stale(self.refresh_interval):
+                    refresh_membership_index(
+                        index=index, forge=forge, view=query_conf.similarity_view.id,
+                        derivation_type=query_conf.embedding_model_data_catalog.about,
+                        debug=debug
+                    )
+
+        return index
+
+    def lookup(
+            self, query_conf: SimilaritySearchQueryConfiguration, forge: KnowledgeGraphForge,
+            resource_ids: List[str], debug: bool = False
+    ) -> Tuple[Dict[str, bool], List[str]]:
+        """
+        Checks whether resources have been embedded by the model of a query configuration,
+        using its membership index. Positive answers of the index are always certain. Negative
+        answers are certain as long as the index could be built or refreshed. Otherwise, they
+        are returned as uncertain.
+        @param query_conf: the query configuration holding an embedding model
+        @type query_conf: SimilaritySearchQueryConfiguration
+        @param forge: a forge instance tied to the bucket of the query configuration
+        @type forge: KnowledgeGraphForge
+        @param resource_ids: the ids of the resources to check
+        @type resource_ids: List[str]
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        @return: the certain answers, indexed by resource id, and the list of resource ids
+        whose answer is uncertain
+        @rtype: Tuple[Dict[str, bool], List[str]]
+        """
+        index: Optional[EmbeddingMembershipIndex]
+        try:
+            index = self.get_index(query_conf, forge, debug=debug)
+            return dict((res_id, res_id in index) for res_id in resource_ids), []
+        except SimilaritySearchException:
+            index = self._indices.get(EmbeddingMembershipRegistry.get_key(query_conf), None)
+
+        if index is None:
+            return {}, list(resource_ids)
+
+        known = dict((res_id, True) for res_id in resource_ids if res_id in index)
+        return known, [res_id for res_id in resource_ids if res_id not in known]
+
+    def add(self, query_conf: SimilaritySearchQueryConfiguration, entity_ids: Iterable[str]):
+        """
+        Adds entities known to be embedded by the model of a query configuration to its index,
+        if the index exists
+        @param query_conf: the query configuration holding an embedding model
+        @type query_conf: SimilaritySearchQueryConfiguration
+        @param entity_ids: the ids of the embedded entities
+        @type entity_ids: Iterable[str]
+        """
+        index = self._indices.get(EmbeddingMembershipRegistry.get_key(query_conf), None)
+        if index is not None:
+            index.update(added=entity_ids, removed=[], synced=False)
+
+    def invalidate(self, query_conf: Optional[SimilaritySearchQueryConfiguration] = None):
+        """
+        Removes the index of an embedding model, or all indices if no query configuration
+        is specified
+        @param query_conf: the query configuration holding an embedding model
+        @type query_conf: Optional[SimilaritySearchQueryConfiguration]
+        """
+        with self._lock:
+            if query_conf is None:
+                self._indices.clear()
+            else:
+                self._indices.pop(EmbeddingMembershipRegistry.get_key(query_conf), None)
+
+
+def _fetch_embedded_entities(
+        forge: KnowledgeGraphForge, view: str, derivation_type: str, debug: bool,
+        updated_since: Optional[int] = None
+) -> Tuple[Set[str], Set[str], Optional[int]]:
+    """
+    Pages through the embeddings of a similarity view, sorted by update time, retrieving only
+    the derivation of each embedding
+    @return: the ids of the entities with an embedding, the ids of the entities whose embedding
+    is deprecated (only looked for if updated_since is specified),
+    and the most recent update time seen, in epoch milliseconds
+    @rtype: Tuple[Set[str], Set[str], Optional[int]]
+    """
+    must: List[Dict[str, Any]] = [{"exists": {"field": "embedding"}}]
+
+    if updated_since is None:
+        must.append({"term": {"_deprecated": False}})
+    else:
+        must.append({"range": {"_updatedAt": {"gte": updated_since}}})
+
+    query: Dict[str, Any] = {
+        "_source": ["derivation.entity.@id", "derivation.entity.@type", "_deprecated"],
+        "sort": [{"_updatedAt": "asc"}, {"@id": "asc"}],
+        "query": {"bool": {"must": must}}
+    }
+
+    embedded: Set[str] = set()
+    deprecated: Set[str] = set()
+    last_update = updated_since
+
+    for hits in _page_hits(forge=forge, query=query, view=view, debug=debug):
+        for hit in hits:
+            entity_id = _find_derivation_id(
+                derivation_field=_enforce_list(hit["_source"]["derivation"]),
+                type_=derivation_type
+            )
+            if hit["_source"].get("_deprecated", False):
+                deprecated.add(entity_id)
+            else:
+                embedded.add(entity_id)
+
+        if len(hits) > 0:
+            last_update = hits[-1]["sort"][0]
+
+    return embedded, deprecated.difference(embedded), last_update
+
+
+def build_membership_index(
+        forge: KnowledgeGraphForge, view: str, derivation_type: str,
+        error_rate: float = 0.01, debug: bool = False
+) -> EmbeddingMembershipIndex:
+    """
+    Builds the membership index of the entities embedded in a similarity view
+    @param forge: a forge instance tied to the bucket of the similarity view
+    @type forge: KnowledgeGraphForge
+    @param view: the id of the similarity view
+    @type view: str
+    @param derivation_type: the type of the embedded entities, used to find them among the
+    derivations of an embedding
+    @type derivation_type: str
+    @param error_rate: the false positive rate of the Bloom filter
+    @type error_rate: float
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @return: the membership index
+    @rtype: EmbeddingMembershipIndex
+    """
+    embedded, _, last_update = _fetch_embedded_entities(
+        forge=forge, view=view, derivation_type=derivation_type, debug=debug
+    )
+    return EmbeddingMembershipIndex(embedded, last_update=last_update, error_rate=error_rate)
+
+
+def refresh_membership_index(
+        index: EmbeddingMembershipIndex, forge: KnowledgeGraphForge, view: str,
+        derivation_type: str, debug: bool = False
+):
+    """
+    Refreshes a membership index with the embeddings of a similarity view that were created,
+    updated or deprecated since the index was last synchronised
+    @param index: the index to refresh
+    @type index: EmbeddingMembershipIndex
+    @param forge: a forge instance tied to the bucket of the similarity view
+    @type forge: KnowledgeGraphForge
+    @param view: the id of the similarity view
+    @type view: str
+    @param derivation_type: the type of the embedded entities, used to find them among the
+    derivations of an embedding
+    @type derivation_type: str
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    """
+    if index.last_update is None:
+        embedded, deprecated, last_update = _fetch_embedded_entities(
+            forge=forge, view=view, derivation_type=derivation_type, debug=debug
+        )
+        deprecated = set(index.ids).difference(embedded)
+    else:
+        embedded, deprecated, last_update = _fetch_embedded_entities(
+            forge=forge, view=view, derivation_type=derivation_type, debug=debug,
+            updated_since=index.last_update
+        )
+
+    index.update(added=embedded, removed=deprecated, last_update=last_update)
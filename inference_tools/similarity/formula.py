@@ -15,6 +15,9 @@
 
 from enum import Enum
 
+from inference_tools.exceptions.exceptions import SimilaritySearchException
+from inference_tools.similarity.target_aggregation import TargetAggregation
+
 
 class Formula(Enum):
     COSINE = "cosine"
@@ -86,3 +89,69 @@ class Formula(Enum):
             """
         }
         return formulas[self.value]
+
+    def get_aggregated_formula(self, aggregation: TargetAggregation) -> str:
+        """
+        Returns the formula to be used in the script score query of a similarity search-based
+        query with several query vectors, found in params.query_vectors. The score of each
+        query vector is computed as in get_formula, and the scores are aggregated
+        @param aggregation: TargetAggregation.MEAN or TargetAggregation.MAX
+        @type aggregation: TargetAggregation
+        @return: the script source
+        @rtype: str
+        """
+        scores = {
+            "cosine":
+                "double dot = 0; double qm = 0; "
+                "for (int i = 0; i < v.length; i++) { "
+                "   dot += v[i] * q[i]; "
+                "   qm += Math.pow(q[i], 2); "
+                "} "
+                "double s = (dot / (Math.sqrt(qm) * am) + 1.0) / 2; ",
+            "euclidean":
+                "double dist = 0; "
+                "for (int i = 0; i < v.length; i++) { "
+                "   dist += Math.pow(v[i] - q[i], 2); "
+                "} "
+                "double s = 1 / (1 + Math.sqrt(dist)); ",
+            "poincare":
+                "double bm = 0; "
+                "double dist = 0; "
+                "for (int i = 0; i < v.length; i++) { "
+                "   bm += Math.pow(q[i], 2); "
+                "   dist += Math.pow(v[i] - q[i], 2); "
+                "} "
+                "bm = Math.sqrt(bm); "
+                "dist = Math.sqrt(dist); "
+                "double x = 1 + (2 * Math.pow(dist, 2)) / "
+                "   ( (1 - Math.pow(bm, 2)) * (1 - Math.pow(am, 2)) ); "
+                "double s = 1 / (1 + Math.log(x + Math.sqrt(Math.pow(x, 2) - 1))); "
+        }
+
+        if self.value not in scores:
+            raise SimilaritySearchException(
+                f"Aggregating the scores of several targets is not supported "
+                f"for the formula {self.value}"
+            )
+
+        aggregations = {
+            "mean": ("0", "agg += s;", "agg / params.query_vectors.size()"),
+            "max": ("-Double.MAX_VALUE", "agg = Math.max(agg, s);", "agg")
+        }
+
+        if aggregation.value not in aggregations:
+            raise SimilaritySearchException(f"Unsupported score aggregation {aggregation.value}")
+
+        init, update, result = aggregations[aggregation.value]
+
+        return (
+            "if (doc['embedding'].size() == 0) { return 0; } "
+            "float[] v = doc['embedding'].vectorValue; "
+            "double am = doc['embedding'].magnitude; "
+            f"double agg = {init}; "
+            "for (def q : params.query_vectors) { "
+            f"{scores[self.value]}"
+            f"{update} "
+            "} "
+            f"return {result};"
+        )
@@ -0,0 +1,101 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Interning of entity and embedding ids, so that the similarity internals hash and compare dense
+integers rather than long IRIs.
+A table is scoped to one combination of similarity models (see combine_similarity_models): the
+neighbor ids of a call are interned once, and the table is dropped with the call. Tables never
+evict ids, so a table shared within the process would grow with every id ever seen by a
+long-running service
+"""
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class IdInterner:
+    """
+    A table assigning dense integers to ids, in order of first appearance. An id keeps its
+    integer for the lifetime of the table
+    """
+    _codes: Dict[str, int]
+    _ids: List[str]
+
+    def __init__(self):
+        self._codes = {}
+        self._ids = []
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._codes
+
+    def get(self, id_: str) -> Optional[int]:
+        """
+        @param id_: an id
+        @type id_: str
+        @return: the integer of the id, None if the id has not been interned
+        @rtype: Optional[int]
+        """
+        return self._codes.get(id_)
+
+    def intern(self, id_: str) -> int:
+        """
+        @param id_: an id
+        @type id_: str
+        @return: the integer of the id, assigned if the id is seen for the first time
+        @rtype: int
+        """
+        code = self._codes.get(id_)
+        if code is not None:
+            return code
+
+        with self._lock:
+            code = self._codes.get(id_)
+            if code is None:
+                code = len(self._ids)
+                self._ids.append(id_)
+                self._codes[id_] = code
+            return code
+
+    def intern_all(self, ids: Iterable[str]) -> np.ndarray:
+        """
+        @param ids: ids
+        @type ids: Iterable[str]
+        @return: the integers of the ids
+        @rtype: np.ndarray
+        """
+        return np.fromiter((self.intern(id_) for id_ in ids), dtype=np.int64)
+
+    def id(self, code: int) -> str:
+        """
+        @param code: the integer of an interned id
+        @type code: int
+        @return: the id
+        @rtype: str
+        """
+        return self._ids[code]
+
+    def ids(self, codes: Iterable[int]) -> List[str]:
+        """
+        @param codes: the integers of interned ids
+        @type codes: Iterable[int]
+        @return: the ids
+        @rtype: List[str]
+        """
+        return [self._ids[code] for code in codes]
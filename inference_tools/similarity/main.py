@@ -14,22 +14,27 @@
 # limitations under the License.
 
 from collections import defaultdict
-from typing import Callable, List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional, Union
 
+import numpy as np
 from kgforge.core import KnowledgeGraphForge
 
-from inference_tools.datatypes.similarity.embedding import Embedding
+from inference_tools.nexus_utils.forge_session_pool import pooled
+from inference_tools.datatypes.similarity.embedding import Embedding, EmbeddingSet
 from inference_tools.datatypes.similarity.statistic import Statistic
 from inference_tools.exceptions.exceptions import SimilaritySearchException
 from inference_tools.datatypes.similarity.neighbor import Neighbor
 from inference_tools.datatypes.query import SimilaritySearchQuery
 from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
 from inference_tools.exceptions.malformed_rule import MalformedSimilaritySearchQueryException
-from inference_tools.similarity.queries.get_boosting_factor import get_boosting_factor_for_embedding
-from inference_tools.similarity.queries.get_embedding_vector import get_embedding_vector
-from inference_tools.similarity.queries.get_neighbors import get_neighbors
+from inference_tools.similarity.id_interning import IdInterner
+from inference_tools.similarity.queries.get_boosting_factor import get_boosting_factors_for_embeddings
+from inference_tools.similarity.queries.get_embedding_vector import get_embedding_vector, _err_message
+from inference_tools.similarity.queries.get_embeddings_vectors import get_embedding_vectors
+from inference_tools.similarity.queries.get_neighbors import get_neighbors, get_neighbors_two_stage
 from inference_tools.similarity.queries.get_score_stats import get_score_stats
 from inference_tools.similarity.similarity_model_result import SimilarityModelResult
+from inference_tools.similarity.target_aggregation import TargetAggregation
 from inference_tools.datatypes.parameter_specification import ParameterSpecification
 
 SIMILARITY_MODEL_SELECT_PARAMETER_NAME = "SelectModelsParameter"
@@ -61,6 +66,8 @@ def execute_similarity_query(
         List of similarity search results, each element is a resource ID.
     """
 
+    forge_factory = pooled(forge_factory)
+
     target_parameter = query.search_target_parameter
 
     if target_parameter is None:
@@ -111,7 +118,8 @@ def execute_similarity_query(
             result_filter=query.result_filter,
             debug=debug,
             use_resources=use_resources,
-            specified_derivation_type=specified_derivation_type
+            specified_derivation_type=specified_derivation_type,
+            target_aggregation=query.target_aggregation
         )
 
         return [
@@ -132,7 +140,8 @@ def execute_similarity_query(
         result_filter=query.result_filter,
         debug=debug,
         use_resources=use_resources,
-        specified_derivation_type=specified_derivation_type
+        specified_derivation_type=specified_derivation_type,
+        target_aggregation=query.target_aggregation
     )
 
 
@@ -145,8 +154,9 @@ def query_similar_resources(
         result_filter: Optional[str],
         debug: bool,
         use_resources: bool = False,
-        specified_derivation_type: Optional[str] = None
-) -> Tuple[Embedding, List[Tuple[int, Neighbor]]]:
+        specified_derivation_type: Optional[str] = None,
+        target_aggregation: TargetAggregation = TargetAggregation.CENTROID
+) -> Tuple[Union[Embedding, EmbeddingSet], List[Tuple[int, Neighbor]]]:
     """Query similar resources using the similarity query.
 
     Parameters
@@ -171,11 +181,15 @@ def query_similar_resources(
     specified_derivation_type: str
         Optional subtype of the rule's target resource type, specifying only neighbors of this
         subtype should be returned
+    target_aggregation: TargetAggregation
+        If the value of the target parameter is a list of several resource ids, how their
+        embeddings are combined into a single neighbor search
 
     Returns
     -------
-    result :  Tuple[Embedding, Dict[int, Neighbor]]
-        The embedding vector of the resource being queried, as well as a dictionary
+    result :  Tuple[Union[Embedding, EmbeddingSet], Dict[int, Neighbor]]
+        The embedding vector of the resource being queried (or the embeddings of the resources
+        being queried), as well as a dictionary
         with keys being scores and values being a Neighbor object holding
         the resource id that is similar
 
@@ -186,31 +200,98 @@ def query_similar_resources(
         raise SimilaritySearchException(f"Target parameter value is not specified, a value for the"
                                         f"parameter {target_parameter} is necessary")
 
-    embedding = get_embedding_vector(
-        forge, search_target, debug=debug, use_resources=use_resources,
-        derivation_type=config.embedding_model_data_catalog.about,
-        model_name=config.embedding_model_data_catalog.name, view=config.similarity_view.id
-    )
+    if isinstance(search_target, list) and len(search_target) == 1:
+        search_target = search_target[0]
 
-    result: List[Tuple[int, Neighbor]] = get_neighbors(
-        forge=forge, vector_id=embedding.id, vector=embedding.vector,
-        k=k, score_formula=config.embedding_model_data_catalog.distance,
-        result_filter=result_filter, parameters=parameter_values, debug=debug,
-        use_resources=use_resources,
-        derivation_type=config.embedding_model_data_catalog.about,
-        specified_derivation_type=specified_derivation_type,
-        view=config.similarity_view.id
-    )
+    embedding: Union[Embedding, EmbeddingSet]
+
+    if isinstance(search_target, list):
+        embedding = get_embedding_set(
+            forge, search_target, config=config, debug=debug, use_resources=use_resources,
+            target_aggregation=target_aggregation
+        )
+        aggregation = embedding.score_aggregation
+    else:
+        embedding = get_embedding_vector(
+            forge, search_target, debug=debug, use_resources=use_resources,
+            derivation_type=config.embedding_model_data_catalog.about,
+            model_name=config.embedding_model_data_catalog.name, view=config.similarity_view.id
+        )
+        aggregation = None
+
+    if config.candidate_generation is not None and k is not None:
+        result: List[Tuple[int, Neighbor]] = get_neighbors_two_stage(
+            forge=forge, vector_id=embedding.id, vector=embedding.vector,
+            k=k, score_formula=config.embedding_model_data_catalog.distance,
+            candidate_generation=config.candidate_generation,
+            result_filter=result_filter, parameters=parameter_values, debug=debug,
+            use_resources=use_resources,
+            derivation_type=config.embedding_model_data_catalog.about,
+            specified_derivation_type=specified_derivation_type,
+            view=config.similarity_view.id, aggregation=aggregation
+        )
+    else:
+        result = get_neighbors(
+            forge=forge, vector_id=embedding.id, vector=embedding.vector,
+            k=k, score_formula=config.embedding_model_data_catalog.distance,
+            result_filter=result_filter, parameters=parameter_values, debug=debug,
+            use_resources=use_resources,
+            derivation_type=config.embedding_model_data_catalog.about,
+            specified_derivation_type=specified_derivation_type,
+            view=config.similarity_view.id, aggregation=aggregation
+        )
 
     return embedding, result
 
 
+def get_embedding_set(
+        forge: KnowledgeGraphForge, search_targets: List[str],
+        config: SimilaritySearchQueryConfiguration, debug: bool, use_resources: bool,
+        target_aggregation: TargetAggregation
+) -> EmbeddingSet:
+    """
+    Retrieves in a single query the embeddings of several search targets
+    @param forge: a forge instance
+    @type forge: KnowledgeGraphForge
+    @param search_targets: the ids of the resources whose embeddings should be retrieved
+    @type search_targets: List[str]
+    @param config: the query configuration holding the embedding model
+    @type config: SimilaritySearchQueryConfiguration
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @param use_resources: Whether to manipulate Resource objects when getting back ElasticSearch
+    results or not
+    @type use_resources: bool
+    @param target_aggregation: how the embeddings will be combined in the neighbor search
+    @type target_aggregation: TargetAggregation
+    @return: the embeddings of all search targets
+    @rtype: EmbeddingSet
+    @raise SimilaritySearchException if any search target has not been embedded by the model
+    """
+    embeddings = get_embedding_vectors(
+        forge, search_targets=search_targets, debug=debug, use_resources=use_resources,
+        derivation_type=config.embedding_model_data_catalog.about, view=config.similarity_view.id
+    )
+
+    found = set(e.derivation_id for e in embeddings)
+    missing = [target for target in search_targets if target not in found]
+
+    if len(missing) > 0:
+        raise SimilaritySearchException(
+            _err_message(", ".join(missing), config.embedding_model_data_catalog.name)
+        )
+
+    return EmbeddingSet(embeddings, aggregation=target_aggregation)
+
+
 def combine_similarity_models(
         forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
         configurations: List[SimilaritySearchQueryConfiguration],
         parameter_values: Dict, k: int, target_parameter: str,
         result_filter: Optional[str], debug: bool, use_resources: bool,
-        specified_derivation_type: Optional[str] = None
+        specified_derivation_type: Optional[str] = None,
+        target_aggregation: TargetAggregation = TargetAggregation.CENTROID,
+        interner: Optional[IdInterner] = None
 ) -> List[Dict]:
     """
     Perform similarity search combining several similarity models
@@ -235,9 +316,20 @@ def combine_similarity_models(
     @param specified_derivation_type: Optional subtype of the rule's target resource type,
      specifying only neighbors of this subtype should be returned
     @type specified_derivation_type: str
+    @param target_aggregation: If the value of the target parameter is a list of several
+    resource ids, how their embeddings are combined into a single neighbor search per model
+    @type target_aggregation: TargetAggregation
+    @param interner: the table interning the ids of neighbors. Defaults to a table scoped to
+    this call
+    @type interner: Optional[IdInterner]
     @rtype: List[Dict]
     """""
 
+    forge_factory = pooled(forge_factory)
+
+    if interner is None:
+        interner = IdInterner()
+
     # 1. Get neighbors for all models
 
     model_ids = [config_i.embedding_model_data_catalog.id for config_i in configurations]
@@ -257,42 +349,55 @@ def combine_similarity_models(
     #     for config_i in configurations
     # ]
 
-    vector_neighbors_per_model: List[Tuple[Embedding, List[Tuple[int, Neighbor]]]] = [
+    vector_neighbors_per_model: List[
+        Tuple[Union[Embedding, EmbeddingSet], List[Tuple[int, Neighbor]]]
+    ] = [
         query_similar_resources(
             forge=forge_instances[config_i.get_bucket()], config=config_i,
             parameter_values=parameter_values, k=k, target_parameter=target_parameter,
             result_filter=result_filter, debug=debug, use_resources=use_resources,
-            specified_derivation_type=specified_derivation_type
+            specified_derivation_type=specified_derivation_type,
+            target_aggregation=target_aggregation
         )
         for config_i in configurations
     ]
 
-    all_neighbors_across_models = set.union(*[
-        set(n.entity_id for _, n in neighbors) for _, neighbors in vector_neighbors_per_model
-    ])
+    # Neighbors are interned once, and handled as (score, integer) pairs until the results
+    # are built
+    neighbor_codes_per_model = [
+        interner.intern_all(n.entity_id for _, n in neighbors)
+        for _, neighbors in vector_neighbors_per_model
+    ]
 
-    missing_neighbors_per_model = dict(
-        (
-            embedding,
-            all_neighbors_across_models.difference(set(n.entity_id for _, n in neighbors))
-        )
-        for embedding, neighbors in vector_neighbors_per_model
-    )
+    scored_codes_per_model: List[List[Tuple[float, int]]] = [
+        list(zip((score for score, _ in neighbors), codes.tolist()))
+        for (_, neighbors), codes in zip(vector_neighbors_per_model, neighbor_codes_per_model)
+    ]
+
+    all_neighbors_across_models = np.unique(np.concatenate(neighbor_codes_per_model))
+
+    for i, (embedding, _) in enumerate(vector_neighbors_per_model):
+        missing_codes = np.setdiff1d(all_neighbors_across_models, neighbor_codes_per_model[i])
 
-    for i, (embedding, missing_list) in enumerate(missing_neighbors_per_model.items()):
         missing_neighbors: List[Tuple[int, Neighbor]] = get_neighbors(
             forge=forge_instances[configurations[i].get_bucket()],
             vector_id=embedding.id, vector=embedding.vector,
             k=k, score_formula=configurations[i].embedding_model_data_catalog.distance,
             result_filter=result_filter, parameters=parameter_values, debug=debug,
             use_resources=use_resources,
-            restricted_ids=list(missing_list),
+            # The backend is queried by id
+            restricted_ids=interner.ids(missing_codes),
             derivation_type=configurations[i].embedding_model_data_catalog.about,
             specified_derivation_type=specified_derivation_type,
-            view=configurations[i].similarity_view.id
+            view=configurations[i].similarity_view.id,
+            aggregation=embedding.score_aggregation if isinstance(embedding, EmbeddingSet)
+            else None
         )
 
-        vector_neighbors_per_model[i][1].extend(missing_neighbors)
+        scored_codes_per_model[i].extend(zip(
+            (score for score, _ in missing_neighbors),
+            interner.intern_all(n.entity_id for _, n in missing_neighbors).tolist()
+        ))
 
     # 2. Boost/Combine models
 
@@ -300,11 +405,11 @@ def combine_similarity_models(
 
     weights = dict((model_id, equal_contribution) for model_id in model_ids)
 
-    combined_results: Dict[str, Dict] = defaultdict(dict)
+    combined_results: Dict[int, Dict] = defaultdict(dict)
 
     for i, config_i in enumerate(configurations):
 
-        embedding, neighbors = vector_neighbors_per_model[i]
+        embedding, _ = vector_neighbors_per_model[i]
 
         # forge_statistics = config_i.use_factory(forge_factory, sub_view="statistic")
         statistic: Statistic = get_score_stats(
@@ -314,18 +419,20 @@ def combine_similarity_models(
 
         if config_i.boosted:
             # forge_boosting = config_i.use_factory(forge_factory, sub_view="boosting")
-            boosting_factor = get_boosting_factor_for_embedding(
+            embedding_ids = embedding.id if isinstance(embedding, EmbeddingSet) else [embedding.id]
+            boosting_factors = get_boosting_factors_for_embeddings(
                 forge=forge_instances[config_i.get_bucket()], config=config_i, use_resources=use_resources,
-                embedding_id=embedding.id
+                embedding_ids=embedding_ids
             )
-            factor = boosting_factor.value
+            # Multiple search targets are boosted by the mean of their boosting factors
+            factor = sum(b.value for b in boosting_factors) / len(boosting_factors)
         else:
             factor = 1
 
         embedding_model_id = config_i.embedding_model_data_catalog.id
 
-        for score_i, n in neighbors:
-            combined_results[n.entity_id][embedding_model_id] = (
+        for score_i, code in scored_codes_per_model[i]:
+            combined_results[code][embedding_model_id] = (
                 normalize(score_i * factor, statistic.min, statistic.max),
                 weights[embedding_model_id]
             )
@@ -335,24 +442,24 @@ def combine_similarity_models(
 
     combined_results_mean = [
         (
-            entity_id,
+            code,
             sum(score * weight for score, weight in score_dict.values()),
             score_dict
         )
-        for entity_id, score_dict in combined_results.items()
+        for code, score_dict in combined_results.items()
     ]
 
     combined_results_mean.sort(key=lambda row: row[1], reverse=True)
 
     if len(combined_results_mean) > k:
-        combined_results_mean = combined_results_mean[:k - 1]
+        combined_results_mean = combined_results_mean[:k]
 
     return [
         SimilarityModelResult(
-            id=id_, score=score, score_breakdown=score_breakdown
+            id=interner.id(code), score=score, score_breakdown=score_breakdown
         ).to_json()
 
-        for id_, score, score_breakdown in combined_results_mean
+        for code, score, score_breakdown in combined_results_mean
     ]
 
 
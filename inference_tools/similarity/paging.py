@@ -0,0 +1,190 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Paging through similarity search results. The results are computed once to a depth larger than
+a page, and kept under a short-lived cursor from which further pages are served
+"""
+import json
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.datatypes.query import SimilaritySearchQuery
+from inference_tools.similarity.main import execute_similarity_query
+from inference_tools.source.source import DEFAULT_LIMIT
+
+DEFAULT_CURSOR_TTL = 300  # seconds
+DEFAULT_MAX_CURSORS = 1000
+DEFAULT_BUFFER_PAGES = 5
+
+
+class SimilarityCursor:
+    """
+    The buffered results of a similarity search query, computed up to a depth
+    """
+    token: str
+    fingerprint: str
+    depth: int
+    results: List[Dict]
+    expires_at: float
+
+    def __init__(self, token: str, fingerprint: str, depth: int, results: List[Dict],
+                 expires_at: float):
+        self.token = token
+        self.fingerprint = fingerprint
+        self.depth = depth
+        self.results = results
+        self.expires_at = expires_at
+
+    @property
+    def complete(self) -> bool:
+        """
+        @return: whether all results of the query are buffered, because the query returned fewer
+        results than the depth it was ran with
+        @rtype: bool
+        """
+        return len(self.results) < self.depth
+
+
+class CursorStore:
+    """
+    Cursors by token, expiring after a time to live. When the store is full, the cursors closest
+    to expiring are dropped
+    """
+
+    def __init__(self, ttl: float = DEFAULT_CURSOR_TTL, max_cursors: int = DEFAULT_MAX_CURSORS):
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._cursors: OrderedDict[str, SimilarityCursor] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token: str) -> Optional[SimilarityCursor]:
+        """
+        @param token: a cursor token
+        @type token: str
+        @return: the cursor, if it exists and has not expired
+        @rtype: Optional[SimilarityCursor]
+        """
+        with self._lock:
+            self._evict_expired()
+            return self._cursors.get(token)
+
+    def put(self, cursor: SimilarityCursor):
+        """
+        Stores a cursor, extending its expiry
+        @param cursor: the cursor to store
+        @type cursor: SimilarityCursor
+        """
+        with self._lock:
+            cursor.expires_at = time.monotonic() + self.ttl
+            self._cursors[cursor.token] = cursor
+            self._cursors.move_to_end(cursor.token)
+            self._evict_expired()
+            while len(self._cursors) > self.max_cursors:
+                self._cursors.popitem(last=False)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        # Cursors are ordered by expiry, as each put moves its cursor to the end
+        while len(self._cursors) > 0 and next(iter(self._cursors.values())).expires_at <= now:
+            self._cursors.popitem(last=False)
+
+
+cursor_store = CursorStore()
+
+
+def _fingerprint(query: SimilaritySearchQuery, parameter_values: Dict) -> str:
+    return f"{repr(query)}\n{json.dumps(parameter_values, sort_keys=True, default=str)}"
+
+
+def execute_similarity_query_paged(
+        forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge],
+        query: SimilaritySearchQuery, parameter_values: Dict, debug: bool,
+        use_resources: bool, offset: int = 0, page_size: int = DEFAULT_LIMIT,
+        cursor: Optional[str] = None, buffer_pages: int = DEFAULT_BUFFER_PAGES,
+        store: Optional[CursorStore] = None
+) -> Dict:
+    """
+    Returns a page of the results of a similarity search query. The first call computes the
+    results up to a depth of several pages, and returns a cursor token. Calls with this token
+    serve pages from the buffered results, and only recompute the query, with a doubled depth,
+    once a page goes beyond the buffered depth. If the cursor has expired, or was created for a
+    different query or parameter values, the results are computed again.
+
+    @param forge_factory: Factory that returns a forge session given a bucket
+    @type forge_factory: Callable[[str, str, Optional[str], Optional[str]], KnowledgeGraphForge]
+    @param query: the similarity search query
+    @type query: SimilaritySearchQuery
+    @param parameter_values: Input parameters used in the similarity query
+    @type parameter_values: Dict
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @param use_resources: Whether to manipulate Resource objects when getting back ElasticSearch
+    results or not
+    @type use_resources: bool
+    @param offset: the index of the first result of the page
+    @type offset: int
+    @param page_size: the number of results of a page
+    @type page_size: int
+    @param cursor: the cursor token returned by a previous call, if any
+    @type cursor: Optional[str]
+    @param buffer_pages: the number of pages computed ahead when the cursor is created
+    @type buffer_pages: int
+    @param store: where cursors are kept. Defaults to a store shared within the process
+    @type store: Optional[CursorStore]
+    @return: a dictionary with the results of the page ("results"), the cursor token to request
+    further pages with ("cursor"), and the offset of the next page ("nextOffset"), None if this
+    page is the last one
+    @rtype: Dict
+    """
+    store = store or cursor_store
+    fingerprint = _fingerprint(query, parameter_values)
+    end = offset + page_size
+
+    existing = store.get(cursor) if cursor is not None else None
+    if existing is not None and existing.fingerprint != fingerprint:
+        existing = None
+
+    if existing is None:
+        depth = max(end, page_size * buffer_pages)
+        existing = SimilarityCursor(
+            token=secrets.token_urlsafe(16), fingerprint=fingerprint, depth=depth,
+            results=execute_similarity_query(
+                forge_factory=forge_factory, query=query, parameter_values=parameter_values,
+                debug=debug, use_resources=use_resources, limit=depth
+            ),
+            expires_at=0
+        )
+    elif end > len(existing.results) and not existing.complete:
+        # The buffered depth is exhausted
+        existing.depth = max(end, existing.depth * 2)
+        existing.results = execute_similarity_query(
+            forge_factory=forge_factory, query=query, parameter_values=parameter_values,
+            debug=debug, use_resources=use_resources, limit=existing.depth
+        )
+
+    store.put(existing)
+
+    has_next = end < len(existing.results) or not existing.complete
+
+    return {
+        "results": existing.results[offset:end],
+        "cursor": existing.token,
+        "nextOffset": end if has_next else None
+    }
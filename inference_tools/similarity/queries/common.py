@@ -13,10 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+import json
+from typing import Any, Dict, Iterator, List
+
+from kgforge.core import KnowledgeGraphForge
 
 from inference_tools.exceptions.exceptions import SimilaritySearchException
 from inference_tools.helper_functions import get_type_attribute, get_id_attribute
+from inference_tools.source.elastic_search import ElasticSearch
 
 
 def _find_derivation_id(derivation_field: List, type_: str) -> str:
@@ -40,3 +44,36 @@ def _find_derivation_id(derivation_field: List, type_: str) -> str:
         )
 
     return get_id_attribute(el["entity"])
+
+
+def _page_hits(
+        forge: KnowledgeGraphForge, query: Dict[str, Any], view: str, debug: bool
+) -> Iterator[List[Dict]]:
+    """
+    Pages through all the hits of a sorted ElasticSearch query using search_after
+    @param forge: a forge instance
+    @type forge: KnowledgeGraphForge
+    @param query: the query, with a sort. Its size is set to the maximum page size
+    @type query: Dict[str, Any]
+    @param view: the id of the view to query
+    @type view: str
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @return: the successive pages of raw hits
+    @rtype: Iterator[List[Dict]]
+    """
+    query["size"] = ElasticSearch.NO_LIMIT
+
+    while True:
+        hits = forge.elastic(json.dumps(query), limit=None, debug=debug, view=view,
+                             as_resource=False)
+
+        if hits is None:
+            raise SimilaritySearchException(f"Could not retrieve the embeddings of view {view}")
+
+        yield hits
+
+        if len(hits) < ElasticSearch.NO_LIMIT:
+            break
+
+        query["search_after"] = hits[-1]["sort"]
@@ -13,7 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Dict
+from typing import Dict, List
 
 import json
 
@@ -35,12 +35,24 @@ def get_boosting_factor_for_embedding(
 ) -> BoostingFactor:
     """Retrieve boosting factors."""
 
+    return get_boosting_factors_for_embeddings(
+        forge=forge, embedding_ids=[embedding_id], config=config, use_resources=use_resources
+    )[0]
+
+
+def get_boosting_factors_for_embeddings(
+        forge: KnowledgeGraphForge, embedding_ids: List[str],
+        config: SimilaritySearchQueryConfiguration,
+        use_resources: bool
+) -> List[BoostingFactor]:
+    """Retrieve the boosting factors of several embeddings in a single query."""
+
     get_boosting_factors_fc = _get_boosting_factor if use_resources else \
         _get_boosting_factor_json
 
     query = {
         "from": 0,
-        "size": 1,
+        "size": len(embedding_ids),
         "query": {
             "bool": {
                 "must": [
@@ -48,7 +60,9 @@ def get_boosting_factor_for_embedding(
                         "nested": {
                             "path": "derivation.entity",
                             "query": {
-                                "term": {"derivation.entity.@id": embedding_id}
+                                "term": {"derivation.entity.@id": embedding_ids[0]}
+                            } if len(embedding_ids) == 1 else {
+                                "terms": {"derivation.entity.@id": embedding_ids}
                             }
                         }
                     },
@@ -60,26 +74,26 @@ def get_boosting_factor_for_embedding(
         }
     }
 
-    result: Dict = get_boosting_factors_fc(forge, query, config)
+    results: List[Dict] = get_boosting_factors_fc(forge, query, config)
 
-    return BoostingFactor(result)
+    return [BoostingFactor(result) for result in results]
 
 
 def _get_boosting_factor(
         forge: KnowledgeGraphForge, query: Dict, config: SimilaritySearchQueryConfiguration
-) -> Dict:
+) -> List[Dict]:
 
     factor = forge.elastic(json.dumps(query), view=config.boosting_view.id)
 
     if factor is None or len(factor) == 0:
         raise SimilaritySearchException("No boosting factor found")
 
-    return forge.as_json(factor)[0]
+    return forge.as_json(factor)
 
 
 def _get_boosting_factor_json(
         forge: KnowledgeGraphForge, query: Dict, config: SimilaritySearchQueryConfiguration
-) -> Dict:
+) -> List[Dict]:
 
     query["_source"] = [
         "derivation.entity.@id",
@@ -87,22 +101,23 @@ def _get_boosting_factor_json(
         "value"
     ]
 
-    factor = forge.elastic(json.dumps(query), view=config.boosting_view.id, as_resource=False)
+    factors = forge.elastic(json.dumps(query), view=config.boosting_view.id, as_resource=False)
 
-    if factor is None or len(factor) == 0:
+    if factors is None or len(factors) == 0:
         raise SimilaritySearchException("No boosting factor found")
 
-    factor = factor[0]
-
-    return {
-        "value": factor["_source"]["value"],
-        "derivation": {
-            "entity": {
-                "id": _find_derivation_id(
-                    derivation_field=_enforce_list(factor["_source"]["derivation"]),
-                    type_="Embedding"
-                ),
-                "type": "Embedding"
+    return [
+        {
+            "value": factor["_source"]["value"],
+            "derivation": {
+                "entity": {
+                    "id": _find_derivation_id(
+                        derivation_field=_enforce_list(factor["_source"]["derivation"]),
+                        type_="Embedding"
+                    ),
+                    "type": "Embedding"
+                }
             }
         }
-    }
+        for factor in factors
+    ]
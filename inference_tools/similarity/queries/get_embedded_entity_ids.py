@@ -0,0 +1,135 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=R0801
+import json
+
+from typing import Optional, Dict, List, Set
+
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.chunked_execution import execute_chunked
+from inference_tools.helper_functions import _enforce_list
+from inference_tools.similarity.queries.common import _find_derivation_id
+
+_DERIVATION_SOURCE = ["derivation.entity.@id", "derivation.entity.@type"]
+
+
+def get_embedded_entity_ids(
+        forge: KnowledgeGraphForge,
+        search_targets: List[str],
+        debug: bool,
+        derivation_type: str,
+        use_resources: bool,
+        view: Optional[str] = None,
+        chunk_size: Optional[int] = None
+) -> Set[str]:
+    """Get which of the search targets have been embedded, without retrieving the embeddings.
+
+    Parameters
+    ----------
+    forge : KnowledgeGraphForge
+        Instance of a forge session
+    search_targets : List[str]
+        Ids of the resources whose embedding existence is checked
+    debug : bool
+    derivation_type: str in order to retrieve the derivation entity id, its type is needed to
+    filter out the many entities in the derivation
+    use_resources : bool
+    view : Optional[str]
+        an elastic view to use, other than the one set in the forge instance, optional
+    chunk_size : Optional[int]
+        the maximum number of search targets per elastic search query, optional. Chunks are
+        queried concurrently
+    Returns
+    -------
+    ids : Set[str]
+        The subset of search targets for which an embedding exists
+    """
+
+    get_embedded_entity_ids_fc = _get_embedded_entity_ids if use_resources else \
+        _get_embedded_entity_ids_json
+
+    def _get_chunk(search_targets_chunk: List[str]) -> List[str]:
+        existence_query = {
+            "from": 0,
+            "size": len(search_targets_chunk),
+            "_source": _DERIVATION_SOURCE,
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "nested": {
+                                "path": "derivation.entity",
+                                "query": {
+                                    "terms": {"derivation.entity.@id": search_targets_chunk}
+                                }
+                            }
+                        },
+                        {
+                            "term": {
+                                "_deprecated": False
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        return get_embedded_entity_ids_fc(
+            forge=forge, query=existence_query, debug=debug, view=view,
+            derivation_type=derivation_type
+        )
+
+    derivation_ids = execute_chunked(search_targets, _get_chunk, chunk_size=chunk_size)
+
+    return set(derivation_ids).intersection(search_targets)
+
+
+def _get_embedded_entity_ids(
+        forge: KnowledgeGraphForge, query: Dict, debug: bool, derivation_type: str,
+        view: Optional[str] = None
+) -> List[str]:
+
+    result = forge.elastic(json.dumps(query), limit=None, debug=debug, view=view)
+
+    if result is None:
+        return []
+
+    return [
+        _find_derivation_id(
+            derivation_field=_enforce_list(forge.as_json(e)["derivation"]),
+            type_=derivation_type
+        )
+        for e in result
+    ]
+
+
+def _get_embedded_entity_ids_json(
+        forge: KnowledgeGraphForge, query: Dict, debug: bool, derivation_type: str,
+        view: Optional[str] = None
+) -> List[str]:
+
+    result = forge.elastic(json.dumps(query), limit=None, debug=debug, view=view, as_resource=False)
+
+    if result is None:
+        return []
+
+    return [
+        _find_derivation_id(
+            derivation_field=_enforce_list(res["_source"]["derivation"]), type_=derivation_type
+        )
+        for res in result
+    ]
@@ -20,6 +20,7 @@ from typing import Optional, Dict, List
 
 from kgforge.core import KnowledgeGraphForge
 
+from inference_tools.chunked_execution import execute_chunked, order_by
 from inference_tools.datatypes.similarity.embedding import Embedding
 from inference_tools.helper_functions import _enforce_list
 from inference_tools.exceptions.exceptions import SimilaritySearchException
@@ -32,7 +33,8 @@ def get_embedding_vectors(
         debug: bool,
         derivation_type: str,
         use_resources: bool,
-        view: Optional[str] = None
+        view: Optional[str] = None,
+        chunk_size: Optional[int] = None
 ) -> List[Embedding]:
     """Get embedding vector for the target of the input similarity query.
 
@@ -49,56 +51,69 @@ def get_embedding_vectors(
     filter out the many entities in the derivation
     view : Optional[str]
         an elastic view to use, other than the one set in the forge instance, optional
+    chunk_size : Optional[int]
+        the maximum number of search targets per elastic search query, optional. Chunks are
+        queried concurrently
     Returns
     -------
+    embeddings : List[Embedding]
+        the embeddings found, in the order of the search targets
     """
 
-    vector_query = {
-        "from": 0,
-        "size": len(search_targets),
-        "query": {
-            "bool": {
-                "must": [
-                    {
-                        "nested": {
-                            "path": "derivation.entity",
-                            "query": {
-                                "terms": {"derivation.entity.@id": search_targets}
+    get_embedding_vectors_fc = _get_embedding_vectors if use_resources else \
+        _get_embedding_vectors_json
+
+    def _get_chunk(search_targets_chunk: List[str]) -> List[Dict]:
+        vector_query = {
+            "from": 0,
+            "size": len(search_targets_chunk),
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "nested": {
+                                "path": "derivation.entity",
+                                "query": {
+                                    "terms": {"derivation.entity.@id": search_targets_chunk}
+                                }
+                            }
+                        },
+                        {
+                            "term": {
+                                "_deprecated": False
                             }
                         }
-                    },
-                    {
-                        "term": {
-                            "_deprecated": False
-                        }
-                    }
-                ]
+                    ]
+                }
             }
         }
-    }
 
-    get_embedding_vectors_fc = _get_embedding_vectors if use_resources else \
-        _get_embedding_vectors_json
+        return get_embedding_vectors_fc(
+            forge=forge, query=vector_query,
+            debug=debug, view=view,
+            derivation_type=derivation_type
+        )
 
-    results: List[Dict] = get_embedding_vectors_fc(
-        forge=forge, query=vector_query,
-        debug=debug, search_targets=search_targets, view=view,
-        derivation_type=derivation_type
+    results: List[Dict] = execute_chunked(
+        search_targets, _get_chunk, chunk_size=chunk_size,
+        sort_key=order_by(search_targets, key=lambda res: res["derivation"])
     )
 
+    if len(results) == 0:
+        raise SimilaritySearchException(f"No embedding vector for {search_targets}")
+
     return [Embedding(res) for res in results]
 
 
 def _get_embedding_vectors(
-        forge: KnowledgeGraphForge, query: Dict, debug: bool, search_targets: List[str],
-        derivation_type: str,
+        forge: KnowledgeGraphForge, query: Dict, debug: bool, derivation_type: str,
         view: Optional[str] = None
 ) -> List[Dict]:
 
     result = forge.elastic(json.dumps(query), limit=None, debug=debug, view=view)
 
-    if result is None or len(result) == 0:
-        raise SimilaritySearchException(f"No embedding vector for {search_targets}")
+    if result is None:
+        return []
 
     return [
         {
@@ -113,8 +128,7 @@ def _get_embedding_vectors(
 
 
 def _get_embedding_vectors_json(
-        forge: KnowledgeGraphForge, query: Dict, debug: bool, search_targets: List[str],
-        derivation_type: str,
+        forge: KnowledgeGraphForge, query: Dict, debug: bool, derivation_type: str,
         view: Optional[str] = None
 ) -> List[Dict]:
 
@@ -122,8 +136,8 @@ def _get_embedding_vectors_json(
 
     result = forge.elastic(json.dumps(query), limit=None, debug=debug, view=view, as_resource=False)
 
-    if result is None or len(result) == 0:
-        raise SimilaritySearchException(f"No embedding vector for {search_targets}")
+    if result is None:
+        return []
 
     return [{
         "id": res["_id"],
@@ -16,13 +16,16 @@
 import json
 
 from string import Template
-from typing import Optional, List, Dict, Tuple, Any
+from typing import Optional, List, Dict, Tuple, Any, Union
 
 from kgforge.core import KnowledgeGraphForge
 
+from inference_tools.chunked_execution import execute_chunked
+from inference_tools.datatypes.similarity.candidate_generation import CandidateGeneration
 from inference_tools.datatypes.similarity.neighbor import Neighbor
 from inference_tools.helper_functions import _enforce_list
 from inference_tools.similarity.formula import Formula
+from inference_tools.similarity.target_aggregation import TargetAggregation, Vector
 from inference_tools.exceptions.exceptions import SimilaritySearchException
 from inference_tools.similarity.queries.common import _find_derivation_id
 from inference_tools.source.source import DEFAULT_LIMIT
@@ -30,8 +33,8 @@ from inference_tools.source.source import DEFAULT_LIMIT
 
 def get_neighbors(
         forge: KnowledgeGraphForge,
-        vector: List[float],
-        vector_id: str,
+        vector: Union[Vector, List[Vector]],
+        vector_id: Union[str, List[str]],
         debug: bool,
         derivation_type: str,
         k: Optional[int] = DEFAULT_LIMIT,
@@ -41,7 +44,10 @@ def get_neighbors(
         use_resources: bool = False,
         restricted_ids: Optional[List[str]] = None,
         specified_derivation_type=None,
-        view: Optional[str] = None
+        view: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        aggregation: Optional[TargetAggregation] = None,
+        include_deprecated: bool = True
 ) -> List[Tuple[int, Neighbor]]:
     """Get nearest neighbors of the provided vector.
 
@@ -51,9 +57,10 @@ def get_neighbors(
         Instance of a forge session
     k: int
     vector : list
-        Vector to provide into similarity search
-    vector_id : str
-        Id of the embedding resource corresponding to the
+        Vector to provide into similarity search, or list of vectors if an aggregation
+        is specified
+    vector_id : str or list of str
+        Id(s) of the embedding resource(s) corresponding to the
         provided search vector (will be excluded in the
         similarity search).
     score_formula : str, optional
@@ -77,6 +84,17 @@ def get_neighbors(
     in the embedding resource
     specified_derivation_type: str : Optional subtype of derivation_type, if only neighbors of
     this subtype should be returned
+    view: str, optional
+        an elastic view to use, other than the one set in the forge instance
+    chunk_size: int, optional
+        The maximum number of restricted ids per elastic search query. Chunks are queried
+        concurrently and their results merged by score
+    aggregation: TargetAggregation, optional
+        If specified, vector is a list of vectors, and the score of a neighbor is the
+        aggregation of its scores with each vector (mean or max)
+    include_deprecated: bool, optional
+        Whether deprecated embeddings can be neighbors (default). If not, they are filtered out
+        by the query, else it is up to the view to index them or not
 
     Returns
     -------
@@ -85,71 +103,102 @@ def get_neighbors(
         score and the corresponding resource (json representation of the resource).
     """
 
-    similarity_query: Dict[str, Any] = {
-        "from": 0,
-        "size": k,
-        "query": {
-            "script_score": {
-                "query": {
-                    "bool": {
-                        "must_not": {
-                            "term": {"@id": vector_id}
-                        },
-                        "must": [{
-                            "exists": {"field": "embedding"}
-                        }]
-                    }
-                },
-                "script": {
-                    "source": score_formula.get_formula(),
-                    "params": {
-                        "query_vector": vector
+    def _build_query(restricted_ids_chunk: Optional[List[str]]) -> Dict[str, Any]:
+        similarity_query: Dict[str, Any] = {
+            "from": 0,
+            "size": k,
+            "query": {
+                "script_score": {
+                    "query": {
+                        "bool": {
+                            "must_not": {
+                                "term": {"@id": vector_id}
+                            } if not isinstance(vector_id, list) else {
+                                "terms": {"@id": vector_id}
+                            },
+                            "must": [{
+                                "exists": {"field": "embedding"}
+                            }]
+                        }
+                    },
+                    "script": {
+                        "source": score_formula.get_formula(),
+                        "params": {
+                            "query_vector": vector
+                        }
+                    } if aggregation is None else {
+                        "source": score_formula.get_aggregated_formula(aggregation),
+                        "params": {
+                            "query_vectors": vector
+                        }
                     }
                 }
             }
         }
-    }
 
-    if specified_derivation_type:  # If only a subtype of derivation_type can be a neighbor
-        similarity_query["query"]["script_score"]["query"]["bool"]["must"].append(
-            {
-                "nested": {
-                    "path": "derivation.entity",
-                    "query": {
-                        "term": {"derivation.entity.@type": specified_derivation_type}
+        if not include_deprecated:
+            similarity_query["query"]["script_score"]["query"]["bool"]["must"].append(
+                {"term": {"_deprecated": False}}
+            )
+
+        if specified_derivation_type:  # If only a subtype of derivation_type can be a neighbor
+            similarity_query["query"]["script_score"]["query"]["bool"]["must"].append(
+                {
+                    "nested": {
+                        "path": "derivation.entity",
+                        "query": {
+                            "term": {"derivation.entity.@type": specified_derivation_type}
+                        }
                     }
                 }
-            }
-        )
-    else:
-        specified_derivation_type = derivation_type
-
-    if restricted_ids is not None:
-        # Used to retrieve the distance between the provided embedding's source resource
-        # and this specific set of resources
-        similarity_query["query"]["script_score"]["query"]["bool"]["must"].append(
-            {
-                "nested": {
-                    "path": "derivation.entity",
-                    "query": {
-                        "terms": {"derivation.entity.@id": restricted_ids}
+            )
+
+        if restricted_ids_chunk is not None:
+            # Used to retrieve the distance between the provided embedding's source resource
+            # and this specific set of resources
+            similarity_query["query"]["script_score"]["query"]["bool"]["must"].append(
+                {
+                    "nested": {
+                        "path": "derivation.entity",
+                        "query": {
+                            "terms": {"derivation.entity.@id": restricted_ids_chunk}
+                        }
                     }
                 }
-            }
-        )
+            )
+
+        if result_filter:
+            similarity_query["query"]["script_score"]["query"]["bool"].update(
+                json.loads(formatted_result_filter)
+            )
 
-    if result_filter:
-        if parameters:
-            result_filter = Template(result_filter).substitute(parameters)
+        return similarity_query
 
-        similarity_query["query"]["script_score"]["query"]["bool"].update(json.loads(result_filter))
+    formatted_result_filter = Template(result_filter).substitute(parameters) \
+        if result_filter and parameters else result_filter
 
     get_neighbors_fc = _get_neighbors if use_resources else _get_neighbors_json
 
-    return get_neighbors_fc(
-        forge, similarity_query, debug=debug,
-        derivation_type=specified_derivation_type, view=view
-    )
+    def _run(restricted_ids_chunk: Optional[List[str]]) -> List[Tuple[int, Neighbor]]:
+        return get_neighbors_fc(
+            forge, _build_query(restricted_ids_chunk), debug=debug,
+            derivation_type=specified_derivation_type or derivation_type, view=view
+        )
+
+    if restricted_ids is None:
+        neighbors = _run(None)
+    elif len(restricted_ids) == 0:
+        return []
+    else:
+        # Restricted ids are split into several terms queries, whose top k are merged
+        neighbors = execute_chunked(
+            restricted_ids, _run, chunk_size=chunk_size, sort_key=lambda n: -n[0]
+        )[:k]
+
+    if len(neighbors) == 0:
+        raise SimilaritySearchException("Getting neighbors failed")
+
+    return neighbors
 
 
 def _get_neighbors(
@@ -159,8 +208,8 @@ def _get_neighbors(
 
     run = forge.elastic(json.dumps(similarity_query), limit=None, debug=debug, view=view)
 
-    if run is None or len(run) == 0:
-        raise SimilaritySearchException("Getting neighbors failed")
+    if run is None:
+        return []
     return [
         (
             el._store_metadata._score,
@@ -186,8 +235,8 @@ def _get_neighbors_json(
         json.dumps(similarity_query), limit=None, debug=debug, view=view, as_resource=False
     )
 
-    if run is None or len(run) == 0:
-        raise SimilaritySearchException("Getting neighbors failed")
+    if run is None:
+        return []
 
     return [
         (e["_score"], Neighbor(
@@ -197,3 +246,58 @@ def _get_neighbors_json(
         ))
         for e in run
     ]
+
+
+def get_neighbors_two_stage(
+        forge: KnowledgeGraphForge,
+        vector: Union[Vector, List[Vector]],
+        vector_id: Union[str, List[str]],
+        debug: bool,
+        derivation_type: str,
+        candidate_generation: CandidateGeneration,
+        k: int = DEFAULT_LIMIT,
+        score_formula: Formula = Formula.EUCLIDEAN,
+        result_filter=None,
+        parameters=None,
+        use_resources: bool = False,
+        specified_derivation_type=None,
+        view: Optional[str] = None,
+        aggregation: Optional[TargetAggregation] = None
+) -> List[Tuple[int, Neighbor]]:
+    """Get nearest neighbors of the provided vector in two stages.
+
+    The first stage retrieves candidate_generation.factor * k candidates among the whole
+    population using the cheap formula of the candidate generation. The second stage rescores
+    these candidates only, with the score formula, and keeps the top k. The cost of the score
+    formula therefore doesn't depend on the size of the population.
+
+    Parameters
+    ----------
+    candidate_generation: CandidateGeneration
+        The formula and factor to use to retrieve candidates
+    Other parameters are the ones of get_neighbors
+
+    Returns
+    -------
+    result : list of tuples
+        List of similarity search results, each element is a tuple with the
+        score (computed with score_formula) and the corresponding neighbor.
+    """
+    candidates = get_neighbors(
+        forge=forge, vector=vector, vector_id=vector_id, debug=debug,
+        derivation_type=derivation_type, k=candidate_generation.factor * k,
+        score_formula=candidate_generation.formula, result_filter=result_filter,
+        parameters=parameters, use_resources=use_resources,
+        specified_derivation_type=specified_derivation_type, view=view, aggregation=aggregation
+    )
+
+    if candidate_generation.formula == score_formula:
+        return candidates[:k]
+
+    return get_neighbors(
+        forge=forge, vector=vector, vector_id=vector_id, debug=debug,
+        derivation_type=derivation_type, k=k, score_formula=score_formula,
+        result_filter=result_filter, parameters=parameters, use_resources=use_resources,
+        restricted_ids=[n.entity_id for _, n in candidates],
+        specified_derivation_type=specified_derivation_type, view=view, aggregation=aggregation
+    )
@@ -0,0 +1,171 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Brute-force neighbor search over an embedding snapshot, split into row shards that are scored
+in parallel by a persistent pool of processes. The embedding matrix is written once to a memory
+mapped file, that all processes map instead of receiving a copy of it
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from inference_tools.datatypes.similarity.neighbor import Neighbor
+from inference_tools.helper_functions import _enforce_list
+from inference_tools.similarity.formula import Formula
+from inference_tools.similarity.snapshot import (
+    DEFAULT_PREFILTER_RATIO,
+    EmbeddingSnapshot,
+    _as_array,
+    score_rows,
+    top_k
+)
+from inference_tools.similarity.target_aggregation import TargetAggregation, Vector
+
+# The embedding matrix and norms mapped by a worker process
+_worker_data: Dict[str, np.ndarray] = {}
+
+
+def _init_worker(directory: str, shape: Tuple[int, int]):
+    _worker_data["vectors"] = np.memmap(
+        os.path.join(directory, "vectors"), dtype=np.float32, mode="r", shape=shape
+    )
+    _worker_data["norms"] = np.memmap(
+        os.path.join(directory, "norms"), dtype=np.float32, mode="r", shape=(shape[0],)
+    )
+
+
+def _search_shard(
+        start: int, end: int, bitmap: np.ndarray, query_vectors: List[np.ndarray],
+        score_formula: Formula, aggregation: Optional[TargetAggregation], k: Optional[int],
+        prefilter_ratio: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs in a worker process, scoring the rows of a shard passing the filters
+    @return: the scores of the local top-k rows of the shard, and the indices of these rows
+    in the embedding matrix
+    @rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    selected = np.flatnonzero(np.unpackbits(bitmap, count=end - start))
+
+    if len(selected) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    scores = score_rows(
+        _worker_data["vectors"][start:end], _worker_data["norms"][start:end], selected,
+        query_vectors, score_formula, aggregation, prefilter_ratio
+    )
+    top = top_k(scores, k)
+
+    return scores[top], selected[top] + start
+
+
+class ShardedSearchEngine:
+    """
+    Serves the neighbor searches of a snapshot with a pool of processes, each shard of rows
+    returning its local top-k, merged into the global top-k. The filters of a search are
+    resolved on the snapshot's bitmaps before being sent to the shards.
+    The engine holds processes and a temporary file until it is closed
+    """
+    snapshot: EmbeddingSnapshot
+    shards: List[Tuple[int, int]]
+
+    def __init__(
+            self, snapshot: EmbeddingSnapshot, shard_count: Optional[int] = None,
+            max_workers: Optional[int] = None
+    ):
+        self.snapshot = snapshot
+
+        workers = max_workers or os.cpu_count() or 1
+        count = len(snapshot)
+        shard_count = max(1, min(shard_count or workers, count))
+        bounds = np.linspace(0, count, shard_count + 1).astype(int)
+        self.shards = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        self._directory = tempfile.mkdtemp(prefix="embedding_shards_")
+        vectors = snapshot.vectors.astype(np.float32, copy=False)
+        vectors.tofile(os.path.join(self._directory, "vectors"))
+        snapshot.norms.astype(np.float32).tofile(os.path.join(self._directory, "norms"))
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(self._directory, vectors.shape)
+        )
+
+    @property
+    def keyword_field(self) -> Optional[str]:
+        """
+        @return: the keyword field of the snapshot, that result filters can be applied on
+        @rtype: Optional[str]
+        """
+        return self.snapshot.keyword_field
+
+    def search(
+            self, vector: Union[Vector, List[Vector]], vector_id: Union[str, List[str]],
+            k: Optional[int], score_formula: Formula,
+            specified_derivation_type: Optional[str] = None,
+            keyword_values: Optional[List[str]] = None,
+            restricted_ids: Optional[List[str]] = None,
+            aggregation: Optional[TargetAggregation] = None,
+            prefilter_ratio: float = DEFAULT_PREFILTER_RATIO,
+            include_deprecated: bool = True
+    ) -> List[Tuple[float, Neighbor]]:
+        """
+        Same as EmbeddingSnapshot.search, with the shards being scored in parallel
+        @return: the neighbors and their scores, by decreasing score
+        @rtype: List[Tuple[float, Neighbor]]
+        """
+        mask = self.snapshot.filter_mask(
+            vector_id=vector_id, specified_derivation_type=specified_derivation_type,
+            keyword_values=keyword_values, restricted_ids=restricted_ids,
+            include_deprecated=include_deprecated
+        )
+
+        if not mask.any():
+            return []
+
+        query_vectors: List = [vector] if aggregation is None else _enforce_list(vector)
+        query_arrays = [_as_array(q) for q in query_vectors]
+
+        futures = [
+            self._pool.submit(
+                _search_shard, start, end, np.packbits(mask[start:end]), query_arrays,
+                score_formula, aggregation, k, prefilter_ratio
+            )
+            for start, end in self.shards if mask[start:end].any()
+        ]
+
+        results = [f.result() for f in futures]
+        scores = np.concatenate([r[0] for r in results])
+        rows = np.concatenate([r[1] for r in results])
+
+        return [
+            (float(scores[i]), Neighbor(self.snapshot.entity_ids[rows[i]]))
+            for i in top_k(scores, k)
+        ]
+
+    def close(self):
+        """Stops the worker processes and removes the memory mapped file"""
+        self._pool.shutdown(wait=True)
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
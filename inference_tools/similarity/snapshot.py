@@ -0,0 +1,490 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+In-memory snapshot of the embeddings of a similarity view, used to run neighbor searches locally.
+Alongside the embedding vectors, the snapshot holds attribute columns (derivation types,
+a selected keyword field, the deprecated flag) as bitmaps, so that the filters of a neighbor
+search can be applied before top-k selection without querying ElasticSearch
+"""
+import json
+from string import Template
+from typing import Any, Dict, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
+from inference_tools.datatypes.similarity.neighbor import Neighbor
+from inference_tools.exceptions.exceptions import SimilaritySearchException
+from inference_tools.helper_functions import _enforce_list, get_id_attribute, get_type_attribute
+from inference_tools.similarity.formula import Formula
+from inference_tools.similarity.queries.common import _find_derivation_id, _page_hits
+from inference_tools.similarity.queries.get_neighbors import get_neighbors
+from inference_tools.similarity.target_aggregation import TargetAggregation, Vector, _decode
+from inference_tools.source.source import DEFAULT_LIMIT
+
+if TYPE_CHECKING:
+    from inference_tools.similarity.sharded_search import ShardedSearchEngine
+
+# Below this proportion of rows passing the filters, only the rows passing the filters are scored,
+# else all rows are scored and the ones not passing the filters are discarded before top-k selection
+DEFAULT_PREFILTER_RATIO = 0.2
+
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask)
+
+
+def _unpack(bitmap: np.ndarray, count: int) -> np.ndarray:
+    return np.unpackbits(bitmap, count=count).astype(bool)
+
+
+def _as_array(vector: Vector) -> np.ndarray:
+    return np.asarray(_decode(vector) if isinstance(vector, str) else vector, dtype=np.float32)
+
+
+def _get_path(obj: Dict, path: str) -> List:
+    values = [obj]
+    for key in path.split("."):
+        values = [
+            v for value in values if isinstance(value, dict) and key in value
+            for v in _enforce_list(value[key])
+        ]
+    return values
+
+
+class EmbeddingSnapshot:
+    """
+    The embeddings of a similarity view at a point in time. Row i of the vector matrix is the
+    embedding of the entity entity_ids[i]. Attribute bitmaps are packed boolean arrays over rows
+    """
+    entity_ids: List[str]
+    embedding_ids: List[str]
+    vectors: np.ndarray
+    norms: np.ndarray
+    keyword_field: Optional[str]
+    type_bitmaps: Dict[str, np.ndarray]
+    keyword_bitmaps: Dict[str, np.ndarray]
+    deprecated_bitmap: np.ndarray
+
+    def __init__(
+            self, entity_ids: List[str], embedding_ids: List[str], vectors: List[Vector],
+            types: List[List[str]], deprecated: List[bool], keyword_field: Optional[str] = None,
+            keywords: Optional[List[List[str]]] = None
+    ):
+        self.entity_ids = entity_ids
+        self.embedding_ids = embedding_ids
+        self.vectors = np.stack([_as_array(v) for v in vectors]) if len(vectors) > 0 \
+            else np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.linalg.norm(self.vectors, axis=1)
+        self.keyword_field = keyword_field
+
+        self.type_bitmaps = EmbeddingSnapshot._bitmaps(types, len(entity_ids))
+        self.keyword_bitmaps = EmbeddingSnapshot._bitmaps(
+            keywords or [[] for _ in entity_ids], len(entity_ids)
+        )
+        self.deprecated_bitmap = _pack(np.asarray(deprecated, dtype=bool))
+        self._embedding_rows = dict((e_id, i) for i, e_id in enumerate(embedding_ids))
+        self._entity_rows: Dict[str, List[int]] = {}
+        for i, entity_id in enumerate(entity_ids):
+            self._entity_rows.setdefault(entity_id, []).append(i)
+
+    @staticmethod
+    def _bitmaps(values_per_row: List[List[str]], count: int) -> Dict[str, np.ndarray]:
+        rows_per_value: Dict[str, List[int]] = {}
+        for i, values in enumerate(values_per_row):
+            for value in values:
+                rows_per_value.setdefault(value, []).append(i)
+
+        bitmaps = {}
+        for value, rows in rows_per_value.items():
+            mask = np.zeros(count, dtype=bool)
+            mask[rows] = True
+            bitmaps[value] = _pack(mask)
+        return bitmaps
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    def filter_bitmap(
+            self, derivation_type: Optional[str] = None,
+            keyword_values: Optional[List[str]] = None,
+            include_deprecated: bool = True
+    ) -> np.ndarray:
+        """
+        Combines the attribute bitmaps into the bitmap of the rows passing all filters
+        @param derivation_type: if specified, only rows with this derivation type pass
+        @type derivation_type: Optional[str]
+        @param keyword_values: if specified, only rows whose keyword field has one of these values
+        pass
+        @type keyword_values: Optional[List[str]]
+        @param include_deprecated: whether deprecated rows pass
+        @type include_deprecated: bool
+        @return: the packed bitmap of the rows passing the filters
+        @rtype: np.ndarray
+        """
+        empty = np.zeros_like(self.deprecated_bitmap)
+        bitmap = np.full_like(self.deprecated_bitmap, 255)
+
+        if not include_deprecated:
+            bitmap &= ~self.deprecated_bitmap
+
+        if derivation_type is not None:
+            bitmap &= self.type_bitmaps.get(derivation_type, empty)
+
+        if keyword_values is not None:
+            keyword_bitmap = empty.copy()
+            for value in keyword_values:
+                keyword_bitmap |= self.keyword_bitmaps.get(value, empty)
+            bitmap &= keyword_bitmap
+
+        return bitmap
+
+    def search(
+            self, vector: Union[Vector, List[Vector]], vector_id: Union[str, List[str]],
+            k: Optional[int], score_formula: Formula,
+            specified_derivation_type: Optional[str] = None,
+            keyword_values: Optional[List[str]] = None,
+            restricted_ids: Optional[List[str]] = None,
+            aggregation: Optional[TargetAggregation] = None,
+            prefilter_ratio: float = DEFAULT_PREFILTER_RATIO,
+            include_deprecated: bool = True
+    ) -> List[Tuple[float, Neighbor]]:
+        """
+        Local equivalent of get_neighbors, scoring the rows of the snapshot as the score formulas
+        of the similarity search queries do
+        @param vector: the query vector, or list of query vectors if an aggregation is specified
+        @type vector: Union[Vector, List[Vector]]
+        @param vector_id: the id(s) of the embedding(s) of the query vector(s), excluded from the
+        neighbors
+        @type vector_id: Union[str, List[str]]
+        @param k: the number of neighbors to return, all neighbors if None
+        @type k: Optional[int]
+        @param score_formula: the formula used to compute scores
+        @type score_formula: Formula
+        @param specified_derivation_type: if specified, only neighbors of this type are returned
+        @type specified_derivation_type: Optional[str]
+        @param keyword_values: if specified, only neighbors whose keyword field has one of these
+        values are returned
+        @type keyword_values: Optional[List[str]]
+        @param restricted_ids: if specified, only these entities are scored
+        @type restricted_ids: Optional[List[str]]
+        @param aggregation: how the scores with each query vector are aggregated, if several
+        query vectors are provided
+        @type aggregation: Optional[TargetAggregation]
+        @param prefilter_ratio: the proportion of rows passing the filters below which only
+        these rows are scored
+        @type prefilter_ratio: float
+        @param include_deprecated: whether deprecated embeddings can be neighbors
+        @type include_deprecated: bool
+        @return: the neighbors and their scores, by decreasing score
+        @rtype: List[Tuple[float, Neighbor]]
+        """
+        mask = self.filter_mask(
+            vector_id=vector_id, specified_derivation_type=specified_derivation_type,
+            keyword_values=keyword_values, restricted_ids=restricted_ids,
+            include_deprecated=include_deprecated
+        )
+        selected = np.flatnonzero(mask)
+
+        if len(selected) == 0:
+            return []
+
+        query_vectors: List = [vector] if aggregation is None else _enforce_list(vector)
+
+        scores = score_rows(
+            self.vectors, self.norms, selected, [_as_array(q) for q in query_vectors],
+            score_formula, aggregation, prefilter_ratio
+        )
+
+        return [
+            (float(scores[i]), Neighbor(self.entity_ids[selected[i]])) for i in top_k(scores, k)
+        ]
+
+    def filter_mask(
+            self, vector_id: Union[str, List[str]],
+            specified_derivation_type: Optional[str] = None,
+            keyword_values: Optional[List[str]] = None,
+            restricted_ids: Optional[List[str]] = None,
+            include_deprecated: bool = True
+    ) -> np.ndarray:
+        """
+        @return: the boolean mask of the rows that can be neighbors in a search, given its filters
+        (see search)
+        @rtype: np.ndarray
+        """
+        count = len(self)
+        mask = _unpack(
+            self.filter_bitmap(
+                derivation_type=specified_derivation_type, keyword_values=keyword_values,
+                include_deprecated=include_deprecated
+            ), count
+        )
+
+        if restricted_ids is not None:
+            restricted = np.zeros(count, dtype=bool)
+            restricted[[r for e_id in restricted_ids for r in self._entity_rows.get(e_id, [])]] = True
+            mask &= restricted
+
+        for e_id in _enforce_list(vector_id):
+            if e_id in self._embedding_rows:
+                mask[self._embedding_rows[e_id]] = False
+
+        return mask
+
+
+def score_rows(
+        vectors: np.ndarray, norms: np.ndarray, selected: np.ndarray,
+        query_vectors: List[np.ndarray], score_formula: Formula,
+        aggregation: Optional[TargetAggregation], prefilter_ratio: float = DEFAULT_PREFILTER_RATIO
+) -> np.ndarray:
+    """
+    Scores some rows of an embedding matrix against one or several query vectors
+    @param vectors: the embedding matrix
+    @type vectors: np.ndarray
+    @param norms: the norms of the rows of the embedding matrix
+    @type norms: np.ndarray
+    @param selected: the indices of the rows to score
+    @type selected: np.ndarray
+    @param query_vectors: the query vectors
+    @type query_vectors: List[np.ndarray]
+    @param score_formula: the formula used to compute scores
+    @type score_formula: Formula
+    @param aggregation: how the scores with each query vector are aggregated
+    @type aggregation: Optional[TargetAggregation]
+    @param prefilter_ratio: the proportion of selected rows below which only these rows are
+    scored
+    @type prefilter_ratio: float
+    @return: the scores of the selected rows
+    @rtype: np.ndarray
+    """
+    if len(selected) <= prefilter_ratio * len(vectors):
+        # Pre-filter: only gather and score the selected rows
+        gathered, gathered_norms = vectors[selected], norms[selected]
+        all_scores = np.stack([
+            _formula_scores(gathered, gathered_norms, q, score_formula) for q in query_vectors
+        ])
+    else:
+        # Post-filter: score all rows without copying them, then keep the selected ones
+        all_scores = np.stack([
+            _formula_scores(vectors, norms, q, score_formula)[selected] for q in query_vectors
+        ])
+
+    if aggregation == TargetAggregation.MAX:
+        return all_scores.max(axis=0)
+    return all_scores.mean(axis=0)
+
+
+def top_k(scores: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """
+    @param scores: scores
+    @type scores: np.ndarray
+    @param k: the number of indices to return, all if None
+    @type k: Optional[int]
+    @return: the indices of the k highest scores, by decreasing score
+    @rtype: np.ndarray
+    """
+    if k is not None and k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+    return np.argsort(-scores, kind="stable")
+
+
+def _formula_scores(
+        vectors: np.ndarray, norms: np.ndarray, query_vector: np.ndarray, score_formula: Formula
+) -> np.ndarray:
+    """
+    Computes the similarity scores of the formulas of Formula.get_formula
+    """
+    if score_formula == Formula.COSINE:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d = vectors @ query_vector / (norms * np.linalg.norm(query_vector))
+        return np.nan_to_num((d + 1.0) / 2)
+
+    if score_formula == Formula.CUSTOM_TMD:
+        return 1 / (1 + np.abs(vectors - query_vector).sum(axis=1))
+
+    dist = np.linalg.norm(vectors - query_vector, axis=1)
+
+    if score_formula == Formula.EUCLIDEAN:
+        return 1 / (1 + dist)
+
+    if score_formula == Formula.POINCARE:
+        bm = np.linalg.norm(query_vector)
+        x = 1 + (2 * dist ** 2) / ((1 - bm ** 2) * (1 - norms ** 2))
+        return 1 / (1 + np.arccosh(x))
+
+    raise SimilaritySearchException(f"Unsupported formula {score_formula.value} for local search")
+
+
+def parse_result_filter(
+        result_filter: Optional[str], parameters: Optional[Dict], keyword_field: Optional[str]
+) -> Tuple[bool, Optional[List[str]]]:
+    """
+    Translates the result filter of a similarity search query into keyword values of a snapshot.
+    Only term and terms clauses on the keyword field of the snapshot, under must or filter,
+    are supported
+    @param result_filter: the result filter of the similarity search query
+    @type result_filter: Optional[str]
+    @param parameters: the parameter values to format the result filter with
+    @type parameters: Optional[Dict]
+    @param keyword_field: the keyword field of the snapshot
+    @type keyword_field: Optional[str]
+    @return: whether the result filter can be applied locally, and if so the keyword values
+    neighbors should have (None if unrestricted)
+    @rtype: Tuple[bool, Optional[List[str]]]
+    """
+    if not result_filter:
+        return True, None
+
+    formatted = Template(result_filter).substitute(parameters) if parameters else result_filter
+
+    try:
+        filter_dict = json.loads(formatted)
+    except json.JSONDecodeError:
+        return False, None
+
+    if not isinstance(filter_dict, dict) or not set(filter_dict.keys()).issubset({"must", "filter"}):
+        return False, None
+
+    values: Optional[Set[str]] = None
+
+    for clause in [c for clauses in filter_dict.values() for c in _enforce_list(clauses)]:
+        if not isinstance(clause, dict) or len(clause) != 1:
+            return False, None
+
+        clause_type, body = next(iter(clause.items()))
+
+        if clause_type not in ("term", "terms") or not isinstance(body, dict) \
+                or list(body.keys()) != [keyword_field]:
+            return False, None
+
+        value = body[keyword_field]
+        if clause_type == "term":
+            value = value.get("value") if isinstance(value, dict) else value
+
+        clause_values = set(str(v) for v in _enforce_list(value))
+        values = clause_values if values is None else values.intersection(clause_values)
+
+    return True, sorted(values) if values is not None else None
+
+
+def get_neighbors_local(
+        snapshot: Union[EmbeddingSnapshot, "ShardedSearchEngine"],
+        forge: KnowledgeGraphForge,
+        vector: Union[Vector, List[Vector]],
+        vector_id: Union[str, List[str]],
+        debug: bool,
+        derivation_type: str,
+        k: Optional[int] = DEFAULT_LIMIT,
+        score_formula: Formula = Formula.EUCLIDEAN,
+        result_filter=None,
+        parameters=None,
+        use_resources: bool = False,
+        restricted_ids: Optional[List[str]] = None,
+        specified_derivation_type=None,
+        view: Optional[str] = None,
+        aggregation: Optional[TargetAggregation] = None,
+        include_deprecated: bool = True
+) -> List[Tuple[float, Neighbor]]:
+    """
+    Same contract as get_neighbors, answered from a snapshot when its result filter can be
+    applied locally, else by ElasticSearch
+    @param snapshot: the snapshot of the embeddings of the similarity view, or a sharded search
+    engine serving it
+    @type snapshot: Union[EmbeddingSnapshot, ShardedSearchEngine]
+    @return: the neighbors and their scores, by decreasing score
+    @rtype: List[Tuple[float, Neighbor]]
+    """
+    supported, keyword_values = parse_result_filter(
+        result_filter, parameters, snapshot.keyword_field
+    )
+
+    if not supported:
+        if debug:
+            print("Result filter cannot be applied to the snapshot, querying ElasticSearch")
+
+        es_neighbors: List[Tuple[float, Neighbor]] = list(get_neighbors(
+            forge=forge, vector=vector, vector_id=vector_id, debug=debug,
+            derivation_type=derivation_type, k=k, score_formula=score_formula,
+            result_filter=result_filter, parameters=parameters, use_resources=use_resources,
+            restricted_ids=restricted_ids, specified_derivation_type=specified_derivation_type,
+            view=view, aggregation=aggregation, include_deprecated=include_deprecated
+        ))
+        return es_neighbors
+
+    if restricted_ids is not None and len(restricted_ids) == 0:
+        return []
+
+    neighbors = snapshot.search(
+        vector=vector, vector_id=vector_id, k=k, score_formula=score_formula,
+        specified_derivation_type=specified_derivation_type, keyword_values=keyword_values,
+        restricted_ids=restricted_ids, aggregation=aggregation,
+        include_deprecated=include_deprecated
+    )
+
+    if len(neighbors) == 0:
+        raise SimilaritySearchException("Getting neighbors failed")
+
+    return neighbors
+
+
+def build_embedding_snapshot(
+        forge: KnowledgeGraphForge, config: SimilaritySearchQueryConfiguration,
+        keyword_field: Optional[str] = None, debug: bool = False
+) -> EmbeddingSnapshot:
+    """
+    Pages through all the embeddings of the similarity view of a query configuration
+    to build a snapshot
+    @param forge: a forge instance tied to the bucket of the similarity view
+    @type forge: KnowledgeGraphForge
+    @param config: the query configuration holding the similarity view and embedding model
+    @type config: SimilaritySearchQueryConfiguration
+    @param keyword_field: the path of a keyword field of the embeddings to build a bitmap
+    column for, so that result filters on this field can be applied locally
+    @type keyword_field: Optional[str]
+    @param debug: Whether to print the queries being executed or not
+    @type debug: bool
+    @return: the snapshot
+    @rtype: EmbeddingSnapshot
+    """
+    view = config.similarity_view.id
+    derivation_type = config.embedding_model_data_catalog.about
+
+    query: Dict[str, Any] = {
+        "_source": ["@id", "derivation", "embedding", "_deprecated"] + (
+            [keyword_field] if keyword_field else []
+        ),
+        "sort": [{"@id": "asc"}],
+        "query": {"bool": {"must": [{"exists": {"field": "embedding"}}]}}
+    }
+
+    entity_ids, embedding_ids, vectors, types, deprecated, keywords = [], [], [], [], [], []
+
+    for hits in _page_hits(forge=forge, query=query, view=view, debug=debug):
+        for hit in hits:
+            source = hit["_source"]
+            derivations = _enforce_list(source["derivation"])
+            entity_ids.append(_find_derivation_id(derivation_field=derivations, type_=derivation_type))
+            embedding_ids.append(get_id_attribute(source))
+            vectors.append(source["embedding"])
+            types.append([t for d in derivations for t in _enforce_list(get_type_attribute(d["entity"]))])
+            deprecated.append(source.get("_deprecated", False))
+            keywords.append([str(v) for v in _get_path(source, keyword_field)] if keyword_field else [])
+
+    return EmbeddingSnapshot(
+        entity_ids=entity_ids, embedding_ids=embedding_ids, vectors=vectors, types=types,
+        deprecated=deprecated, keyword_field=keyword_field, keywords=keywords
+    )
@@ -0,0 +1,68 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import struct
+from enum import Enum
+from typing import List, Union
+
+from inference_tools.exceptions.exceptions import SimilaritySearchException
+
+Vector = Union[List[float], str]
+
+
+class TargetAggregation(Enum):
+    """
+    How the embeddings of several search targets are combined in a single neighbor search
+    - centroid: the neighbors of the mean of the target embeddings are searched for
+    - mean: the score of a neighbor is the mean of its scores with each target embedding
+    - max: the score of a neighbor is the maximum of its scores with each target embedding
+    """
+    CENTROID = "centroid"
+    MEAN = "mean"
+    MAX = "max"
+
+
+def _decode(vector: str) -> List[float]:
+    raw = base64.b64decode(vector)
+    return list(struct.unpack(f"<{len(raw) // 4}f", raw))
+
+
+def _encode(vector: List[float]) -> str:
+    return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+
+
+def compute_centroid(vectors: List[Vector]) -> Vector:
+    """
+    Computes the element-wise mean of a list of embedding vectors. Vectors can either be lists
+    of numbers, or base64 encoded little-endian float32 arrays, as used by the custom_tmd formula,
+    in which case the centroid is encoded the same way.
+    @param vectors: the vectors to compute the centroid of
+    @type vectors: List[Vector]
+    @return: the centroid
+    @rtype: Vector
+    """
+    if len(vectors) == 0:
+        raise SimilaritySearchException("Cannot compute the centroid of no vectors")
+
+    encoded = isinstance(vectors[0], str)
+    decoded = [_decode(v) if isinstance(v, str) else v for v in vectors]
+
+    if any(len(v) != len(decoded[0]) for v in decoded):
+        raise SimilaritySearchException("Cannot compute the centroid of vectors of different sizes")
+
+    centroid = [sum(values) / len(decoded) for values in zip(*decoded)]
+
+    return _encode(centroid) if encoded else centroid
@@ -19,6 +19,7 @@ from typing import Dict, Optional, List, Union, Any
 
 from kgforge.core import KnowledgeGraphForge, Resource
 
+from inference_tools.chunked_execution import execute_chunked, order_by
 from inference_tools.datatypes.query import ElasticSearchQuery
 from inference_tools.datatypes.query_configuration import ElasticSearchQueryConfiguration
 from inference_tools.premise_execution import PremiseExecution
@@ -55,12 +56,41 @@ class ElasticSearch(Source):
         @return: the results of the query execution
         @rtype: List[Dict]
         """
-        query_body = json.dumps(query.body)
+        query_body = ElasticSearch.format_query(query, parameter_values)
+
+        return forge.elastic(query_body, limit=limit, debug=debug, as_resource=False)
+
+    @staticmethod
+    def format_query(query: ElasticSearchQuery, parameter_values: Dict) -> str:
+        """
+        Formats the serialized body of an elastic search query with parameter values
+        @param query: the query
+        @type query: ElasticSearchQuery
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: the serialized body
+        @rtype: str
+        """
+        query_body = ElasticSearch.prepare(query)
 
         for k, v in parameter_values.items():
             query_body = query_body.replace(f"\"${k}\"", str(v))
 
-        return forge.elastic(query_body, limit=limit, debug=debug, as_resource=False)
+        return query_body
+
+    @staticmethod
+    def prepare(query: ElasticSearchQuery) -> str:
+        """
+        Serializes the body of an elastic search query, once per query
+        @param query: the query
+        @type query: ElasticSearchQuery
+        @return: the serialized body, with parameter placeholders
+        @rtype: str
+        """
+        if query.prepared_body is None:
+            query.prepared_body = json.dumps(query.body)
+
+        return query.prepared_body
 
     @staticmethod
     def check_premise(
@@ -86,11 +116,16 @@ class ElasticSearch(Source):
         PremiseExecution.SUCCESS otherwise.
         @rtype: PremiseExecution
         """
-        results = ElasticSearch.execute_query(
-            forge=forge, query=premise,
-            parameter_values=parameter_values,
-            debug=debug, config=config, limit=None
-        )
+        # Only whether a document exists matters: shards stop at the first match, and no source
+        # is returned
+        query_body = {
+            **json.loads(ElasticSearch.format_query(premise, parameter_values)),
+            "size": 1,
+            "terminate_after": 1,
+            "_source": False
+        }
+
+        results = forge.elastic(json.dumps(query_body), limit=1, debug=debug, as_resource=False)
 
         return PremiseExecution.SUCCESS if results is not None and len(results) > 0 else \
             PremiseExecution.FAIL
@@ -125,7 +160,8 @@ class ElasticSearch(Source):
         return forge.elastic(json.dumps(ElasticSearch.get_all_documents_query()))
 
     @staticmethod
-    def get_by_id(ids: Union[str, List[str]], forge: KnowledgeGraphForge) -> \
+    def get_by_id(ids: Union[str, List[str]], forge: KnowledgeGraphForge,
+                  chunk_size: Optional[int] = None) -> \
             Optional[Union[Resource, List[Resource]]]:
         """
         Get a document by id from the elastic search index associated to the
@@ -134,21 +170,34 @@ class ElasticSearch(Source):
         @type ids: List[str]
         @param forge: a forge instance, holding the elastic search view to target
         @type forge: KnowledgeGraphForge
+        @param chunk_size: the maximum number of ids per elastic search query, optional. Chunks
+        are queried concurrently
+        @type chunk_size: Optional[int]
         @return: the list of Resources retrieved, if successful else None
         @rtype: Optional[List[Resource]]
         """
-        q: Dict[str, Any] = {
-            "size": ElasticSearch.NO_LIMIT,
-            'query': {
-                'bool': {
-                    'filter': [
-                        {'terms': {'@id': ids}} if isinstance(ids, list) else {'term': {'@id': ids}}
-                    ],
-                    'must': [
-                        {'match': {'_deprecated': False}}
-                    ]
+        def _get_chunk(ids_chunk: Union[str, List[str]]) -> List[Resource]:
+            q: Dict[str, Any] = {
+                "size": ElasticSearch.NO_LIMIT,
+                'query': {
+                    'bool': {
+                        'filter': [
+                            {'terms': {'@id': ids_chunk}} if isinstance(ids_chunk, list)
+                            else {'term': {'@id': ids_chunk}}
+                        ],
+                        'must': [
+                            {'match': {'_deprecated': False}}
+                        ]
+                    }
                 }
             }
-        }
-        res = forge.elastic(json.dumps(q), debug=False)
-        return res[0] if isinstance(ids, str) and len(res) == 1 else res
+            return forge.elastic(json.dumps(q), debug=False)
+
+        if isinstance(ids, str):
+            res = _get_chunk(ids)
+            return res[0] if res is not None and len(res) == 1 else res
+
+        return execute_chunked(
+            ids, lambda ids_chunk: _get_chunk(ids_chunk) or [], chunk_size=chunk_size,
+            sort_key=order_by(ids, key=lambda r: r.id)
+        )
@@ -20,7 +20,6 @@ from typing import Dict, Optional, List
 from kgforge.core import KnowledgeGraphForge, Resource
 
 from inference_tools.datatypes.query_configuration import ForgeQueryConfiguration
-from inference_tools.exceptions.malformed_rule import MalformedRuleException
 from inference_tools.datatypes.query import ForgeQuery
 from inference_tools.helper_functions import _enforce_list, _follow_path, get_id_attribute
 from inference_tools.premise_execution import PremiseExecution
@@ -61,12 +60,94 @@ class Forge(Source):
         @rtype: List[Dict]
         """
 
-        q = json.loads(
-            Template(json.dumps(query.body)).substitute(**parameter_values)
-        )
+        q = json.loads(Forge.format_query(query, parameter_values))
 
         return forge.search(q, debug=debug, limit=limit)
 
+    @staticmethod
+    def format_query(query: ForgeQuery, parameter_values: Dict) -> str:
+        """
+        Formats the serialized pattern of a forge query with parameter values
+        @param query: the query
+        @type query: ForgeQuery
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: the serialized pattern
+        @rtype: str
+        """
+        return Forge.prepare(query).substitute(**parameter_values)
+
+    @classmethod
+    def premise_key(cls, premise: ForgeQuery, parameter_values: Dict) -> str:
+        """
+        @param premise: the premise
+        @type premise: ForgeQuery
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: a text identifying the outcome of checking a premise with parameter values: its
+        formatted pattern, along with the value of its target parameter the results are checked
+        against
+        @rtype: str
+        """
+        key = Forge.format_query(premise, parameter_values)
+
+        if premise.target_parameter:
+            key = json.dumps(
+                [key, premise.target_path, parameter_values.get(premise.target_parameter)],
+                default=str
+            )
+
+        return key
+
+    @staticmethod
+    def with_target_filter(pattern: Dict, target_path: Optional[str], value) -> Optional[Dict]:
+        """
+        Adds to a forge search pattern the condition that the value at a path is a target value
+        @param pattern: the pattern, modified in place
+        @type pattern: Dict
+        @param target_path: the path, separated by ".". If not specified, the id of the resources
+        @type target_path: Optional[str]
+        @param value: the target value
+        @type value:
+        @return: the pattern with the condition, None if the condition cannot be merged into the
+        pattern: the value is not a scalar, or the pattern already has conditions at the path
+        @rtype: Optional[Dict]
+        """
+        if not isinstance(value, (str, int, float, bool)):
+            return None
+
+        aliases = {"@id": "id", "@type": "type"}
+        path_list = [aliases.get(el, el) for el in target_path.split(".")] \
+            if target_path else ["id"]
+
+        node = pattern
+        for el in path_list[:-1]:
+            child = node.setdefault(el, {})
+            if not isinstance(child, dict):
+                return None
+            node = child
+
+        last = path_list[-1]
+        if last in node and node[last] != value:
+            return None
+
+        node[last] = value
+        return pattern
+
+    @staticmethod
+    def prepare(query: ForgeQuery) -> Template:
+        """
+        Builds the template of the serialized pattern of a forge query, once per query
+        @param query: the query
+        @type query: ForgeQuery
+        @return: the template
+        @rtype: Template
+        """
+        if query.prepared_body is None:
+            query.prepared_body = Template(json.dumps(query.body))
+
+        return query.prepared_body
+
     @staticmethod
     def check_premise(
             forge: KnowledgeGraphForge, premise: ForgeQuery,
@@ -85,14 +166,28 @@ class Forge(Source):
         @param debug: Whether to print out the premise's query before its execution
         @type debug: bool
         @return: PremiseExecution.FAIL is running the query within it has returned no results,
-        PremiseExecution.SUCCESS otherwise.
+        or if a target parameter is specified, no result whose value at the target path is the
+        value of the target parameter, PremiseExecution.SUCCESS otherwise.
         @rtype: PremiseExecution
         """
 
+        if premise.target_parameter:
+            # The backend checks whether a resource has the target value
+            pattern = Forge.with_target_filter(
+                json.loads(Forge.format_query(premise, parameter_values)),
+                premise.target_path, parameter_values[premise.target_parameter]
+            )
+            if pattern is not None:
+                resources = forge.search(pattern, debug=debug, limit=1)
+                return PremiseExecution.SUCCESS if resources is not None and \
+                    len(_enforce_list(resources)) > 0 else PremiseExecution.FAIL
+
+        # Without a target parameter, only whether a resource exists matters. Else the values
+        # of all resources are checked
         resources = Forge.execute_query(
             forge=forge, query=premise,
             parameter_values=parameter_values, config=config,
-            debug=debug, limit=None
+            debug=debug, limit=None if premise.target_parameter else 1
         )
 
         if resources is None:
@@ -112,12 +207,8 @@ class Forge(Source):
             else:
                 matched_values = [get_id_attribute(r) for r in resources_list]
 
-            if parameter_values[premise.target_parameter] not in matched_values:
-                return PremiseExecution.FAIL
-        else:
-            if len(resources_list) == 0:
-                return PremiseExecution.FAIL
-
-            return PremiseExecution.SUCCESS
+            return PremiseExecution.SUCCESS \
+                if parameter_values[premise.target_parameter] in matched_values \
+                else PremiseExecution.FAIL
 
-        raise MalformedRuleException("Missing target parameter in Forge Search Premise")
+        return PremiseExecution.SUCCESS if len(resources_list) > 0 else PremiseExecution.FAIL
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Any, Dict
 
 from kgforge.core import KnowledgeGraphForge
 
@@ -78,3 +78,40 @@ class Source(ABC):
         PremiseExecution.SUCCESS otherwise.
         @rtype: PremiseExecution
         """
+
+    @staticmethod
+    @abstractmethod
+    def format_query(query, parameter_values: Dict) -> str:
+        """
+        Formats the text of a query with parameter values, as it is sent when executing it
+        @param query: the query
+        @type query:
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: the text of the query
+        @rtype: str
+        """
+
+    @classmethod
+    def premise_key(cls, premise, parameter_values: Dict) -> str:
+        """
+        @param premise: the premise
+        @type premise:
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: a text identifying the outcome of checking a premise with parameter values
+        @rtype: str
+        """
+        return cls.format_query(premise, parameter_values)
+
+    @staticmethod
+    @abstractmethod
+    def prepare(query) -> Any:
+        """
+        Builds what can be reused across executions of a query, such as a template of its body.
+        It is built once and kept on the query
+        @param query: the query
+        @type query:
+        @return: the prepared body of the query, None if nothing can be prepared
+        @rtype: Any
+        """
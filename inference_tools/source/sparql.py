@@ -56,19 +56,53 @@ class Sparql(Source):
         @rtype: List[Dict]
         """
 
-        query_body = query.body.query_string
+        query_body = Sparql.format_query(query, parameter_values)
 
-        query_blocks = [x for x in query.parameter_specifications
-                        if x.type == ParameterType.QUERY_BLOCK]
+        return forge.sparql(query_body, limit=limit, debug=debug)
+
+    @staticmethod
+    def format_query(query: SparqlQuery, parameter_values: Dict) -> str:
+        """
+        Formats the sparql query string of a query with parameter values
+        @param query: the query
+        @type query: SparqlQuery
+        @param parameter_values: the formatted parameter values
+        @type parameter_values: Dict
+        @return: the sparql query string
+        @rtype: str
+        """
+        template = Sparql.prepare(query)
+
+        if template is None:
+            query_body = query.body.query_string
+
+            query_blocks = [x for x in query.parameter_specifications
+                            if x.type == ParameterType.QUERY_BLOCK]
 
-        if len(query_blocks) != 0:
             for qb in query_blocks:
                 to_replace = f"${qb.name}"
                 query_body = query_body.replace(to_replace, parameter_values[qb.name])
 
-        query_body = Template(query_body).substitute(**parameter_values)
+            template = Template(query_body)
 
-        return forge.sparql(query_body, limit=limit, debug=debug)
+        return template.substitute(**parameter_values)
+
+    @staticmethod
+    def prepare(query: SparqlQuery) -> Optional[Template]:
+        """
+        Builds the template of the body of a sparql query, once per query
+        @param query: the query
+        @type query: SparqlQuery
+        @return: the template, None if the query has query block parameters, that are put in the
+        body before it is templated
+        @rtype: Optional[Template]
+        """
+        if query.prepared_body is None and not any(
+                x.type == ParameterType.QUERY_BLOCK for x in query.parameter_specifications
+        ):
+            query.prepared_body = Template(query.body.query_string)
+
+        return query.prepared_body
 
     @staticmethod
     def check_premise(
@@ -92,10 +126,11 @@ class Sparql(Source):
         @rtype: PremiseExecution
         """
 
+        # Only whether a result exists matters
         results = Sparql.execute_query(
             forge=forge, query=premise,
             parameter_values=parameter_values,
-            debug=debug, config=config, limit=None
+            debug=debug, config=config, limit=1
         )
 
         return PremiseExecution.SUCCESS if results is not None and len(results) > 0 else \
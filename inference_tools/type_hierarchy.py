@@ -0,0 +1,196 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+In-memory index of the subclass hierarchy of the ontology types
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from kgforge.core import KnowledgeGraphForge
+
+from inference_tools.nexus_utils.forge_utils import ForgeUtils
+from inference_tools.similarity.id_interning import IdInterner
+
+SUBCLASS_EDGES_QUERY = """
+    SELECT ?sub ?super ?subLabel ?superLabel
+    WHERE {
+        ?sub rdfs:subClassOf ?super .
+        OPTIONAL { ?sub rdfs:label ?subLabel }
+        OPTIONAL { ?super rdfs:label ?superLabel }
+    }
+"""
+
+
+def _closure(parents: Dict[int, Set[int]], count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the reflexive transitive closure of a relation, in compressed sparse rows form:
+    the related nodes of node i are values[offsets[i]:offsets[i + 1]], sorted
+    """
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    rows: List[np.ndarray] = []
+
+    for node in range(count):
+        seen = {node}
+        stack = [node]
+        while stack:
+            for parent in parents.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        rows.append(np.array(sorted(seen), dtype=np.int32))
+        offsets[node + 1] = offsets[node] + len(seen)
+
+    return offsets, np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+
+
+class TypeHierarchyIndex:
+    """
+    The rdfs:subClassOf hierarchy of the types of a bucket, loaded once with its transitive
+    closure precomputed in both directions (ancestors and descendants, each type being its own
+    ancestor and descendant), in compressed form over interned type ids.
+    The index is reloaded when it is older than refresh_interval seconds, or on demand with
+    refresh.
+    """
+    forge: KnowledgeGraphForge
+    refresh_interval: float
+    synced_at: Optional[float]
+
+    def __init__(self, forge: KnowledgeGraphForge, refresh_interval: float = 3600):
+        self.forge = forge
+        self.refresh_interval = refresh_interval
+        self.synced_at = None
+        self._types = IdInterner()
+        self._labeled = np.zeros(0, dtype=bool)
+        self._ancestors = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        self._descendants = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        self._symbols: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        """
+        @return: whether the index has never been loaded, or was loaded more than
+        refresh_interval seconds ago
+        @rtype: bool
+        """
+        return self.synced_at is None or time.time() - self.synced_at > self.refresh_interval
+
+    def refresh(self, debug: bool = False):
+        """
+        Loads the subclass edges and recomputes the closures
+        @param debug: Whether to print the queries being executed or not
+        @type debug: bool
+        """
+        rows = self.forge.as_json(self.forge.sparql(SUBCLASS_EDGES_QUERY, limit=None, debug=debug))
+
+        types = IdInterner()
+        labeled: Set[int] = set()
+        parents: Dict[int, Set[int]] = defaultdict(set)
+
+        for row in rows or []:
+            sub, sup = types.intern(row["sub"]), types.intern(row["super"])
+            parents[sub].add(sup)
+            if row.get("subLabel") is not None:
+                labeled.add(sub)
+            if row.get("superLabel") is not None:
+                labeled.add(sup)
+
+        children: Dict[int, Set[int]] = defaultdict(set)
+        for sub, sups in parents.items():
+            for sup in sups:
+                children[sup].add(sub)
+
+        count = len(types)
+        labeled_mask = np.zeros(count, dtype=bool)
+        labeled_mask[list(labeled)] = True
+
+        ancestors = _closure(parents, count)
+        descendants = _closure(children, count)
+
+        with self._lock:
+            self._types, self._labeled = types, labeled_mask
+            self._ancestors, self._descendants = ancestors, descendants
+            self._symbols = {}
+            self.synced_at = time.time()
+
+    def _ensure_loaded(self, debug: bool):
+        if self.is_stale():
+            self.refresh(debug=debug)
+
+    def _related(
+            self, types: List[str], closure: Tuple[np.ndarray, np.ndarray], to_symbol: bool
+    ) -> Optional[List[str]]:
+        with self._lock:
+            interner, labeled = self._types, self._labeled
+            offsets, values = closure
+            symbols = self._symbols
+
+        codes = [interner.get(type_) for type_ in types]
+
+        if any(code is None for code in codes):
+            return None
+
+        related = [
+            int(c) for code in codes if code is not None
+            for c in values[offsets[code]:offsets[code + 1]]
+            if labeled[c]
+        ]
+
+        if not to_symbol:
+            return interner.ids(related)
+
+        def _symbol(iri: str) -> str:
+            if iri not in symbols:
+                symbols[iri] = ForgeUtils.to_symbol(self.forge, iri)
+            return symbols[iri]
+
+        return [_symbol(iri) for iri in interner.ids(related)]
+
+    def ancestors(
+            self, types: List[str], to_symbol: bool = True, debug: bool = False
+    ) -> Optional[List[str]]:
+        """
+        @param types: expanded type iris
+        @type types: List[str]
+        @param to_symbol: Whether to return symbols or full iris
+        @type to_symbol: bool
+        @param debug: Whether to print the queries being executed when loading the index
+        @type debug: bool
+        @return: the labeled types each type is a subclass of, including itself, for each type,
+        as the rdfs:subClassOf* pattern of get_resource_type_descendants. None if a type is not
+        part of the hierarchy
+        @rtype: Optional[List[str]]
+        """
+        self._ensure_loaded(debug)
+        return self._related(types, self._ancestors, to_symbol)
+
+    def descendants(
+            self, types: List[str], to_symbol: bool = True, debug: bool = False
+    ) -> Optional[List[str]]:
+        """
+        @param types: expanded type iris
+        @type types: List[str]
+        @param to_symbol: Whether to return symbols or full iris
+        @type to_symbol: bool
+        @param debug: Whether to print the queries being executed when loading the index
+        @type debug: bool
+        @return: the labeled subclasses of each type, including itself, for each type. None if a
+        type is not part of the hierarchy
+        @rtype: Optional[List[str]]
+        """
+        self._ensure_loaded(debug)
+        return self._related(types, self._descendants, to_symbol)
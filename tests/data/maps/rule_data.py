@@ -0,0 +1,70 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict, List, Optional
+
+from tests.data.maps.id_data import make_model_id, make_org, make_project
+
+
+def make_similarity_query_configuration(model_uuid: int, about: str = "Entity") -> Dict:
+    return {
+        "boosted": False,
+        "embeddingModelDataCatalog": {
+            "@id": make_model_id(model_uuid),
+            "@type": "EmbeddingModelDataCatalog",
+            "org": make_org(1),
+            "project": make_project(1),
+            "distance": "euclidean",
+            "about": about,
+            "name": f"Model {model_uuid}",
+            "description": "Model description"
+        },
+        "org": make_org(1),
+        "project": make_project(1),
+        "similarityView": {"@id": f"similarity_view_{model_uuid}", "@type": "ElasticSearchView"},
+        "statisticsView": {"@id": f"stat_view_{model_uuid}", "@type": "ElasticSearchView"},
+        "boostingView": {"@id": f"boosting_view_{model_uuid}", "@type": "ElasticSearchView"}
+    }
+
+
+def make_similarity_rule(
+        rule_id: str, model_uuids: List[int], target_resource_type: str = "Entity",
+        rule_types: Optional[List[str]] = None
+) -> Dict:
+    return {
+        "@id": rule_id,
+        "@type": rule_types or ["DataGeneralizationRule", "EmbeddingBasedGeneralizationRule"],
+        "name": f"Rule {rule_id}",
+        "description": "Test similarity rule",
+        "targetResourceType": target_resource_type,
+        "searchQuery": {
+            "@type": "SimilarityQuery",
+            "hasParameter": [
+                {"@type": "uri", "name": "TargetResourceParameter"},
+                {
+                    "@type": "list",
+                    "name": "SelectModelsParameter",
+                    "optional": True,
+                    "values": dict(
+                        (f"Model_{i}", make_model_id(i)) for i in model_uuids
+                    )
+                }
+            ],
+            "queryConfiguration": [
+                make_similarity_query_configuration(i) for i in model_uuids
+            ],
+            "searchTargetParameter": "TargetResourceParameter"
+        }
+    }
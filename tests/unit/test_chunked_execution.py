@@ -0,0 +1,48 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import pytest
+
+from inference_tools.chunked_execution import chunk_list, execute_chunked, order_by
+
+
+def test_chunk_list():
+    assert chunk_list(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert chunk_list([], 2) == []
+
+    with pytest.raises(ValueError):
+        chunk_list([1], 0)
+
+
+def test_execute_chunked_order():
+    ids = [f"id_{i}" for i in range(25)]
+    chunks = []
+    lock = threading.Lock()
+
+    def fc(chunk):
+        with lock:
+            chunks.append(chunk)
+        return list(reversed(chunk))  # results of a chunk come back in arbitrary order
+
+    result = execute_chunked(ids, fc, chunk_size=10, sort_key=order_by(ids, key=lambda e: e))
+
+    assert sorted(len(c) for c in chunks) == [5, 10, 10]
+    assert result == ids
+
+
+def test_execute_chunked_single_chunk():
+    assert execute_chunked([1, 2], lambda chunk: [e * 2 for e in chunk], chunk_size=10) == [2, 4]
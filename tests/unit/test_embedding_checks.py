@@ -0,0 +1,98 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from inference_tools.datatypes.rule import Rule
+from inference_tools.rules import get_embedding_checks, rule_has_resource_ids_embeddings
+from inference_tools.similarity.queries.get_embedded_entity_ids import get_embedded_entity_ids
+
+from tests.data.maps.elastic_data import make_embedding
+from tests.data.maps.id_data import make_entity_id, make_model_id
+from tests.data.maps.rule_data import make_similarity_rule
+
+
+def test_embedding_checks_grouped_across_rules(forge_factory, monkeypatch):
+    calls = []
+
+    def has_embedding_dict_mock(query_conf, resource_ids, forge, **kwargs):
+        calls.append(query_conf.embedding_model_data_catalog.id)
+        return dict((res_id, query_conf.similarity_view.id == "similarity_view_1")
+                    for res_id in resource_ids)
+
+    monkeypatch.setattr("inference_tools.rules.has_embedding_dict", has_embedding_dict_mock)
+
+    rules = [
+        Rule(make_similarity_rule("rule_1", [1, 2])),
+        Rule(make_similarity_rule("rule_2", [1])),
+        Rule(make_similarity_rule("rule_3", [2, 1])),
+    ]
+    resource_ids = [make_entity_id(1), make_entity_id(2)]
+
+    checks = get_embedding_checks(
+        query_configurations=[qc for r in rules for qc in r.search_query.query_configurations],
+        resource_ids=resource_ids, forge_factory=forge_factory, use_resources=False, debug=False
+    )
+
+    assert len(calls) == 2
+    assert len(checks) == 2
+
+    for rule in rules:
+        per_res_id = rule_has_resource_ids_embeddings(
+            rule, resource_ids, forge_factory=forge_factory, use_resources=False,
+            debug=False, embedding_checks=checks
+        )
+        for res_id in resource_ids:
+            partial = per_res_id[res_id]
+            assert [qc.similarity_view.id for qc in partial.search_query.query_configurations] \
+                == ["similarity_view_1"]
+
+        # Resources with the same embedded models share a partial rule
+        assert per_res_id[resource_ids[0]] is per_res_id[resource_ids[1]]
+        assert per_res_id[resource_ids[0]].id == rule.id
+
+    assert len(calls) == 2
+    # The parsed rules are left untouched
+    assert len(rules[0].search_query.query_configurations) == 2
+    assert list(rules[0].search_query.parameter_specifications[1].values.values()) == \
+        [make_model_id(1), make_model_id(2)]
+
+
+def test_embedded_entity_ids_probe(forge):
+    queries = []
+    embedded = [make_entity_id(1), make_entity_id(3)]
+
+    def elastic(query, **params):
+        queries.append(json.loads(query))
+        return [
+            {"_id": i, "_source": {"derivation": make_embedding(
+                embedding_uuid=i, derivation_id=entity_id, model_id=make_model_id(1),
+                model_rev=1, entity_rev=1, embedding_vec=[]
+            ).__dict__["derivation"]}}
+            for i, entity_id in enumerate(embedded)
+        ]
+
+    forge.elastic = elastic
+
+    try:
+        ids = get_embedded_entity_ids(
+            forge=forge, search_targets=[make_entity_id(i) for i in range(1, 5)], debug=False,
+            derivation_type="Entity", use_resources=False, view="similarity_view_1"
+        )
+    finally:
+        del forge.elastic
+
+    assert ids == set(embedded)
+    assert queries[0]["_source"] == ["derivation.entity.@id", "derivation.entity.@type"]
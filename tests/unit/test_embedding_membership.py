@@ -0,0 +1,152 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
+from inference_tools.rules import has_embedding_dict
+from inference_tools.similarity.embedding_membership import (
+    BloomFilter,
+    EmbeddingMembershipIndex,
+    EmbeddingMembershipRegistry
+)
+
+from tests.data.maps.id_data import make_entity_id, make_model_id
+from tests.data.maps.rule_data import make_similarity_query_configuration
+
+
+def updated_at_day(day: int) -> int:
+    # The _updatedAt sort value, in epoch milliseconds, of a day of january 2024
+    return 1704067200000 + (day - 1) * 86400000
+
+
+def make_hit(entity_uuid: int, updated_at: int, deprecated: bool = False):
+    return {
+        "_id": f"embedding_{entity_uuid}",
+        "_source": {
+            "_deprecated": deprecated,
+            "derivation": [
+                {"entity": {"@id": make_entity_id(entity_uuid), "@type": "Entity"}},
+                {"entity": {"@id": make_model_id(1), "@type": "EmbeddingModel"}}
+            ]
+        },
+        "sort": [updated_at, f"embedding_{entity_uuid}"]
+    }
+
+
+class ViewForge:
+    def __init__(self, hits):
+        self.hits = hits
+        self.queries = []
+
+    def elastic(self, query, **params):
+        q = json.loads(query)
+        self.queries.append(q)
+        if "_source" in q and "_deprecated" not in q["_source"]:  # existence probe
+            ids = q["query"]["bool"]["must"][0]["nested"]["query"]["terms"]["derivation.entity.@id"]
+            return [h for h in self.hits if make_entity_id(int(h["_id"].split("_")[1])) in ids]
+
+        since = next(
+            (c["range"]["_updatedAt"]["gte"] for c in q["query"]["bool"]["must"] if "range" in c),
+            None
+        )
+        return [
+            h for h in self.hits
+            if (since is None and not h["_source"]["_deprecated"]) or
+            (since is not None and h["sort"][0] >= since)
+        ]
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=100)
+    ids = [make_entity_id(i) for i in range(100)]
+    for id_ in ids:
+        bloom.add(id_)
+
+    assert all(id_ in bloom for id_ in ids)
+    assert sum(make_entity_id(i) in bloom for i in range(100, 1100)) < 100
+
+
+def test_membership_index_update():
+    index = EmbeddingMembershipIndex([make_entity_id(i) for i in range(10)])
+    assert make_entity_id(3) in index
+    assert make_entity_id(10) not in index
+
+    index.update(added=[make_entity_id(10)], removed=[make_entity_id(3)])
+    assert make_entity_id(3) not in index
+    assert make_entity_id(10) in index
+    assert len(index) == 10
+
+
+def test_membership_registry_refresh():
+    forge = ViewForge([make_hit(i, updated_at_day(i)) for i in range(1, 5)])
+    registry = EmbeddingMembershipRegistry(refresh_interval=0)
+    query_conf = SimilaritySearchQueryConfiguration(make_similarity_query_configuration(1))
+    resource_ids = [make_entity_id(i) for i in range(1, 7)]
+
+    known, uncertain = registry.lookup(query_conf, forge, resource_ids)
+    assert uncertain == []
+    assert [res_id for res_id, v in known.items() if v] == resource_ids[:4]
+
+    forge.hits[0] = make_hit(1, updated_at_day(5), deprecated=True)
+    forge.hits.append(make_hit(5, updated_at_day(6)))
+
+    known, _ = registry.lookup(query_conf, forge, resource_ids)
+    assert [res_id for res_id, v in known.items() if v] == resource_ids[1:5]
+    assert forge.queries[-1]["query"]["bool"]["must"][1] == \
+        {"range": {"_updatedAt": {"gte": updated_at_day(4)}}}
+
+
+def test_membership_registry_concurrent_refresh():
+    forge = ViewForge([make_hit(i, updated_at_day(i)) for i in range(1, 5)])
+    registry = EmbeddingMembershipRegistry(refresh_interval=60)
+    query_conf = SimilaritySearchQueryConfiguration(make_similarity_query_configuration(1))
+
+    index = registry.get_index(query_conf, forge)
+    index.synced_at -= 120
+
+    elastic = forge.elastic
+
+    def slow_elastic(query, **params):
+        time.sleep(0.05)
+        return elastic(query, **params)
+
+    forge.elastic = slow_elastic
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        indices = list(executor.map(lambda _: registry.get_index(query_conf, forge), range(4)))
+
+    # The stale index is refreshed once, by the first caller
+    assert all(i is index for i in indices)
+    assert len(forge.queries) == 2
+
+
+def test_has_embedding_dict_with_registry():
+    forge = ViewForge([make_hit(i, updated_at_day(i)) for i in range(1, 5)])
+    registry = EmbeddingMembershipRegistry(refresh_interval=3600)
+    query_conf = SimilaritySearchQueryConfiguration(make_similarity_query_configuration(1))
+    resource_ids = [make_entity_id(i) for i in range(1, 7)]
+
+    expected = dict((res_id, i < 4) for i, res_id in enumerate(resource_ids))
+
+    for _ in range(3):
+        assert has_embedding_dict(
+            query_conf, resource_ids, forge=forge, use_resources=False, debug=False,
+            membership_registry=registry
+        ) == expected
+
+    assert len(forge.queries) == 1
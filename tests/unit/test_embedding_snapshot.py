@@ -0,0 +1,144 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from inference_tools.datatypes.similarity.neighbor import Neighbor
+from inference_tools.similarity.formula import Formula
+from inference_tools.similarity.sharded_search import ShardedSearchEngine
+from inference_tools.similarity.snapshot import (
+    EmbeddingSnapshot,
+    get_neighbors_local,
+    parse_result_filter
+)
+from inference_tools.similarity.target_aggregation import TargetAggregation
+
+from tests.data.maps.id_data import make_entity_id, make_embedding_id
+
+
+@pytest.fixture
+def snapshot():
+    # Entity i has the vector [i, 0], even entities are of type Cell, entity 3 is deprecated
+    return EmbeddingSnapshot(
+        entity_ids=[make_entity_id(i) for i in range(6)],
+        embedding_ids=[make_embedding_id(i) for i in range(6)],
+        vectors=[[float(i), 0.0] for i in range(6)],
+        types=[["Entity", "Cell"] if i % 2 == 0 else ["Entity"] for i in range(6)],
+        deprecated=[i == 3 for i in range(6)],
+        keyword_field="brainRegion",
+        keywords=[["a"] if i < 3 else ["b"] for i in range(6)]
+    )
+
+
+def entity_ids(neighbors):
+    return [n.entity_id for _, n in neighbors]
+
+
+@pytest.mark.parametrize("prefilter_ratio", [0, 1])
+def test_snapshot_search_filters(snapshot, prefilter_ratio):
+
+    def search(**kwargs):
+        return entity_ids(snapshot.search(
+            vector=[0.0, 0.0], vector_id=make_embedding_id(0), k=10,
+            score_formula=Formula.EUCLIDEAN, prefilter_ratio=prefilter_ratio, **kwargs
+        ))
+
+    assert search() == [make_entity_id(i) for i in [1, 2, 3, 4, 5]]
+    assert search(include_deprecated=False) == [make_entity_id(i) for i in [1, 2, 4, 5]]
+    assert search(specified_derivation_type="Cell") == [make_entity_id(i) for i in [2, 4]]
+    assert search(keyword_values=["b"]) == [make_entity_id(i) for i in [3, 4, 5]]
+    assert search(specified_derivation_type="Cell", keyword_values=["a"]) == [make_entity_id(2)]
+    assert search(restricted_ids=[make_entity_id(5), make_entity_id(3)], include_deprecated=False) \
+        == [make_entity_id(5)]
+
+
+def test_snapshot_scores(snapshot):
+    neighbors = snapshot.search(
+        vector=[0.0, 0.0], vector_id=make_embedding_id(0), k=2, score_formula=Formula.EUCLIDEAN
+    )
+    assert [score for score, _ in neighbors] == pytest.approx([1 / 2, 1 / 3])
+
+    neighbors = snapshot.search(
+        vector=[[1.0, 0.0], [5.0, 0.0]], vector_id=[make_embedding_id(1), make_embedding_id(5)],
+        k=1, score_formula=Formula.EUCLIDEAN, aggregation=TargetAggregation.MEAN
+    )
+    assert entity_ids(neighbors) == [make_entity_id(2)]
+    assert neighbors[0][0] == pytest.approx((1 / 2 + 1 / 4) / 2)
+
+
+def test_parse_result_filter():
+    assert parse_result_filter(None, None, "brainRegion") == (True, None)
+    assert parse_result_filter(
+        '{"must": {"terms": {"brainRegion": ["$r", "c"]}}}', {"r": "a"}, "brainRegion"
+    ) == (True, ["a", "c"])
+    assert parse_result_filter(
+        '{"filter": [{"term": {"brainRegion": "a"}}]}', None, "brainRegion"
+    ) == (True, ["a"])
+    assert parse_result_filter(
+        '{"must": {"term": {"other": "a"}}}', None, "brainRegion"
+    ) == (False, None)
+    assert parse_result_filter(
+        '{"should": {"term": {"brainRegion": "a"}}}', None, "brainRegion"
+    ) == (False, None)
+
+
+def test_local_fallback(snapshot, monkeypatch):
+    calls = []
+
+    def get_neighbors_mock(**kwargs):
+        calls.append(kwargs)
+        return [(1, Neighbor(make_entity_id(1)))]
+
+    monkeypatch.setattr("inference_tools.similarity.snapshot.get_neighbors", get_neighbors_mock)
+
+    params = dict(
+        snapshot=snapshot, forge=None, vector=[0.0, 0.0], vector_id=make_embedding_id(0),
+        debug=False, derivation_type="Entity", k=1
+    )
+
+    local = get_neighbors_local(result_filter='{"must": {"term": {"brainRegion": "b"}}}', **params)
+    assert entity_ids(local) == [make_entity_id(3)]
+    assert len(calls) == 0
+
+    get_neighbors_local(result_filter='{"must": {"range": {"x": {"gte": 1}}}}', **params)
+    assert len(calls) == 1
+
+    # Deprecated embeddings are filtered out the same way on both paths
+    params["k"] = 10
+    local = get_neighbors_local(result_filter=None, include_deprecated=False, **params)
+    assert make_entity_id(3) not in entity_ids(local)
+    get_neighbors_local(
+        result_filter='{"must": {"range": {"x": {"gte": 1}}}}', include_deprecated=False, **params
+    )
+    assert calls[-1]["include_deprecated"] is False
+
+
+def test_sharded_search(snapshot):
+    with ShardedSearchEngine(snapshot, shard_count=3, max_workers=2) as engine:
+        for kwargs in [{}, {"specified_derivation_type": "Cell"}, {"keyword_values": ["b"]}]:
+            for formula in [Formula.EUCLIDEAN, Formula.COSINE]:
+                params = dict(
+                    vector=[0.5, 1.0], vector_id=make_embedding_id(0), k=3,
+                    score_formula=formula, **kwargs
+                )
+                expected = snapshot.search(**params)
+                result = engine.search(**params)
+                assert entity_ids(result) == entity_ids(expected)
+                assert [s for s, _ in result] == pytest.approx([s for s, _ in expected])
+
+        assert engine.search(
+            vector=[0.5, 1.0], vector_id=make_embedding_id(0), k=3,
+            score_formula=Formula.EUCLIDEAN, keyword_values=["c"]
+        ) == []
@@ -0,0 +1,79 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+import time
+
+from inference_tools.nexus_utils.forge_session_pool import ForgeSessionPool, pooled
+
+
+class Store:
+    def __init__(self, token):
+        self.token = token
+
+
+class Forge:
+    def __init__(self, key, token=None):
+        self.key = key
+        self._store = Store(token)
+
+
+def make_token(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def test_forge_session_pool():
+    built = []
+
+    def forge_factory(org, project, es_view, sparql_view):
+        built.append((org, project, es_view, sparql_view))
+        return Forge((org, project, es_view, sparql_view))
+
+    pool = ForgeSessionPool(forge_factory, max_size=2)
+
+    forge = pool("org", "project", "es_view", None)
+    assert pool("org", "project", "es_view", None) is forge
+    assert pool("org", "project", None, "sparql_view") is not forge
+    assert pool.metrics() == {"hits": 1, "misses": 2, "evictions": 0, "expirations": 0, "size": 2}
+
+    # The least recently used session is evicted
+    pool("org", "project", "es_view", None)
+    pool("org", "other_project")
+    assert pool("org", "project", "es_view", None) is forge
+    assert pool("org", "project", None, "sparql_view") is not forge
+    assert pool.metrics()["evictions"] == 2
+    assert len(built) == 4
+
+    # Pools are shared per forge factory
+    assert pooled(forge_factory) is pooled(forge_factory)
+    assert pooled(pool) is pool
+
+
+def test_forge_session_pool_token_expiry():
+    expiries = {"valid": time.time() + 3600, "expiring": time.time() + 10}
+
+    pool = ForgeSessionPool(
+        lambda org, project, es_view, sparql_view: Forge(org, make_token(expiries[project])),
+        expiry_margin=60
+    )
+
+    valid = pool("org", "valid")
+    expiring = pool("org", "expiring")
+
+    assert pool("org", "valid") is valid
+    assert pool("org", "expiring") is not expiring
+    assert pool.metrics()["expirations"] == 1
@@ -13,9 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from inference_tools.datatypes.rule import Rule
+from inference_tools.exceptions.exceptions import IncompleteObjectException
+from inference_tools.rules import rule_format_basic
 
 from inference_tools.utils import get_search_query_parameters
 
@@ -122,3 +126,35 @@ def rule1(rule1_dict):
 def test_get_search_query_parameters(rule_string, expected_parameters, request):
     rule = request.getfixturevalue(rule_string)
     assert (expected_parameters == list(get_search_query_parameters(rule).keys()))
+
+
+def test_lazy_rule(rule1_dict):
+    lazy_rule = rule_format_basic(Rule(rule1_dict, lazy=True))
+    assert not lazy_rule.is_parsed()
+    assert lazy_rule.id == "id_value" and lazy_rule.name == "Test rule"
+    assert not lazy_rule.is_parsed()
+
+    rule = rule_format_basic(Rule(rule1_dict))
+    assert [p.name for p in lazy_rule.flattened_input_parameters] == \
+        [p.name for p in rule.flattened_input_parameters]
+    assert lazy_rule.is_parsed()
+    assert lazy_rule.premises == rule.premises
+
+    with pytest.raises(IncompleteObjectException):
+        Rule({key: value for key, value in rule1_dict.items() if key != "searchQuery"}, lazy=True)
+
+
+def test_lazy_rule_concurrent_materialization(rule1_dict):
+    rule = rule_format_basic(Rule(rule1_dict))
+    expected = [p.name for p in rule.flattened_input_parameters]
+
+    lazy_rule = rule_format_basic(Rule(rule1_dict, lazy=True))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        names = list(executor.map(
+            lambda _: [p.name for p in lazy_rule.flattened_input_parameters], range(32)
+        ))
+    assert all(n == expected for n in names)
+
+    formatted = []
+    lazy_rule.on_parsed(formatted.append)
+    assert formatted == [lazy_rule]
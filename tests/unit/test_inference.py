@@ -13,7 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from inference_tools.execution import apply_rule
+from inference_tools.datatypes.compiled_rule import CompiledQuery, CompiledQueryPipe
+from inference_tools.execution import apply_rule, compile_rule
+from inference_tools.source.sparql import Sparql
+from tests.data.classes.knowledge_graph_forge_test import KnowledgeGraphForgeTest
+from tests.data.classes.resource_test import ResourceTest
 
 
 def test_infer(query_conf, forge_factory):
@@ -35,3 +39,59 @@ def test_infer(query_conf, forge_factory):
     }
 
     test = apply_rule(forge_factory=forge_factory, parameter_values={}, rule=rule_dict)
+
+
+def test_compiled_rule(query_conf, forge_factory, monkeypatch):
+    head = {
+        "@type": "SparqlQuery",
+        "hasBody": {"query_string": "HEAD"},
+        "hasParameter": [],
+        "queryConfiguration": query_conf,
+        "resultParameterMapping": [{"parameterName": "Ids", "path": "a.b"}]
+    }
+    rest = {
+        "@type": "SparqlQuery",
+        "hasBody": {"query_string": "REST $Ids"},
+        "hasParameter": [{"name": "Ids", "type": "list"}],
+        "queryConfiguration": query_conf,
+        "resultParameterMapping": []
+    }
+    rule_dict = {
+        "@id": "test",
+        "@type": "DataGeneralizationRule",
+        "description": "Test Rule description",
+        "name": "Test rule",
+        "searchQuery": {"@type": "QueryPipe", "head": head, "rest": rest},
+        "targetResourceType": "Entity"
+    }
+
+    executed = []
+
+    def sparql(self, query, debug=False, limit=None, offset=None, **params):
+        executed.append(query)
+        if query == "HEAD":
+            return [ResourceTest({"a": {"b": "x1"}}), ResourceTest({"a": {"b": "x2"}})]
+        return [ResourceTest({"id": query})]
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "sparql", sparql)
+
+    compiled = compile_rule(rule_dict)
+
+    assert isinstance(compiled.search_query, CompiledQueryPipe)
+    assert isinstance(compiled.search_query.rest, CompiledQuery)
+    assert compiled.search_query.rest.source is Sparql
+    template = compiled.search_query.rest.query.prepared_body
+    assert template is not None
+    assert [p.name for p in compiled.flattened_input_parameters] == []
+
+    results = [
+        apply_rule(forge_factory=forge_factory, parameter_values={}, rule=compiled)
+        for _ in range(2)
+    ]
+
+    assert results[0] == results[1]
+    assert results[0] == apply_rule(forge_factory=forge_factory, parameter_values={}, rule=rule_dict)
+    assert executed[1] == executed[3] == executed[5]
+    assert "x1" in executed[1] and "x2" in executed[1]
+    # The compiled plan is reused as is
+    assert compiled.search_query.rest.query.prepared_body is template
@@ -0,0 +1,201 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pickle
+
+import pytest
+
+from inference_tools.exceptions.exceptions import InferenceToolsException
+from inference_tools.rule_catalog import RuleCatalog
+from inference_tools.rules import fetch_rules
+from inference_tools.type import RuleType
+
+from tests.data.maps.id_data import make_model_id
+from tests.data.maps.rule_data import make_similarity_rule
+
+
+def make_rule_hit(rule_id, updated_at, rev=1, deprecated=False, target_resource_type="Entity",
+                  extra_parameters=None):
+    rule = make_similarity_rule(rule_id, [1, 2], target_resource_type=target_resource_type)
+    rule["searchQuery"]["hasParameter"] += extra_parameters or []
+    return {
+        "_source": {
+            **rule,
+            "_rev": rev, "_updatedAt": updated_at, "_deprecated": deprecated,
+            "_self": f"self_{rule_id}"
+        },
+        "sort": [updated_at, rule_id]
+    }
+
+
+class RulesForge:
+    def __init__(self, hits):
+        self.hits = hits
+        self.queries = []
+
+    def elastic(self, query, **params):
+        q = json.loads(query)
+        self.queries.append(q)
+        since = next(
+            (c["range"]["_updatedAt"]["gte"] for c in q["query"]["bool"]["must"] if "range" in c),
+            None
+        )
+        return [
+            h for h in self.hits
+            if (since is None and not h["_source"]["_deprecated"])
+            or (since is not None and h["sort"][0] >= since)
+        ]
+
+
+def test_rule_catalog_refresh():
+    forge = RulesForge([make_rule_hit("rule_1", "t1"), make_rule_hit("rule_2", "t2")])
+    catalog = RuleCatalog(forge, refresh_interval=3600)
+
+    assert [r.id for r in catalog.get_rules()] == ["rule_1", "rule_2"]
+    rule_2 = catalog.rules["rule_2"]
+    assert rule_2.nexus_link == "self_rule_2"
+    # Formatting is applied once, and can be applied again without losing the models
+    assert [v.id for v in rule_2.search_query.parameter_specifications[1].values.values()] \
+        == [make_model_id(1), make_model_id(2)]
+
+    # Not stale: no query
+    catalog.get_rules()
+    assert len(forge.queries) == 1
+
+    forge.hits = [
+        make_rule_hit("rule_1", "t3", rev=2, deprecated=True),
+        make_rule_hit("rule_2", "t2"),
+        make_rule_hit("rule_3", "t3", target_resource_type="Cell")
+    ]
+    catalog.refresh()
+
+    assert forge.queries[-1]["query"]["bool"]["must"] == [{"range": {"_updatedAt": {"gte": "t2"}}}]
+    assert sorted(catalog.rules.keys()) == ["rule_2", "rule_3"]
+    # Unchanged revision: the parsed rule is kept
+    assert catalog.rules["rule_2"] is rule_2
+    assert catalog.last_update == "t3"
+
+    assert [r.id for r in catalog.get_rules(resource_types=["Cell"])] == ["rule_3"]
+    assert catalog.get_rules(rule_types=[RuleType.RESOURCE_GENERALIZATION_RULE.value]) == []
+
+
+def test_rule_catalog_parse_errors(capsys):
+    invalid = make_rule_hit("rule_2", "t2")
+    del invalid["_source"]["searchQuery"]
+    forge = RulesForge([make_rule_hit("rule_1", "t1"), invalid])
+    catalog = RuleCatalog(forge)
+
+    assert [r.id for r in catalog.get_rules()] == ["rule_1"]
+    assert list(catalog.parse_errors.keys()) == ["rule_2"]
+    assert capsys.readouterr().out == ""
+
+    forge.hits = [make_rule_hit("rule_2", "t3", rev=2)]
+    catalog.refresh()
+    assert [r.id for r in catalog.get_rules()] == ["rule_1", "rule_2"]
+    assert catalog.parse_errors == {}
+
+
+def test_fetch_rules_from_catalog():
+    forge = RulesForge([make_rule_hit("rule_1", "t1"), make_rule_hit("rule_2", "t2", target_resource_type="Cell")])
+    catalog = RuleCatalog(forge)
+
+    rules = fetch_rules(
+        forge_rules=forge, resource_types=["Cell"], resource_types_descendants=False,
+        rule_catalog=catalog
+    )
+
+    assert [r.id for r in rules] == ["rule_2"]
+    assert len(forge.queries) == 1
+
+
+def test_rule_applicability_index():
+    region = {"@type": "uri", "name": "BrainRegionParameter"}
+    species = {"@type": "uri", "name": "SpeciesParameter", "optional": True}
+
+    forge = RulesForge([
+        make_rule_hit("rule_1", "t1"),
+        make_rule_hit("rule_2", "t2", target_resource_type="Cell", extra_parameters=[region]),
+        make_rule_hit("rule_3", "t3", target_resource_type="Cell", extra_parameters=[species])
+    ])
+    catalog = RuleCatalog(forge)
+
+    def _applicable(**kwargs):
+        return [
+            r.id for r in catalog.get_applicable_rules(resource_types_descendants=False, **kwargs)
+        ]
+
+    assert _applicable() == ["rule_1", "rule_2", "rule_3"]
+    assert _applicable(resource_types=["Cell"]) == ["rule_2", "rule_3"]
+    assert _applicable(resource_types=["Entity", "Cell"], parameter_names=[]) == []
+    assert _applicable(parameter_names=["TargetResourceParameter"]) == ["rule_1", "rule_3"]
+    assert _applicable(
+        resource_types=["Cell"], parameter_names=["TargetResourceParameter", "BrainRegionParameter"]
+    ) == ["rule_2", "rule_3"]
+    assert _applicable(rule_types=[RuleType.RESOURCE_GENERALIZATION_RULE.value]) == []
+
+    # The index follows the updates of the catalog
+    forge.hits = [
+        make_rule_hit("rule_2", "t4", rev=2, deprecated=True),
+        make_rule_hit("rule_3", "t4", rev=2, extra_parameters=[region])
+    ]
+    catalog.refresh()
+
+    assert _applicable(resource_types=["Cell"]) == []
+    assert _applicable(
+        resource_types=["Entity"], parameter_names=["TargetResourceParameter"]
+    ) == ["rule_1"]
+    assert "Cell" not in catalog.applicability_index.by_target_type
+
+
+def test_rule_catalog_snapshot(tmp_path, capsys):
+    path = str(tmp_path / "rules.pkl")
+    forge = RulesForge([make_rule_hit("rule_1", "t1"), make_rule_hit("rule_2", "t2")])
+    catalog = RuleCatalog(forge)
+    catalog.refresh()
+    catalog.save(path)
+
+    forge.hits = [
+        make_rule_hit("rule_1", "t1"),
+        make_rule_hit("rule_2", "t3", rev=2, target_resource_type="Cell")
+    ]
+    loaded = RuleCatalog.load(path, forge, revalidate=False)
+
+    # Served from the snapshot, with the similarity parameter specifications filled in
+    assert len(forge.queries) == 1
+    assert [r.id for r in loaded.get_rules(resource_types=["Entity"])] == ["rule_1", "rule_2"]
+    assert [v.id for v in loaded.rules["rule_1"].search_query.parameter_specifications[1]
+            .values.values()] == [make_model_id(1), make_model_id(2)]
+
+    rule_1 = loaded.rules["rule_1"]
+    loaded.revalidate_in_background().join()
+
+    assert forge.queries[-1]["query"]["bool"]["must"] == [{"range": {"_updatedAt": {"gte": "t2"}}}]
+    assert loaded.rules["rule_1"] is rule_1
+    assert [r.id for r in loaded.get_rules(resource_types=["Cell"])] == ["rule_2"]
+    assert loaded.revalidation_error is None
+
+    # The rules of the snapshot keep being served, the error is kept on the catalog
+    forge.elastic = lambda query, **params: None
+    loaded.revalidate_in_background().join()
+    assert isinstance(loaded.revalidation_error, InferenceToolsException)
+    assert capsys.readouterr().out == ""
+    assert len(loaded.get_rules()) == 2
+
+    with open(path, "wb") as f:
+        pickle.dump({"format": -1}, f)
+
+    with pytest.raises(InferenceToolsException):
+        RuleCatalog.load(path, forge)
@@ -0,0 +1,280 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+
+import pytest
+
+from inference_tools.datatypes.rule import Rule
+from inference_tools.exceptions.exceptions import InferenceToolsException
+from inference_tools.exceptions.premise import FailedPremiseException, \
+    IrrelevantPremiseParametersException
+from inference_tools.execution import check_premises
+from inference_tools.nexus_utils.forge_utils import ForgeUtils
+from inference_tools.premise_cache import PremiseCache
+from inference_tools.premise_scheduler import PremiseScheduler
+from inference_tools.rules import filter_rules_by_premises
+
+from tests.data.classes.knowledge_graph_forge_test import KnowledgeGraphForgeTest
+from tests.data.classes.resource_test import ResourceTest
+from tests.data.maps.rule_data import make_similarity_rule
+
+
+@pytest.mark.parametrize("max_workers", [None, 3])
+def test_filter_rules_by_premises(max_workers, monkeypatch):
+    rules = [Rule(make_similarity_rule(f"rule_{i}", [1])) for i in range(6)]
+    failing = []
+
+    def check_premises_mock(rule, **kwargs):
+        i = int(rule.id.split("_")[1])
+        time.sleep(0.01 * (6 - i))  # Later rules complete first
+        if i in failing:
+            raise FailedPremiseException(description=f"premise {i}")
+        return i != 4
+
+    monkeypatch.setattr("inference_tools.rules.check_premises", check_premises_mock)
+
+    kept = filter_rules_by_premises(
+        rules, forge_factory=None, parameter_values={}, max_workers=max_workers
+    )
+    assert [r.id for r in kept] == ["rule_0", "rule_1", "rule_2", "rule_3", "rule_5"]
+
+    # Same outcome one rule after the other or concurrently: the rules whose premises fail are
+    # filtered out, the other rules are kept
+    failing.extend([2, 5])
+    kept = filter_rules_by_premises(
+        rules, forge_factory=None, parameter_values={}, max_workers=max_workers
+    )
+    assert [r.id for r in kept] == ["rule_0", "rule_1", "rule_3"]
+
+
+def test_filter_rules_by_premises_error(monkeypatch):
+    rules = [Rule(make_similarity_rule(f"rule_{i}", [1])) for i in range(4)]
+    checked = []
+
+    def check_premises_mock(rule, **kwargs):
+        if rule.id == "rule_0":
+            raise InferenceToolsException("error")
+        time.sleep(0.1)
+        checked.append(rule.id)
+        return True
+
+    monkeypatch.setattr("inference_tools.rules.check_premises", check_premises_mock)
+
+    # Errors other than premise exceptions are raised, the checks that have not started are
+    # cancelled
+    with pytest.raises(InferenceToolsException, match="error"):
+        filter_rules_by_premises(rules, forge_factory=None, parameter_values={}, max_workers=2)
+
+    time.sleep(0.3)
+    assert "rule_1" in checked and "rule_3" not in checked
+
+
+def make_premise_rule(query_conf, premise_queries, parameter_name=None, rule_id="rule",
+                      premise_type="SparqlPremise"):
+    rule = make_similarity_rule(rule_id, [1])
+    rule["premise"] = [
+        {
+            "@type": premise_type,
+            "hasBody": {"query_string": query} if premise_type == "SparqlPremise" else query,
+            "hasParameter": [{"@type": "str", "name": parameter_name}] if parameter_name else [],
+            "queryConfiguration": query_conf
+        }
+        for query in premise_queries
+    ]
+    return Rule(rule)
+
+
+def test_check_premises_concurrently(query_conf, forge_factory, monkeypatch):
+    executed = []
+
+    def sparql(self, query, debug=False, limit=None, offset=None, **params):
+        executed.append(query)
+        if query == "SLOW":
+            time.sleep(0.5)
+        return [] if query == "FAIL" else [ResourceTest({"id": query})]
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "sparql", sparql)
+
+    rule = make_premise_rule(query_conf, ["SUCCESS", "SUCCESS"])
+    assert check_premises(forge_factory, rule, {}, max_workers=2)
+
+    # The failure is raised without waiting for the outstanding premises
+    rule = make_premise_rule(query_conf, ["SLOW", "FAIL"])
+    start = time.time()
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {}, max_workers=2)
+    assert time.time() - start < 0.4
+
+    # Same aggregation as sequential checks
+    rule = make_premise_rule(query_conf, ["SUCCESS", "SUCCESS"], parameter_name="Missing")
+    for max_workers in [None, 2]:
+        assert check_premises(forge_factory, rule, None, max_workers=max_workers)
+        with pytest.raises(IrrelevantPremiseParametersException):
+            check_premises(forge_factory, rule, {"Other": "value"}, max_workers=max_workers)
+
+
+def test_premise_scheduler(query_conf, forge_factory, monkeypatch):
+    executed = []
+
+    def sparql(self, query, debug=False, limit=None, offset=None, **params):
+        executed.append(query)
+        if query == "SLOW":
+            time.sleep(0.05)
+        return [] if query == "FAIL" else [ResourceTest({"id": query})]
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "sparql", sparql)
+
+    scheduler = PremiseScheduler()
+    rule = make_premise_rule(query_conf, ["SLOW", "SUCCESS", "FAIL"])
+
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {}, scheduler=scheduler)
+    assert executed == ["SLOW", "SUCCESS", "FAIL"]
+
+    # The premise that is fast and has failed now runs first
+    executed.clear()
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {}, scheduler=scheduler)
+    assert executed == ["FAIL"]
+
+    assert [p.body.query_string for p in scheduler.order(rule.premises)] == \
+        ["FAIL", "SUCCESS", "SLOW"]
+
+    # Outcomes taken from the cache are not recorded
+    scheduler = PremiseScheduler()
+    cache = PremiseCache(ttl=60)
+    rule = make_premise_rule(query_conf, ["SLOW", "SUCCESS"])
+    for _ in range(3):
+        check_premises(forge_factory, rule, {}, scheduler=scheduler, cache=cache)
+    assert sorted(stats.count for stats in scheduler.stats.values()) == [1, 1]
+    assert max(stats.latency for stats in scheduler.stats.values()) >= 0.05
+
+
+def test_premise_cache(query_conf, forge_factory, monkeypatch):
+    executed = []
+
+    def sparql(self, query, debug=False, limit=None, offset=None, **params):
+        executed.append(query)
+        time.sleep(0.05)
+        return [] if query == "FAIL" else [ResourceTest({"id": query})]
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "sparql", sparql)
+
+    rules = [
+        make_premise_rule(query_conf, ["SHARED", f"OWN_{i}"], rule_id=f"rule_{i}")
+        for i in range(4)
+    ] + [make_premise_rule(query_conf, ["SHARED", "FAIL"], rule_id="rule_4")]
+
+    cache = PremiseCache(ttl=60)
+
+    kept = filter_rules_by_premises(
+        rules[:4], forge_factory=forge_factory, parameter_values={}, max_workers=4, cache=cache
+    )
+    assert [r.id for r in kept] == [f"rule_{i}" for i in range(4)]
+    # Evaluated once, even though the rules are checked concurrently
+    assert executed.count("SHARED") == 1
+    assert cache.hits + cache.misses == 8 and cache.misses == 5
+
+    executed.clear()
+    for _ in range(2):
+        with pytest.raises(FailedPremiseException):
+            check_premises(forge_factory, rules[4], {}, cache=cache)
+    assert executed == ["FAIL"]
+
+    executed.clear()
+    cache = PremiseCache(ttl=0)
+    check_premises(forge_factory, rules[0], {}, cache=cache)
+    check_premises(forge_factory, rules[0], {}, cache=cache)
+    assert executed == ["SHARED", "OWN_0", "SHARED", "OWN_0"]
+
+
+def test_premise_existence_queries(query_conf, forge_factory, monkeypatch):
+    calls = []
+
+    def sparql(self, query, debug=False, limit=None, offset=None, **params):
+        calls.append((query, limit))
+        return [ResourceTest({"id": query})]
+
+    def elastic(self, query, debug=False, limit=None, offset=None, **params):
+        calls.append((json.loads(query), limit))
+        return [{"_id": "id", "_index": "index"}]
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "sparql", sparql)
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "elastic", elastic)
+
+    assert check_premises(forge_factory, make_premise_rule(query_conf, ["ASK"]), {})
+    assert calls[-1] == ("ASK", 1)
+
+    es_rule = make_premise_rule(
+        query_conf, [{"query": {"match_all": {}}}], premise_type="ElasticSearchPremise"
+    )
+    assert check_premises(forge_factory, es_rule, {})
+    assert calls[-1] == (
+        {"query": {"match_all": {}}, "size": 1, "terminate_after": 1, "_source": False}, 1
+    )
+
+
+def test_forge_premise_target_filter(query_conf, forge_factory, monkeypatch):
+    searches = []
+
+    def search(self, *filters, **params):
+        searches.append((filters[0], params.get("limit")))
+        region = filters[0].get("brainLocation")
+        if isinstance(region, dict) and region["brainRegion"].get("id").endswith("/_/r1"):
+            return [ResourceTest({"id": "resource"})]
+        if params.get("limit") is None:
+            return [ResourceTest({"id": "resource", "brainLocation": "r1"})]
+        return []
+
+    monkeypatch.setattr(KnowledgeGraphForgeTest, "search", search)
+
+    def make_rule(pattern, target_path):
+        rule = make_similarity_rule("rule", [1])
+        rule["premise"] = {
+            "@type": "ForgeSearchPremise",
+            "pattern": pattern,
+            "hasParameter": [{"@type": "uri", "name": "Region"}],
+            "targetParameter": "Region",
+            "targetPath": target_path,
+            "queryConfiguration": query_conf
+        }
+        return Rule(rule)
+
+    rule = make_rule({"type": "Entity"}, "brainLocation.brainRegion.@id")
+
+    assert check_premises(forge_factory, rule, {"Region": "r1"})
+    pattern, limit = searches[-1]
+    assert pattern["type"] == "Entity" and limit == 1
+    assert pattern["brainLocation"]["brainRegion"]["id"].endswith("/_/r1")
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {"Region": "r2"})
+
+    # The condition cannot be merged into the pattern: all resources are checked
+    rule = make_rule({"type": "Entity", "brainLocation": "r1"}, "brainLocation.brainRegion")
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {"Region": "r1"})
+    assert searches[-1] == ({"type": "Entity", "brainLocation": "r1"}, None)
+
+    rule = make_rule({"type": "Entity", "brainLocation": "r1"}, "brainLocation")
+    expanded = ForgeUtils.expand_uri(KnowledgeGraphForgeTest(query_conf), "r1")
+    monkeypatch.setattr(
+        KnowledgeGraphForgeTest, "search",
+        lambda self, *filters, **params: [ResourceTest({"id": "resource", "brainLocation": expanded})]
+    )
+    assert check_premises(forge_factory, rule, {"Region": "r1"})
+    with pytest.raises(FailedPremiseException):
+        check_premises(forge_factory, rule, {"Region": "r2"})
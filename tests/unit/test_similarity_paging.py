@@ -0,0 +1,146 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
+from inference_tools.datatypes.similarity.neighbor import Neighbor
+from inference_tools.datatypes.similarity.statistic import Statistic
+from inference_tools.similarity.main import combine_similarity_models
+from inference_tools.similarity.paging import (
+    CursorStore,
+    SimilarityCursor,
+    execute_similarity_query_paged
+)
+
+from tests.data.maps.id_data import make_embedding_id, make_entity_id
+from tests.data.maps.rule_data import make_similarity_query_configuration
+
+
+def test_paged_similarity(monkeypatch):
+    total = 130
+    limits = []
+
+    def execute_similarity_query_mock(limit, **kwargs):
+        limits.append(limit)
+        return [{"id": i} for i in range(min(limit, total))]
+
+    monkeypatch.setattr(
+        "inference_tools.similarity.paging.execute_similarity_query", execute_similarity_query_mock
+    )
+
+    store = CursorStore()
+    params = dict(
+        forge_factory=None, query="query", parameter_values={"TargetResourceParameter": "a"},
+        debug=False, use_resources=False, page_size=20, store=store
+    )
+
+    page = execute_similarity_query_paged(**params)
+    assert [r["id"] for r in page["results"]] == list(range(20))
+    assert limits == [100]
+
+    offsets = []
+    while page["nextOffset"] is not None:
+        offsets.append(page["nextOffset"])
+        page = execute_similarity_query_paged(
+            offset=page["nextOffset"], cursor=page["cursor"], **params
+        )
+
+    assert offsets == [20, 40, 60, 80, 100, 120]
+    assert [r["id"] for r in page["results"]] == list(range(120, 130))
+    # Only recomputed once the first 100 results were served
+    assert limits == [100, 200]
+
+    # A cursor used with other parameter values is not reused
+    other = execute_similarity_query_paged(
+        **dict(params, parameter_values={"TargetResourceParameter": "b"}), cursor=page["cursor"]
+    )
+    assert other["cursor"] != page["cursor"]
+    assert limits == [100, 200, 100]
+
+
+def test_paged_combined_similarity(monkeypatch):
+    total = 130
+    configs = [
+        SimilaritySearchQueryConfiguration(make_similarity_query_configuration(i))
+        for i in [1, 2]
+    ]
+
+    class EmbeddingMock:
+        id = make_embedding_id(0)
+        vector = [0.1, 0.2]
+
+    # The models rank the entities differently, so that their top k differ
+    rankings = {
+        "similarity_view_1": list(range(total)),
+        "similarity_view_2": list(range(1, total)) + [0]
+    }
+
+    def score(view, entity_id):
+        return 1 - [make_entity_id(i) for i in rankings[view]].index(entity_id) / total
+
+    def query_similar_resources_mock(config, k, **kwargs):
+        view = config.similarity_view.id
+        return EmbeddingMock(), [
+            (score(view, make_entity_id(i)), Neighbor(make_entity_id(i)))
+            for i in rankings[view][:k]
+        ]
+
+    def get_neighbors_mock(restricted_ids, view, **kwargs):
+        return [(score(view, i), Neighbor(i)) for i in restricted_ids]
+
+    monkeypatch.setattr("inference_tools.similarity.main.query_similar_resources",
+                        query_similar_resources_mock)
+    monkeypatch.setattr("inference_tools.similarity.main.get_neighbors", get_neighbors_mock)
+    monkeypatch.setattr("inference_tools.similarity.main.get_score_stats",
+                        lambda **kwargs: Statistic(0, 1, 0, 0, 0))
+
+    def execute_similarity_query_mock(limit, parameter_values, **kwargs):
+        return combine_similarity_models(
+            forge_factory=lambda *args: None, configurations=configs,
+            parameter_values=parameter_values, k=limit,
+            target_parameter="TargetResourceParameter", result_filter=None, debug=False,
+            use_resources=False
+        )
+
+    monkeypatch.setattr(
+        "inference_tools.similarity.paging.execute_similarity_query", execute_similarity_query_mock
+    )
+
+    params = dict(
+        forge_factory=None, query="query", parameter_values={"TargetResourceParameter": "a"},
+        debug=False, use_resources=False, page_size=20, store=CursorStore()
+    )
+
+    page = execute_similarity_query_paged(**params)
+    ids = [r["id"] for r in page["results"]]
+    # Pages past the first buffer of 100 results
+    while page["nextOffset"] is not None:
+        page = execute_similarity_query_paged(
+            offset=page["nextOffset"], cursor=page["cursor"], **params
+        )
+        ids += [r["id"] for r in page["results"]]
+
+    assert sorted(ids) == sorted(make_entity_id(i) for i in range(total))
+
+
+def test_cursor_store():
+    store = CursorStore(max_cursors=1)
+    for token in ["a", "b"]:
+        store.put(SimilarityCursor(token, "fingerprint", depth=10, results=[], expires_at=0))
+    assert store.get("a") is None
+    assert store.get("b").token == "b"
+
+    expired = CursorStore(ttl=0)
+    expired.put(SimilarityCursor("a", "fingerprint", depth=10, results=[], expires_at=0))
+    assert expired.get("a") is None
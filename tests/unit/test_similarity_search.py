@@ -13,18 +13,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 import pytest
 from contextlib import nullcontext as does_not_raise
 
 from inference_tools.exceptions.exceptions import SimilaritySearchException
 
 from inference_tools.datatypes.query import query_factory
+from inference_tools.datatypes.query_configuration import SimilaritySearchQueryConfiguration
+from inference_tools.datatypes.similarity.neighbor import Neighbor
 from inference_tools.execution import execute_query_object
+from inference_tools.datatypes.similarity.statistic import Statistic
+from inference_tools.similarity.formula import Formula
+from inference_tools.similarity.id_interning import IdInterner
+from inference_tools.similarity.main import combine_similarity_models
 from inference_tools.similarity.queries.get_embedding_vector import _err_message
+from inference_tools.similarity.queries.get_neighbors import get_neighbors, get_neighbors_two_stage
+from inference_tools.similarity.target_aggregation import (
+    TargetAggregation, compute_centroid, _encode, _decode
+)
 
+from tests.data.maps.rule_data import make_similarity_query_configuration
 from tests.data.maps.id_data import (
     make_model_id,
     make_entity_id,
+    make_embedding_id,
     make_org,
     make_project
 )
@@ -121,3 +135,121 @@ def similarity_search_query_combine(similarity_search_query_single):
 #     )
 
 
+def test_two_stage_neighbors(forge, similarity_search_query_single, monkeypatch):
+    query_conf = dict(
+        similarity_search_query_single["queryConfiguration"][0],
+        candidateGeneration={"formula": "cosine", "factor": 3}
+    )
+    query_conf["embeddingModelDataCatalog"] = dict(
+        query_conf["embeddingModelDataCatalog"], distance="poincare"
+    )
+    config = SimilaritySearchQueryConfiguration(query_conf)
+
+    calls = []
+
+    def get_neighbors_mock(**kwargs):
+        calls.append(kwargs)
+        if kwargs.get("restricted_ids") is None:
+            return [(1 - i / 10, Neighbor(make_entity_id(i))) for i in range(kwargs["k"])]
+        return [(0.5, Neighbor(i)) for i in kwargs["restricted_ids"][::-1][:kwargs["k"]]]
+
+    monkeypatch.setattr(
+        "inference_tools.similarity.queries.get_neighbors.get_neighbors", get_neighbors_mock
+    )
+
+    result = get_neighbors_two_stage(
+        forge=forge, vector=[0.1, 0.2], vector_id=make_embedding_id(1), debug=False,
+        derivation_type="Entity", candidate_generation=config.candidate_generation, k=2,
+        score_formula=config.embedding_model_data_catalog.distance
+    )
+
+    assert [c["score_formula"] for c in calls] == [Formula.COSINE, Formula.POINCARE]
+    assert calls[0]["k"] == 6
+    assert calls[1]["restricted_ids"] == [make_entity_id(i) for i in range(6)]
+    assert [n.entity_id for _, n in result] == [make_entity_id(5), make_entity_id(4)]
+
+
+def test_compute_centroid():
+    assert compute_centroid([[1.0, 2.0], [3.0, 4.0]]) == [2.0, 3.0]
+
+    centroid = compute_centroid([_encode([1.0, 2.0]), _encode([3.0, 6.0])])
+    assert isinstance(centroid, str)
+    assert _decode(centroid) == [2.0, 4.0]
+
+    with pytest.raises(SimilaritySearchException):
+        compute_centroid([[1.0], [1.0, 2.0]])
+
+
+def test_aggregated_neighbors_query(forge):
+    queries = []
+
+    def elastic_mock(query, **kwargs):
+        queries.append(json.loads(query))
+        return []
+
+    forge.elastic = elastic_mock
+
+    try:
+        with pytest.raises(SimilaritySearchException):
+            get_neighbors(
+                forge=forge, vector=[[0.1, 0.2], [0.3, 0.4]],
+                vector_id=[make_embedding_id(1), make_embedding_id(2)], debug=False,
+                derivation_type="Entity", k=5, score_formula=Formula.COSINE,
+                aggregation=TargetAggregation.MAX
+            )
+    finally:
+        del forge.elastic
+
+    script_score = queries[0]["query"]["script_score"]
+    assert script_score["query"]["bool"]["must_not"] == {
+        "terms": {"@id": [make_embedding_id(1), make_embedding_id(2)]}
+    }
+    assert script_score["script"]["params"]["query_vectors"] == [[0.1, 0.2], [0.3, 0.4]]
+    assert script_score["script"]["source"] == Formula.COSINE.get_aggregated_formula(
+        TargetAggregation.MAX
+    )
+
+
+def test_combine_similarity_models(monkeypatch):
+    configs = [
+        SimilaritySearchQueryConfiguration(make_similarity_query_configuration(i))
+        for i in [1, 2]
+    ]
+    # Model 1 finds entities 1 and 2, model 2 finds entities 2 and 3
+    top_neighbors = {
+        "similarity_view_1": [(0.9, Neighbor(make_entity_id(1))), (0.8, Neighbor(make_entity_id(2)))],
+        "similarity_view_2": [(0.7, Neighbor(make_entity_id(2))), (0.6, Neighbor(make_entity_id(3)))]
+    }
+    restricted = []
+
+    class EmbeddingMock:
+        id = make_embedding_id(0)
+        vector = [0.1, 0.2]
+
+    def query_similar_resources_mock(config, **kwargs):
+        return EmbeddingMock(), list(top_neighbors[config.similarity_view.id])
+
+    def get_neighbors_mock(restricted_ids, view, **kwargs):
+        restricted.append((view, restricted_ids))
+        return [(0.5, Neighbor(i)) for i in restricted_ids]
+
+    monkeypatch.setattr("inference_tools.similarity.main.query_similar_resources",
+                        query_similar_resources_mock)
+    monkeypatch.setattr("inference_tools.similarity.main.get_neighbors", get_neighbors_mock)
+    monkeypatch.setattr("inference_tools.similarity.main.get_score_stats",
+                        lambda **kwargs: Statistic(0, 1, 0, 0, 0))
+
+    interner = IdInterner()
+    results = combine_similarity_models(
+        forge_factory=lambda *args: None, configurations=configs,
+        parameter_values={"TargetResourceParameter": make_entity_id(0)}, k=10,
+        target_parameter="TargetResourceParameter", result_filter=None, debug=False,
+        use_resources=False, interner=interner
+    )
+
+    assert restricted == [
+        ("similarity_view_1", [make_entity_id(3)]), ("similarity_view_2", [make_entity_id(1)])
+    ]
+    assert [r["id"] for r in results] == [make_entity_id(i) for i in [2, 1, 3]]
+    assert results[0]["score"] == pytest.approx((0.8 + 0.7) / 2)
+    assert len(interner) == 3
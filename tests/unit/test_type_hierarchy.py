@@ -0,0 +1,63 @@
+# This file is part of knowledge-graph-inference.
+# Copyright 2024 Blue Brain Project / EPFL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from inference_tools.nexus_utils.forge_utils import ForgeUtils
+from inference_tools.rules import get_resource_type_descendants
+from inference_tools.type_hierarchy import TypeHierarchyIndex
+
+from tests.data.classes.resource_test import ResourceTest
+
+
+def test_type_hierarchy(forge):
+    def iri(symbol):
+        return ForgeUtils.expand_uri(forge, symbol)
+
+    # Neuron -> Cell -> Entity, Neuron -> Excitable (no label), Glia -> Cell
+    edges = [("Neuron", "Cell"), ("Cell", "Entity"), ("Neuron", "Excitable"), ("Glia", "Cell")]
+    labeled = {"Neuron", "Cell", "Entity", "Glia"}
+    queries = []
+
+    def sparql(query, **params):
+        queries.append(query)
+        return [
+            ResourceTest(dict(
+                sub=iri(sub), super=iri(sup),
+                **({"subLabel": sub} if sub in labeled else {}),
+                **({"superLabel": sup} if sup in labeled else {})
+            ))
+            for sub, sup in edges
+        ]
+
+    forge.sparql = sparql
+
+    try:
+        index = TypeHierarchyIndex(forge)
+
+        assert index.ancestors([iri("Neuron")], to_symbol=False) == \
+            [iri("Neuron"), iri("Cell"), iri("Entity")]
+        assert index.descendants([iri("Cell")], to_symbol=False) == \
+            [iri("Neuron"), iri("Cell"), iri("Glia")]
+        assert index.ancestors([iri("Unknown")], to_symbol=False) is None
+
+        assert get_resource_type_descendants(
+            forge, ["Glia"], to_symbol=False, type_hierarchy=index
+        ) == [iri("Cell"), iri("Entity"), iri("Glia")]
+
+        # Loaded once
+        assert len(queries) == 1
+        index.refresh()
+        assert len(queries) == 2
+    finally:
+        del forge.sparql